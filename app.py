@@ -1,11 +1,30 @@
 import streamlit as st
-import tensorflow as tf
-from PIL import Image
+import altair as alt
 import numpy as np
 import pandas as pd
-import joblib
 import time
+import io
 import os
+import shutil
+import tempfile
+import uuid
+
+import artifact_manifest
+import background_jobs
+import image_preprocessing
+import inference
+import metrics
+import model_registry
+import prediction_history
+import worker_pool
+import bulk_yield_scoring
+import yield_fast_path
+import tiled_analysis
+import upload_ingestion
+import yield_sweep
+import gradcam
+from prediction_cache import PredictionCache, image_digest
+from inference import CLASS_NAMES, CLASS_TRANSLATIONS, CONFIDENCE_THRESHOLD
 
 # Set page config
 st.set_page_config(
@@ -49,102 +68,604 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+# Optional Prometheus endpoint for the stage timers (AGRI_SMART_METRICS=1)
+@st.cache_resource
+def start_metrics_server(port):
+    return metrics.start_http_server(port)
+
+if metrics.is_enabled() and os.environ.get('AGRI_SMART_METRICS_PORT'):
+    start_metrics_server(int(os.environ['AGRI_SMART_METRICS_PORT']))
+
+# Optional pool of inference worker processes shared by all sessions (AGRI_SMART_WORKER_POOL=N)
+@st.cache_resource
+def get_worker_pool(n_workers, pin_cpus):
+    return worker_pool.WorkerPool(n_workers, pin_cpus)
+
+pool_size = int(os.environ.get('AGRI_SMART_WORKER_POOL', 0))
+inference_pool = None
+if pool_size > 0:
+    inference_pool = get_worker_pool(pool_size, os.environ.get('AGRI_SMART_WORKER_PIN', '1') == '1')
+
+# Artifact integrity, checked once per process against models/manifest.json
+# (files whose size and date match the manifest are not re-read)
+@st.cache_resource
+def verify_artifacts():
+    return artifact_manifest.verify_manifest()
+
+artifact_check = verify_artifacts()
+if artifact_check is not None and (artifact_check['modified'] or artifact_check['missing']):
+    st.sidebar.warning("⚠️ Artefacts différents du manifeste : "
+                       + ", ".join(artifact_check['modified'] + artifact_check['missing'])
+                       + ". Lancez `python check_compatibility.py`.")
+
+# Predictions run in a shared background executor; the session only keeps job IDs,
+# so a rerun (any widget change) re-attaches to the jobs in flight instead of losing them
+@st.cache_resource
+def get_job_manager():
+    return background_jobs.JobManager()
+
+job_manager = get_job_manager()
+session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+
+def submit_job(slot, kind, key, fn, *args):
+    """Soumet un job (ou se rattache au job identique en cours) et le mémorise dans la session"""
+    job = job_manager.submit(session_id, kind, key, fn, *args)
+    st.session_state[slot] = job.id
+    # Quick jobs are rendered in this run, without a polling round-trip
+    job.wait(background_jobs.INLINE_WAIT_SECONDS)
+    return job
+
+def current_job(slot):
+    job_id = st.session_state.get(slot)
+    return job_manager.get(job_id, session_id) if job_id else None
+
+def follow_job(job, unit, render_partial=None):
+    """Progression d'un job en cours, relue périodiquement ; relance la page quand il se termine"""
+    @st.fragment(run_every=background_jobs.POLL_INTERVAL)
+    def job_progress():
+        if job.finished:
+            st.rerun()
+        done, total, partial = job.snapshot()
+        st.progress(done / total if total else 0.0,
+                    text=f"Analyse en cours : {done}/{total or '?'} {unit} ({job.seconds:.1f} s)")
+        if render_partial is not None and partial:
+            render_partial(partial)
+    job_progress()
+
+def run_disease_job(job, loader, pixels, cache_key, cache, record=None, cam_cache=None):
+    """
+    Job : analyse d'une image (cache, sinon modèle) ; `record` reçoit les probabilités
+
+    Avec `cam_cache`, la carte Grad-CAM est calculée dans la même passe que la prédiction
+    (modèle Keras) et mise en cache sous la même clé.
+    """
+    job.report(0, 1)
+    explain = cam_cache is not None
+    if cache_key is not None:
+        cached = cache.get(cache_key)
+        cam = cam_cache.get(cache_key) if explain else None
+        if cached is not None and (cam is not None or not explain):
+            if record is not None:
+                record(cached)
+            return {'predictions': cached[np.newaxis], 'cached': True, 'cam': cam, 'model_ms': None}
+    model = loader.get()
+    if model is None:
+        raise RuntimeError(f"Modèle non chargé ({loader.error})")
+    # uint8 model input built at upload time (upload_ingestion.ingest)
+    img_array = np.expand_dims(image_preprocessing.normalize(pixels), axis=0)
+    start = time.perf_counter()
+    cam = None
+    if explain and hasattr(model, 'explain'):
+        predictions, cams = model.explain(img_array)
+        cam = cams[0]
+    else:
+        predictions = inference.predict_disease(model, img_array)
+    model_ms = 1000 * (time.perf_counter() - start)
+    if cache_key is not None:
+        cache.put(cache_key, predictions[0])
+        if cam is not None:
+            cam_cache.put(cache_key, cam)
+    if record is not None:
+        record(predictions)
+    job.report(1)
+    return {'predictions': predictions, 'cached': False, 'cam': cam, 'model_ms': model_ms}
+
+def run_disease_batch_job(job, loader, images, model_version, cache, batch_size, record=None, cam_cache=None):
+    """
+    Job : analyse d'un lot d'images ; chaque appel au modèle publie ses lignes
+
+    Args:
+        images: Liste de (nom de fichier, octets)
+        cam_cache: Cache des cartes Grad-CAM (None : pas d'explication)
+    """
+    explain = cam_cache is not None
+    file_names, cache_keys, predictions, cams, slots = [], [], [], [], []
+    missing, skipped, cached_rows = [], [], []
+    # Images are decoded straight into one preallocated uint8 buffer: the cache misses,
+    # and with Grad-CAM every image (the overlays are drawn on the model input)
+    buffer = image_preprocessing.ImageBatchBuffer(len(images))
+    for name, data in images:
+        key = PredictionCache.make_key(data, model_version) if model_version is not None else None
+        probs = cache.get(key) if key is not None else None
+        cam = cam_cache.get(key) if explain and key is not None else None
+        needs_model = probs is None or (explain and cam is None)
+        slot = None
+        if needs_model or explain:
+            try:
+                # Pixel count checked from the header, before decoding (decompression bombs)
+                upload_ingestion.open_checked(data)
+                slot = buffer.add(io.BytesIO(data))
+            except Exception as e:
+                skipped.append(f"{name} : {e}")
+                continue
+        if needs_model:
+            missing.append(len(file_names))
+        else:
+            cached_rows.append((name, probs))
+        file_names.append(name)
+        cache_keys.append(key)
+        predictions.append(probs)
+        cams.append(cam)
+        slots.append(slot)
+    job.report(len(cached_rows), len(file_names), cached_rows)
+
+    if missing:
+        model = loader.get()
+        if model is None:
+            raise RuntimeError(f"Modèle non chargé ({loader.error})")
+
+        def publish(start, chunk, chunk_cams=None):
+            rows = []
+            for offset, (i, probs) in enumerate(zip(missing[start:start + len(chunk)], chunk)):
+                predictions[i] = probs
+                if cache_keys[i] is not None:
+                    cache.put(cache_keys[i], probs)
+                if chunk_cams is not None:
+                    cams[i] = chunk_cams[offset]
+                    if cache_keys[i] is not None:
+                        cam_cache.put(cache_keys[i], cams[i])
+                rows.append((file_names[i], probs))
+            job.report(len(cached_rows) + start + len(chunk), partial=rows)
+
+        # One float32 tensor for the images that need the model, scored in a few batched calls
+        model_input = buffer.as_model_input()
+        if len(missing) < buffer.count:
+            model_input = model_input[[slots[i] for i in missing]]
+        if explain and hasattr(model, 'explain'):
+            gradcam.explain_batches(model, model_input, batch_size=batch_size, chunk_callback=publish)
+        else:
+            inference.predict_disease(model, model_input, batch_size=batch_size, chunk_callback=publish)
+    predictions = np.stack(predictions) if predictions else np.empty((0, len(CLASS_NAMES)))
+    if record is not None and len(predictions):
+        record(predictions)
+    return {
+        'file_names': file_names,
+        'predictions': predictions,
+        'cached': len(cached_rows),
+        'skipped': skipped,
+        'cams': cams if explain else None,
+        'pixels': buffer.pixels[slots] if explain and slots else None,
+    }
+
+def batch_results_frame(file_names, predictions):
+    class_indices = np.argmax(predictions, axis=1)
+    confidences = 100 * np.max(predictions, axis=1)
+    return pd.DataFrame({
+        'Fichier': file_names,
+        'Maladie': [CLASS_TRANSLATIONS.get(CLASS_NAMES[i], CLASS_NAMES[i]) for i in class_indices],
+        'Confiance (%)': np.round(confidences, 2),
+        'Statut': np.where(confidences < CONFIDENCE_THRESHOLD, 'Non reconnue', 'Reconnue'),
+    })
+
+def run_yield_job(job, fast_model, model, cols, form_values, record=None):
+    """
+    Job : prédiction de rendement d'un formulaire ; `record` reçoit le rendement prédit
+
+    Avec la forêt compilée, la prédiction et ses contributions par variable sortent du même
+    parcours des arbres.
+    """
+    result = {'prediction': None, 'bias': None, 'contributions': None}
+    if fast_model is not None:
+        with metrics.timer('yield_predict'):
+            predictions, bias, contributions = fast_model.contributions([form_values])
+        result['prediction'] = float(predictions[0])
+        if contributions is not None:
+            result['bias'] = bias
+            result['contributions'] = dict(zip(cols, contributions[0]))
+    else:
+        result['prediction'] = inference.predict_yield(model, cols, form_values)[0]
+    if record is not None:
+        record(result['prediction'])
+    return result
+
+def run_field_job(job, loader, path, overlap, batch_size):
+    """
+    Job : analyse par tuiles d'une image de parcelle déposée dans un fichier temporaire
+
+    Le fichier appartient au job : il est supprimé à la fin, même en cas d'erreur.
+    """
+    try:
+        # Dimensions are checked from the header before anything is decoded
+        with tiled_analysis.open_raster(path, max_megapixels=tiled_analysis.MAX_FIELD_MEGAPIXELS) as raster:
+            model = loader.get()
+            if model is None:
+                raise RuntimeError(f"Modèle non chargé ({loader.error})")
+            result = tiled_analysis.analyze_field_image(
+                raster, model, overlap=overlap, batch_size=batch_size,
+                progress_callback=lambda done, total: job.report(done, total)
+            )
+            result['preview'], result['preview_step'] = raster.preview()
+        return result
+    finally:
+        os.remove(path)
+
+def yield_waterfall(bias, contributions, prediction, max_bars=8):
+    """
+    Graphique en cascade : moyenne des arbres, contribution de chaque variable, rendement prédit
+
+    Les contributions les plus faibles au-delà de `max_bars` sont regroupées.
+    """
+    ranked = sorted(contributions.items(), key=lambda item: -abs(item[1]))
+    if len(ranked) > max_bars:
+        ranked = ranked[:max_bars - 1] + [("Autres", sum(value for _, value in ranked[max_bars - 1:]))]
+    rows = [{'Étape': "Moyenne des arbres", 'Début': 0.0, 'Fin': bias, 'Effet': bias, 'Type': 'Total'}]
+    level = bias
+    for col, value in ranked:
+        rows.append({'Étape': col, 'Début': level, 'Fin': level + value, 'Effet': value,
+                     'Type': 'Hausse' if value >= 0 else 'Baisse'})
+        level += value
+    rows.append({'Étape': "Rendement prédit", 'Début': 0.0, 'Fin': prediction, 'Effet': prediction, 'Type': 'Total'})
+    data = pd.DataFrame(rows)
+    return alt.Chart(data).mark_bar().encode(
+        x=alt.X('Étape:N', sort=list(data['Étape']), title=None, axis=alt.Axis(labelAngle=0)),
+        y=alt.Y('Début:Q', title='kg/ha'),
+        y2='Fin:Q',
+        color=alt.Color('Type:N', scale=alt.Scale(domain=['Hausse', 'Baisse', 'Total'],
+                                                  range=['#2E7D32', '#C62828', '#9E9E9E']), title=None),
+        tooltip=['Étape', alt.Tooltip('Effet:Q', format='+,.0f', title='kg/ha')]
+    )
+
+# Prediction history (SQLite, WAL): rows are queued here and written in batches by a
+# background thread. AGRI_SMART_HISTORY_DB='' disables it.
+@st.cache_resource
+def get_history_writer():
+    if not prediction_history.HISTORY_DB_PATH:
+        return None
+    try:
+        return prediction_history.HistoryWriter()
+    except Exception:
+        return None
+
+history_writer = get_history_writer()
+
 # Title and Header
 st.title("🌽 Assistant Intelligent Maïs")
 
 # Tabs
-tab1, tab2 = st.tabs(["🦠 Détection de Maladies", "📈 Prédiction de Rendement"])
+tab1, tab2, tab3 = st.tabs(["🦠 Détection de Maladies", "📈 Prédiction de Rendement", "📜 Historique"])
 
 # --- TAB 1: DISEASE DETECTION ---
 with tab1:
     st.markdown("### Analyse de Santé des Plantes par IA")
     st.markdown("Téléchargez une photo de feuille de maïs pour détecter des maladies comme la Rouille, l'Helminthosporiose ou la Tache Grise.")
 
-    # Load Model
+    # Inference backend (Keras, or TFLite for small CPU-only boxes)
+    default_backend = os.environ.get('AGRI_SMART_DISEASE_BACKEND', 'keras')
+    disease_backend = st.selectbox(
+        "Moteur d'inférence",
+        inference.DISEASE_BACKENDS,
+        index=inference.DISEASE_BACKENDS.index(default_backend) if default_backend in inference.DISEASE_BACKENDS else 0,
+        help="Les modèles TFLite sont générés par `python convert_to_tflite.py convert`."
+    )
+
+    # Deferred model loading: TensorFlow is only imported when the model is first needed
+    # (AGRI_SMART_DISEASE_PRELOAD: 'lazy' by default, 'background' after first render, 'eager')
+    # With a versioned registry (models/registry), the model is hot-swapped on activation
     @st.cache_resource
-    def load_disease_model():
-        try:
-            model = tf.keras.models.load_model('models/maize_mobilenetv2_model.keras')
-            return model
-        except Exception as e:
-            return None
+    def get_disease_model_loader(backend='keras', _pool=None):
+        if _pool is not None:
+            return inference.LazyModelLoader(lambda: _pool.disease_model(backend))
+        if model_registry.has_active('disease'):
+            return inference.LazyModelLoader(lambda: model_registry.HotSwapModel('disease', backend))
+        return inference.LazyModelLoader(lambda: inference.load_disease_model(backend=backend))
 
-    disease_model = load_disease_model()
+    disease_loader = get_disease_model_loader(disease_backend, inference_pool)
+    disease_preload = os.environ.get('AGRI_SMART_DISEASE_PRELOAD', 'lazy')
+    if disease_preload == 'eager':
+        disease_loader.get()
 
-    if disease_model is None:
+    def load_disease_model():
+        """Charge le modèle à la demande et affiche une erreur s'il est indisponible"""
+        if not disease_loader.is_loaded:
+            with st.spinner('Chargement du modèle de maladie...'):
+                model = disease_loader.get()
+        else:
+            model = disease_loader.get()
+        if model is None:
+            st.error(f"Impossible d'analyser sans modèle chargé. ({disease_loader.error})")
+        return model
+
+    if disease_loader.error is not None or not os.path.exists(inference.disease_model_path(disease_backend)):
         st.error("⚠️ Modèle de maladie non trouvé ! Veuillez entraîner le modèle (`maize_disease_training_efficientnet.ipynb`) et placer 'maize_disease_model.keras' dans ce répertoire.")
-    else:
+    elif disease_loader.is_loaded:
         st.success("✅ Modèle de maladie chargé !")
+        if disease_backend == 'cascade' and hasattr(disease_loader.get(), 'stats'):
+            cascade_stats = disease_loader.get().stats()
+            st.caption(f"Cascade (seuil {cascade_stats['threshold']:g}%) : {cascade_stats['escalated']}/"
+                       f"{cascade_stats['images']} image(s) transmise(s) au modèle complet "
+                       f"({100 * cascade_stats['escalation_rate']:.0f}%)")
+    else:
+        st.info("ℹ️ Le modèle de maladie sera chargé à la première analyse.")
 
-    # Class Names (Must match training order)
-    CLASS_NAMES = ['Blight', 'Common_Rust', 'Gray_Leaf_Spot', 'Healthy']
-    CLASS_TRANSLATIONS = {
-        'Blight': 'Helminthosporiose (Blight)',
-        'Common_Rust': 'Rouille Commune',
-        'Gray_Leaf_Spot': 'Tache Grise (Gray Leaf Spot)',
-        'Healthy': 'Saine'
-    }
+    # Prediction cache shared by all sessions, keyed on image bytes + model artifact version
+    @st.cache_resource
+    def get_prediction_cache():
+        return PredictionCache(
+            max_entries=int(os.environ.get('AGRI_SMART_PREDICTION_CACHE_SIZE', 512)),
+            disk_dir=os.environ.get('AGRI_SMART_PREDICTION_CACHE_DIR') or None
+        )
 
-    # File Uploader
-    uploaded_file = st.file_uploader("Choisissez une image de feuille...", type=["jpg", "jpeg", "png"])
+    prediction_cache = get_prediction_cache()
 
-    if uploaded_file is not None:
-        # Display Image
-        image = Image.open(uploaded_file)
-        st.image(image, caption='Image de feuille téléchargée', use_container_width=True)
-        
+    # Grad-CAM maps (7×7 float32), same keys as the probabilities
+    @st.cache_resource
+    def get_gradcam_cache():
+        disk_dir = os.environ.get('AGRI_SMART_PREDICTION_CACHE_DIR') or None
+        return PredictionCache(
+            max_entries=int(os.environ.get('AGRI_SMART_PREDICTION_CACHE_SIZE', 512)),
+            disk_dir=os.path.join(disk_dir, 'gradcam') if disk_dir else None
+        )
+
+    # Grad-CAM reuses the prediction's forward pass: Keras backend only (gradients)
+    explain_disease = st.checkbox(
+        "🔍 Carte Grad-CAM (zones de la feuille qui ont guidé la décision)",
+        value=disease_backend == 'keras', disabled=disease_backend != 'keras',
+        help="Disponible avec le moteur Keras uniquement."
+    ) and disease_backend == 'keras'
+    gradcam_cache = get_gradcam_cache() if explain_disease else None
+    disease_model_version = None
+    if os.path.exists(inference.disease_model_path(disease_backend)):
+        if disease_loader.is_loaded and isinstance(disease_loader.get(), model_registry.HotSwapModel):
+            # Swap now rather than on the next poll: the cache key must name the model that answers
+            disease_loader.get().check()
+        disease_model_version = inference.model_artifact_version(disease_backend)
+
+    # Plot zone, stored with the predictions for prevalence by zone in the history tab
+    disease_zone = st.selectbox("Zone Agro-écologique de la parcelle (historique)",
+                                ["Non renseignée", "Forest/Transitional", "Moist Savanna"])
+    disease_zone = prediction_history.UNKNOWN_ZONE if disease_zone == "Non renseignée" else disease_zone
+    record_disease = {}
+    if history_writer is not None:
+        record_disease = {
+            source: (lambda probs, source=source: history_writer.record_disease(
+                probs, disease_zone, source, disease_model_version))
+            for source in ('image', 'batch')
+        }
+
+    # Analysis mode
+    analysis_mode = st.radio("Mode d'analyse", ["Image unique", "Lot d'images", "Image de parcelle (tuiles)"], horizontal=True)
+
+    if analysis_mode == "Lot d'images":
+        uploaded_files = st.file_uploader(
+            "Choisissez les images de feuilles...",
+            type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True,
+            key=f"batch_upload_{st.session_state.get('batch_upload_nonce', 0)}",
+            help=f"{upload_ingestion.MAX_UPLOAD_MB:g} Mo et {upload_ingestion.MAX_MEGAPIXELS:g} Mpx au plus par image"
+        )
+        batch_size = st.select_slider("Taille de lot (images par appel au modèle)", options=[8, 16, 32, 64, 128], value=32)
+
+        if uploaded_files and st.button("Analyser le lot"):
+            batch_images = []
+            for f in uploaded_files:
+                try:
+                    batch_images.append((f.name, upload_ingestion.read_upload(f)))
+                except upload_ingestion.UploadRejected as e:
+                    st.warning(f"Image ignorée ({f.name}) : {e}")
+            batch_key = (disease_model_version or disease_backend, batch_size, disease_zone, explain_disease,
+                         tuple(image_digest(data) for _, data in batch_images))
+            submit_job('batch_job', 'disease_batch', batch_key, run_disease_batch_job,
+                       disease_loader, batch_images, disease_model_version, prediction_cache, batch_size,
+                       record_disease.get('batch'), gradcam_cache)
+            # A new uploader key drops the session's uploads: the bytes now live only in the job
+            st.session_state['batch_upload_nonce'] = st.session_state.get('batch_upload_nonce', 0) + 1
+
+        batch_job = current_job('batch_job')
+        if batch_job is not None and not batch_job.finished:
+            # Rows appear as each model call completes
+            follow_job(batch_job, "images", lambda rows: st.dataframe(
+                batch_results_frame([name for name, _ in rows], np.stack([probs for _, probs in rows])),
+                use_container_width=True, hide_index=True))
+        elif batch_job is not None and batch_job.status == background_jobs.FAILED:
+            st.error(f"Impossible d'analyser le lot : {batch_job.error}")
+        elif batch_job is not None:
+            batch_result = batch_job.result
+            for message in batch_result['skipped']:
+                st.warning(f"Image ignorée ({message})")
+            if batch_result['file_names']:
+                elapsed = batch_job.seconds
+                df_results = batch_results_frame(batch_result['file_names'], batch_result['predictions'])
+
+                st.success(f"✅ {len(df_results)} images analysées en {elapsed:.2f} s ({len(df_results) / elapsed:.1f} images/s)")
+                if batch_result['cached']:
+                    st.caption(f"{batch_result['cached']} résultat(s) servi(s) depuis le cache")
+                st.dataframe(df_results, use_container_width=True, hide_index=True)
+
+                recognized = df_results[df_results['Statut'] == 'Reconnue']
+                if len(recognized) < len(df_results):
+                    st.warning(f"⚠️ {len(df_results) - len(recognized)} image(s) non reconnue(s) (confiance < {CONFIDENCE_THRESHOLD}%)")
+                if not recognized.empty:
+                    st.bar_chart(recognized['Maladie'].value_counts())
+
+                st.download_button(
+                    "Télécharger les résultats (CSV)",
+                    df_results.to_csv(index=False).encode('utf-8'),
+                    file_name="analyse_lot_feuilles.csv",
+                    mime="text/csv"
+                )
+
+                if batch_result['cams'] is not None:
+                    shown = st.selectbox("🔍 Carte Grad-CAM de l'image", range(len(batch_result['file_names'])),
+                                         format_func=lambda i: batch_result['file_names'][i])
+                    shown_class = inference.interpret_disease_prediction(batch_result['predictions'][shown])['class_en']
+                    st.image(gradcam.overlay(batch_result['pixels'][shown], batch_result['cams'][shown], shown_class),
+                             caption=f"{batch_result['file_names'][shown]} : {CLASS_TRANSLATIONS.get(shown_class, shown_class)}")
+
+    if analysis_mode == "Image de parcelle (tuiles)":
+        st.markdown("Analysez une image de parcelle entière (drone, mosaïque) par tuiles de "
+                    f"{tiled_analysis.TILE_SIZE}×{tiled_analysis.TILE_SIZE} qui se chevauchent, sans la redimensionner.")
+        field_file = st.file_uploader(
+            "Choisissez une image de parcelle...",
+            type=["npy", "tif", "tiff", "bmp", "ppm", "png", "jpg", "jpeg"],
+            help=f"{tiled_analysis.MAX_FIELD_UPLOAD_MB:g} Mo et {tiled_analysis.MAX_FIELD_MEGAPIXELS:g} Mpx au plus"
+        )
+        st.caption("Les fichiers `.npy` et les images non compressées (TIFF brut, BMP) sont lus par mappage mémoire. "
+                   "Pour les très grandes mosaïques, utilisez `python tiled_analysis.py`.")
+        col1, col2 = st.columns(2)
+        tile_overlap = col1.slider("Chevauchement des tuiles (pixels)", 0, tiled_analysis.TILE_SIZE // 2,
+                                   tiled_analysis.TILE_OVERLAP, step=16)
+        tile_batch_size = col2.select_slider("Tuiles par appel au modèle", options=[8, 16, 32, 64], value=32)
+
+        if field_file is not None and st.button("Analyser la parcelle"):
+            if field_file.size > tiled_analysis.MAX_FIELD_UPLOAD_MB * 1e6:
+                st.error(f"⚠️ Image refusée : {field_file.size / 1e6:.0f} Mo > {tiled_analysis.MAX_FIELD_UPLOAD_MB:g} Mo")
+            else:
+                # The raster reader maps files from disk: stream the upload to a temporary
+                # file (no second in-memory copy), deleted by the job
+                suffix = os.path.splitext(field_file.name)[1].lower()
+                with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                    field_file.seek(0)
+                    shutil.copyfileobj(field_file, tmp)
+                submit_job('field_job', 'field', None, run_field_job, disease_loader, tmp.name,
+                           tile_overlap, tile_batch_size)
+
+        field_result = None
+        field_job = current_job('field_job')
+        if field_job is not None and not field_job.finished:
+            follow_job(field_job, "tuiles")
+        elif field_job is not None and field_job.status == background_jobs.FAILED:
+            st.error(f"Erreur lors de l'analyse de la parcelle : {field_job.error}")
+        elif field_job is not None:
+            field_result = field_job.result
+        if field_result is not None:
+            summary = field_result['summary']
+            width, height = field_result['image_size']
+            st.success(f"✅ {summary['tiles']} tuiles analysées ({width}×{height} px) en {field_result['seconds']:.1f} s "
+                       f"({field_result['tiles_per_second']:.1f} tuiles/s)")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Part malade", f"{100 * summary['affected_fraction']:.1f}%",
+                        help="Part des tuiles reconnues classées malades")
+            dominant = summary['dominant_disease']
+            col2.metric("Maladie dominante", CLASS_TRANSLATIONS.get(dominant, dominant) if dominant else "Aucune")
+            col3.metric("Tuiles non reconnues", f"{100 * summary['unrecognized_fraction']:.1f}%")
+
+            heatmap_class = st.selectbox("Carte de chaleur", CLASS_NAMES,
+                                         format_func=lambda c: CLASS_TRANSLATIONS.get(c, c))
+            st.image(
+                tiled_analysis.heatmap_overlay(field_result['preview'], field_result['preview_step'],
+                                               field_result, heatmap_class),
+                caption=f"Probabilité « {CLASS_TRANSLATIONS.get(heatmap_class, heatmap_class)} » par tuile",
+                use_container_width=True
+            )
+            df_fractions = pd.DataFrame({
+                'Maladie': [CLASS_TRANSLATIONS.get(c, c) for c in CLASS_NAMES] + ['Non reconnue'],
+                'Part des tuiles (%)': [100 * summary['class_fractions'][c] for c in CLASS_NAMES]
+                                       + [100 * summary['unrecognized_fraction']],
+            })
+            st.bar_chart(df_fractions.set_index('Maladie'))
+
+    # File Uploader: the photo is checked, decoded once into the model input and a
+    # thumbnail, then the upload is dropped (new uploader key) so its bytes are not kept
+    leaf_image = None
+    if analysis_mode == "Image unique":
+        uploaded_file = st.file_uploader(
+            "Choisissez une image de feuille...", type=["jpg", "jpeg", "png"],
+            key=f"leaf_upload_{st.session_state.get('leaf_upload_nonce', 0)}",
+            help=f"{upload_ingestion.MAX_UPLOAD_MB:g} Mo et {upload_ingestion.MAX_MEGAPIXELS:g} Mpx au plus"
+        )
+        if uploaded_file is not None:
+            try:
+                st.session_state['leaf_image'] = upload_ingestion.ingest(uploaded_file)
+                st.session_state.pop('leaf_upload_error', None)
+            except upload_ingestion.UploadRejected as e:
+                st.session_state['leaf_upload_error'] = f"{uploaded_file.name} : {e}"
+            st.session_state['leaf_upload_nonce'] = st.session_state.get('leaf_upload_nonce', 0) + 1
+            st.rerun()
+        if 'leaf_upload_error' in st.session_state:
+            st.error(f"⚠️ Image refusée ({st.session_state['leaf_upload_error']})")
+        leaf_image = st.session_state.get('leaf_image')
+
+    if leaf_image is not None:
+        # Display Image (thumbnail: the full-resolution photo is never sent to the browser)
+        width, height = leaf_image.original_size
+        st.image(leaf_image.thumbnail, use_container_width=True,
+                 caption=f"{leaf_image.name} ({width}×{height}, {leaf_image.n_bytes / 1e6:.1f} Mo)")
+
+        image_key = PredictionCache.digest_key(leaf_image.digest, disease_model_version or disease_backend)
+        job_key = (image_key, disease_zone, explain_disease)
         if st.button("Analyser la feuille"):
-            if disease_model is None:
-                st.error("Impossible d'analyser sans modèle chargé.")
+            submit_job('disease_job', 'disease', job_key, run_disease_job, disease_loader,
+                       leaf_image.pixels,
+                       image_key if disease_model_version is not None else None, prediction_cache,
+                       record_disease.get('image'), gradcam_cache)
+
+        # Result of the last analysis of this image, kept across reruns
+        predictions = None
+        disease_job = current_job('disease_job')
+        if disease_job is not None and disease_job.key == job_key:
+            if not disease_job.finished:
+                follow_job(disease_job, "image")
+            elif disease_job.status == background_jobs.FAILED:
+                st.error(f"Impossible d'analyser l'image : {disease_job.error}")
+            else:
+                predictions = disease_job.result['predictions']
+                if disease_job.result['cached']:
+                    st.caption("⚡ Résultat servi depuis le cache")
+
+        if predictions is not None:
+            result = inference.interpret_disease_prediction(predictions[0])
+            predicted_class_en = result['class_en']
+            predicted_class_fr = result['class_fr']
+            confidence = result['confidence']
+
+            # Threshold check
+            if not result['recognized']:
+                st.warning(f"⚠️ **Image non reconnue** (Confiance : {confidence:.2f}%)")
+                st.markdown("Le modèle n'est pas assez sûr. Assurez-vous qu'il s'agit bien d'une feuille de maïs.")
             else:
-                with st.spinner('Analyse de l\'image en cours...'):
-                    # Preprocess
-                    if image.mode != "RGB":
-                        image = image.convert("RGB")
-                    img = image.resize((224, 224))
-                    img_array = np.array(img)
-                    img_array = img_array / 255.0  # Normalize
-                    img_array = np.expand_dims(img_array, axis=0) # Add batch dimension
-
-                    # Predict
-                    predictions = disease_model.predict(img_array)
-                    predicted_class_en = CLASS_NAMES[np.argmax(predictions[0])]
-                    predicted_class_fr = CLASS_TRANSLATIONS.get(predicted_class_en, predicted_class_en)
-                    confidence = 100 * np.max(predictions[0])
-                    
-                    time.sleep(1) # UX delay
-
-                    # Threshold check
-                    if confidence < 60:
-                        st.warning(f"⚠️ **Image non reconnue** (Confiance : {confidence:.2f}%)")
-                        st.markdown("Le modèle n'est pas assez sûr. Assurez-vous qu'il s'agit bien d'une feuille de maïs.")
-                    else:
-                        # Display Result
-                        st.markdown(f"""
-                        <div class="prediction-box">
-                            <h2 style="color: #1B5E20; font-weight: bold;">Résultat : <span style="color: #2E7D32;">{predicted_class_fr}</span></h2>
-                            <p style="color: #333;">Confiance : <strong>{confidence:.2f}%</strong></p>
-                        </div>
-                        """, unsafe_allow_html=True)
-
-                        # Additional Info based on class
-                        if predicted_class_en == 'Healthy':
-                            st.info(f"La plante semble saine ! (Confiance: {confidence:.2f}%)")
-                        elif predicted_class_en == 'Blight':
-                            st.warning(f"⚠️ Helminthosporiose détectée ({confidence:.2f}%). Envisagez d'utiliser des fongicides et des hybrides résistants.")
-                        elif predicted_class_en == 'Common_Rust':
-                            st.warning(f"⚠️ Rouille commune détectée ({confidence:.2f}%). Cherchez des pustules sur les feuilles.")
-                        elif predicted_class_en == 'Gray_Leaf_Spot':
-                            st.warning(f"⚠️ Tache grise détectée ({confidence:.2f}%). Cela peut réduire considérablement le rendement.")
-                        
-                        # Probability breakdown
-                        with st.expander("Voir les détails de la détection"):
-                            probs = predictions[0]
-                            df_probs = pd.DataFrame({
-                                'Maladie': [CLASS_TRANSLATIONS.get(c, c) for c in CLASS_NAMES],
-                                'Confiance (%)': probs * 100
-                            })
-                            st.bar_chart(df_probs.set_index('Maladie'))
+                # Display Result
+                st.markdown(f"""
+                <div class="prediction-box">
+                    <h2 style="color: #1B5E20; font-weight: bold;">Résultat : <span style="color: #2E7D32;">{predicted_class_fr}</span></h2>
+                    <p style="color: #333;">Confiance : <strong>{confidence:.2f}%</strong></p>
+                </div>
+                """, unsafe_allow_html=True)
+
+                # Additional Info based on class
+                if predicted_class_en == 'Healthy':
+                    st.info(f"La plante semble saine ! (Confiance: {confidence:.2f}%)")
+                elif predicted_class_en == 'Blight':
+                    st.warning(f"⚠️ Helminthosporiose détectée ({confidence:.2f}%). Envisagez d'utiliser des fongicides et des hybrides résistants.")
+                elif predicted_class_en == 'Common_Rust':
+                    st.warning(f"⚠️ Rouille commune détectée ({confidence:.2f}%). Cherchez des pustules sur les feuilles.")
+                elif predicted_class_en == 'Gray_Leaf_Spot':
+                    st.warning(f"⚠️ Tache grise détectée ({confidence:.2f}%). Cela peut réduire considérablement le rendement.")
+                
+                # Probability breakdown
+                with st.expander("Voir les détails de la détection"):
+                    probs = predictions[0]
+                    df_probs = pd.DataFrame({
+                        'Maladie': [CLASS_TRANSLATIONS.get(c, c) for c in CLASS_NAMES],
+                        'Confiance (%)': probs * 100
+                    })
+                    st.bar_chart(df_probs.set_index('Maladie'))
+                    cam = disease_job.result['cam']
+                    if cam is not None:
+                        model_ms = disease_job.result['model_ms']
+                        timing = f", prédiction + carte en {model_ms:.0f} ms" if model_ms is not None else " (cache)"
+                        st.image(gradcam.overlay(leaf_image.thumbnail, cam, predicted_class_en),
+                                 use_container_width=True,
+                                 caption=f"🔍 Grad-CAM : zones qui ont guidé la décision « {predicted_class_fr} »{timing}")
 
 # --- TAB 2: YIELD PREDICTION ---
 with tab2:
@@ -153,15 +674,33 @@ with tab2:
 
     # Load Yield Model
     @st.cache_resource
-    def load_yield_model():
+    def load_yield_model(_pool=None):
         try:
-            model = joblib.load('models/yield_prediction_model.pkl')
-            cols = joblib.load('models/model_input_columns.pkl')
+            if _pool is None and model_registry.has_active('yield'):
+                model = model_registry.HotSwapModel('yield')
+                return model, model.input_cols, None
+            model, cols = _pool.yield_model() if _pool is not None else inference.load_yield_model()
             return model, cols, None
         except Exception as e:
             return None, None, str(e)
 
-    yield_model, input_cols, error = load_yield_model()
+    yield_model, input_cols, error = load_yield_model(inference_pool)
+    if isinstance(yield_model, model_registry.HotSwapModel):
+        # Columns of the version being served right now (may have been swapped since the last run)
+        input_cols = yield_model.input_cols
+
+    # Compiled NumPy fast path for single-row predictions (None if the pipeline is not supported)
+    @st.cache_resource
+    def compile_yield_model(_model, cols):
+        try:
+            return yield_fast_path.compile_yield_pipeline(_model, cols)
+        except Exception:
+            return None
+
+    if isinstance(yield_model, model_registry.HotSwapModel):
+        yield_fast_model = yield_model
+    else:
+        yield_fast_model = compile_yield_model(yield_model, input_cols) if yield_model is not None else None
 
     if yield_model is None:
         st.warning("⚠️ Modèle de rendement non trouvé. Veuillez exécuter `maize_yield_prediction.ipynb` pour générer 'yield_prediction_model.pkl'.")
@@ -172,58 +711,339 @@ with tab2:
     else:
         st.success("✅ Modèle de rendement chargé !")
     
-    with st.form("yield_form"):
-        col1, col2 = st.columns(2)
+    yield_mode = st.radio("Mode", ["Prédiction unique", "Balayage de scénarios", "Fichier (CSV/Parquet)"], horizontal=True)
+
+    if yield_mode == "Prédiction unique":
+        with st.form("yield_form"):
+            col1, col2 = st.columns(2)
         
-        with col1:
-            pl_ht = st.number_input("Hauteur de la plante (cm)", min_value=50, max_value=300, value=180)
-            e_ht = st.number_input("Hauteur de l'épi (cm)", min_value=20, max_value=200, value=90)
-            dy_sk = st.number_input("Jours jusqu'à l'apparition des soies (jours)", min_value=40, max_value=100, value=60)
+            with col1:
+                pl_ht = st.number_input("Hauteur de la plante (cm)", min_value=50, max_value=300, value=180)
+                e_ht = st.number_input("Hauteur de l'épi (cm)", min_value=20, max_value=200, value=90)
+                dy_sk = st.number_input("Jours jusqu'à l'apparition des soies (jours)", min_value=40, max_value=100, value=60)
         
-        with col2:
-            aezone = st.selectbox("Zone Agro-écologique", ["Forest/Transitional", "Moist Savanna"])
-            rust_score = st.slider("Score de Rouille (1-5)", 1, 5, 2)
-            blight_score = st.slider("Score d'Helminthosporiose (1-5)", 1, 5, 2)
+            with col2:
+                aezone = st.selectbox("Zone Agro-écologique", ["Forest/Transitional", "Moist Savanna"])
+                rust_score = st.slider("Score de Rouille (1-5)", 1, 5, 2)
+                blight_score = st.slider("Score d'Helminthosporiose (1-5)", 1, 5, 2)
 
-        # Advanced/Hidden inputs (using defaults if model exists)
-        # We create a DataFrame with all required columns
+            # Advanced/Hidden inputs (using defaults if model exists)
+            # We create a DataFrame with all required columns
         
-        submit_yield = st.form_submit_button("Prédire le Rendement")
-
-    if submit_yield:
-        if yield_model is not None and input_cols is not None:
-            # Create input dataframe with 0s
-            input_data = pd.DataFrame(0, index=[0], columns=input_cols)
-            
-            # Fill known values
-            if 'PL_HT' in input_cols: input_data['PL_HT'] = pl_ht
-            if 'E_HT' in input_cols: input_data['E_HT'] = e_ht
-            if 'DY_SK' in input_cols: input_data['DY_SK'] = dy_sk
-            if 'AEZONE' in input_cols: input_data['AEZONE'] = aezone # Pipeline handles encoding
-            if 'RUST' in input_cols: input_data['RUST'] = rust_score
-            if 'BLIGHT' in input_cols: input_data['BLIGHT'] = blight_score
-            
-            # Predict
-            try:
-                prediction = yield_model.predict(input_data)[0]
+            submit_yield = st.form_submit_button("Prédire le Rendement")
+
+        if submit_yield:
+            if yield_model is not None and input_cols is not None:
+                # Known values; missing model columns are filled with 0
+                form_values = {
+                    'PL_HT': pl_ht,
+                    'E_HT': e_ht,
+                    'DY_SK': dy_sk,
+                    'AEZONE': aezone, # Pipeline handles encoding
+                    'RUST': rust_score,
+                    'BLIGHT': blight_score,
+                }
+
+                # Predict (the same inputs on the same model version re-attach to the previous job)
+                yield_key = (getattr(yield_model, 'version', None), tuple(sorted(form_values.items())))
+                record_yield = None
+                if history_writer is not None:
+                    yield_version = getattr(yield_model, 'version', None)
+                    record_yield = lambda prediction: history_writer.record_yield(prediction, form_values, yield_version)
+                submit_job('yield_job', 'yield', yield_key, run_yield_job,
+                           yield_fast_model, yield_model, input_cols, form_values, record_yield)
+            else:
+                # Simulation for demo
+                simulated_yield = (pl_ht * 10) + (e_ht * 5) - (dy_sk * 2) + 3000
+                st.markdown(f"""
+                <div class="prediction-box">
+                    <h2 style="color: #1B5E20; font-weight: bold;">Rendement Prédit (Démo)</h2>
+                    <h1 style="color: #2E7D32;">{simulated_yield:,.2f} kg/ha</h1>
+                    <p style="color: gray; font-size: 0.8em;">*Modèle non chargé, utilisation d'une formule heuristique</p>
+                </div>
+                """, unsafe_allow_html=True)
+
+        yield_job = current_job('yield_job')
+        if yield_model is not None and yield_job is not None:
+            if not yield_job.finished:
+                follow_job(yield_job, "prédiction")
+            elif yield_job.status == background_jobs.FAILED:
+                st.error(f"Erreur lors de la prédiction : {yield_job.error}")
+            else:
+                yield_result = yield_job.result
                 st.markdown(f"""
                 <div class="prediction-box">
                     <h2 style="color: #1B5E20; font-weight: bold;">Rendement Prédit</h2>
-                    <h1 style="color: #2E7D32;">{prediction:,.2f} kg/ha</h1>
+                    <h1 style="color: #2E7D32;">{yield_result['prediction']:,.2f} kg/ha</h1>
                 </div>
                 """, unsafe_allow_html=True)
+
+                # Exact path contributions of the forest (bias + one delta per input column)
+                if yield_result['contributions'] is not None:
+                    st.markdown("#### Pourquoi ce rendement ?")
+                    st.altair_chart(yield_waterfall(yield_result['bias'], yield_result['contributions'],
+                                                    yield_result['prediction']), use_container_width=True)
+                    st.caption("Part de chaque variable dans l'écart à la moyenne des arbres, calculée exactement "
+                               "le long des chemins suivis dans la forêt.")
+
+    elif yield_model is None:
+        st.info("Ce mode nécessite le modèle de rendement.")
+    elif yield_mode == "Balayage de scénarios":
+        st.markdown("Explorez le rendement prédit sur une grille de scénarios, évaluée en un seul passage vectorisé.")
+        with st.form("sweep_form"):
+            col1, col2 = st.columns(2)
+            with col1:
+                pl_ht_range = st.slider("Plage de hauteur de la plante (cm)", 50, 300, (120, 250))
+                pl_ht_step = st.number_input("Pas de hauteur (cm)", min_value=1, max_value=50, value=10)
+                dy_sk_range = st.slider("Plage de jours jusqu'aux soies", 40, 100, (45, 85))
+                dy_sk_step = st.number_input("Pas de jours", min_value=1, max_value=20, value=2)
+            with col2:
+                sweep_zones = st.multiselect("Zones Agro-écologiques", ["Forest/Transitional", "Moist Savanna"],
+                                             default=["Forest/Transitional", "Moist Savanna"])
+                rust_range = st.slider("Plage du score de Rouille", 1, 5, (1, 5))
+                blight_range = st.slider("Plage du score d'Helminthosporiose", 1, 5, (1, 5))
+                sweep_e_ht = st.number_input("Hauteur de l'épi fixe (cm)", min_value=20, max_value=200, value=90)
+            submit_sweep = st.form_submit_button("Lancer le balayage")
+
+        if submit_sweep:
+            ranges = {
+                'PL_HT': np.arange(pl_ht_range[0], pl_ht_range[1] + 1, pl_ht_step),
+                'DY_SK': np.arange(dy_sk_range[0], dy_sk_range[1] + 1, dy_sk_step),
+                'RUST': np.arange(rust_range[0], rust_range[1] + 1),
+                'BLIGHT': np.arange(blight_range[0], blight_range[1] + 1),
+                'AEZONE': sweep_zones,
+            }
+            ranges = {col: values for col, values in ranges.items() if col in input_cols}
+            if yield_sweep.grid_size(ranges) == 0:
+                st.warning("Sélectionnez au moins une zone agro-écologique.")
+            else:
+                try:
+                    st.session_state['yield_sweep'], sweep_seconds = yield_sweep.sweep_predict(
+                        yield_model, input_cols, ranges, base_values={'E_HT': sweep_e_ht}
+                    )
+                    st.session_state['yield_sweep_seconds'] = sweep_seconds
+                except Exception as e:
+                    st.error(f"Erreur lors du balayage : {e}")
+
+        sweep_results = st.session_state.get('yield_sweep')
+        if sweep_results is not None:
+            st.success(f"✅ {len(sweep_results):,} scénarios évalués en {st.session_state['yield_sweep_seconds']:.2f} s")
+
+            swept_cols = [c for c in ['PL_HT', 'DY_SK', 'RUST', 'BLIGHT'] if c in sweep_results.columns]
+            col1, col2 = st.columns(2)
+            x_var = col1.selectbox("Axe horizontal", swept_cols, index=0)
+            y_var = col2.selectbox("Axe vertical", [c for c in swept_cols if c != x_var], index=0)
+
+            # Mean over the dimensions not shown on the heatmap
+            group_cols = ['AEZONE', x_var, y_var] if 'AEZONE' in sweep_results.columns else [x_var, y_var]
+            heatmap_data = sweep_results.groupby(group_cols, as_index=False)['Rendement'].mean()
+            heatmap = alt.Chart(heatmap_data).mark_rect().encode(
+                x=alt.X(f'{x_var}:O'),
+                y=alt.Y(f'{y_var}:O', sort='descending'),
+                color=alt.Color('Rendement:Q', scale=alt.Scale(scheme='greens'), title='kg/ha'),
+                tooltip=group_cols + [alt.Tooltip('Rendement:Q', format=',.0f')]
+            )
+            if 'AEZONE' in group_cols:
+                heatmap = heatmap.facet(column=alt.Column('AEZONE:N', title=None))
+            st.altair_chart(heatmap)
+
+            st.markdown("#### Rendement moyen selon les scores de maladie")
+            disease_cols = [c for c in ['RUST', 'BLIGHT'] if c in sweep_results.columns]
+            if disease_cols:
+                line_data = pd.concat(
+                    [sweep_results.groupby(c)['Rendement'].mean().rename(c) for c in disease_cols], axis=1
+                )
+                line_data.index.name = 'Score'
+                st.line_chart(line_data)
+
+            st.download_button(
+                "Télécharger les scénarios (CSV)",
+                sweep_results.to_csv(index=False).encode('utf-8'),
+                file_name="balayage_rendement.csv",
+                mime="text/csv"
+            )
+
+    else:
+        st.markdown(f"Prédisez un jeu de données complet. Colonnes requises : `{'`, `'.join(input_cols)}`. "
+                    "Pour les très gros fichiers, utilisez `python bulk_yield_scoring.py`.")
+        bulk_file = st.file_uploader("Fichier d'essais", type=["csv", "parquet"])
+        col1, col2 = st.columns(2)
+        bulk_chunk_size = col1.select_slider("Taille de bloc (lignes)", options=[10_000, 50_000, 100_000, 250_000], value=100_000)
+        bulk_output_format = col2.selectbox("Format de sortie", list(bulk_yield_scoring.SUPPORTED_FORMATS))
+
+        if bulk_file is not None and st.button("Prédire le fichier"):
+            progress_text = st.empty()
+            # Predictions are streamed to a temporary file, not accumulated in memory
+            output = tempfile.NamedTemporaryFile(suffix=f'.{bulk_output_format}', delete=False)
+            output.close()
+            try:
+                stats = bulk_yield_scoring.score_stream(
+                    yield_model, input_cols, bulk_file, output.name,
+                    bulk_yield_scoring.detect_format(bulk_file.name), bulk_output_format,
+                    chunk_size=bulk_chunk_size,
+                    progress_callback=lambda rows, rate: progress_text.text(f"{rows:,} lignes ({rate:,.0f} lignes/s)")
+                )
+                progress_text.empty()
+                st.success(f"✅ {stats['rows']:,} lignes prédites en {stats['seconds']:.2f} s ({stats['rows_per_second']:,.0f} lignes/s)")
+                with open(output.name, 'rb') as f:
+                    st.download_button(
+                        "Télécharger les prédictions",
+                        f,
+                        file_name=f"predictions_rendement.{bulk_output_format}",
+                        mime="text/csv" if bulk_output_format == 'csv' else "application/octet-stream"
+                    )
             except Exception as e:
+                progress_text.empty()
                 st.error(f"Erreur lors de la prédiction : {e}")
+            finally:
+                os.remove(output.name)
+
+# --- TAB 3: PREDICTION HISTORY ---
+with tab3:
+    st.markdown("### 📜 Historique des Prédictions")
+    if history_writer is None:
+        st.info("Historique désactivé (variable `AGRI_SMART_HISTORY_DB` vide ou base inaccessible).")
+    else:
+        history_days = st.selectbox("Période", [7, 30, 365, None], index=1,
+                                    format_func=lambda d: f"{d} derniers jours" if d else "Tout l'historique")
+        # Dashboards read the daily rollup tables, never the raw prediction rows
+        query_start = time.perf_counter()
+        history_conn = prediction_history.connect(history_writer.db_path)
+        try:
+            history_totals = prediction_history.totals(history_conn)
+            prevalence = prediction_history.disease_prevalence(history_conn, history_days)
+            disease_daily = prediction_history.disease_daily_counts(history_conn, history_days)
+            yield_trend = prediction_history.yield_trend(history_conn, history_days)
+        finally:
+            history_conn.close()
+        query_ms = 1000 * (time.perf_counter() - query_start)
+
+        col1, col2 = st.columns(2)
+        col1.metric("Prédictions de maladie", f"{history_totals['disease']:,}".replace(',', ' '))
+        col2.metric("Prédictions de rendement", f"{history_totals['yield']:,}".replace(',', ' '))
+
+        st.markdown("#### 🦠 Prévalence des maladies par zone")
+        if prevalence.empty:
+            st.info("Aucune prédiction de maladie sur la période.")
+        else:
+            prevalence['Zone'] = prevalence['aezone'].replace(prediction_history.UNKNOWN_ZONE, "Non renseignée")
+            prevalence['Maladie'] = prevalence['class'].map(lambda c: CLASS_TRANSLATIONS.get(c, c))
+            prevalence['Part (%)'] = 100 * prevalence['n'] / prevalence.groupby('aezone')['n'].transform('sum')
+            st.altair_chart(alt.Chart(prevalence).mark_bar().encode(
+                x=alt.X('Zone:N', title=None),
+                y=alt.Y('Part (%):Q', stack='normalize', title='Part des prédictions'),
+                color=alt.Color('Maladie:N'),
+                tooltip=['Zone', 'Maladie', alt.Tooltip('n:Q', title='Prédictions', format=','),
+                         alt.Tooltip('Part (%):Q', format='.1f')]
+            ), use_container_width=True)
+            disease_daily['Maladie'] = disease_daily['class'].map(lambda c: CLASS_TRANSLATIONS.get(c, c))
+            st.line_chart(disease_daily.pivot(index='day', columns='Maladie', values='n').fillna(0))
+
+        st.markdown("#### 📈 Rendement prédit moyen")
+        if yield_trend.empty:
+            st.info("Aucune prédiction de rendement sur la période.")
         else:
-            # Simulation for demo
-            simulated_yield = (pl_ht * 10) + (e_ht * 5) - (dy_sk * 2) + 3000
-            st.markdown(f"""
-            <div class="prediction-box">
-                <h2 style="color: #1B5E20; font-weight: bold;">Rendement Prédit (Démo)</h2>
-                <h1 style="color: #2E7D32;">{simulated_yield:,.2f} kg/ha</h1>
-                <p style="color: gray; font-size: 0.8em;">*Modèle non chargé, utilisation d'une formule heuristique</p>
-            </div>
-            """, unsafe_allow_html=True)
+            st.altair_chart(alt.Chart(yield_trend).mark_line(point=True).encode(
+                x=alt.X('day:T', title=None),
+                y=alt.Y('mean_yield:Q', title='kg/ha', scale=alt.Scale(zero=False)),
+                color=alt.Color('aezone:N', title='Zone'),
+                tooltip=[alt.Tooltip('day:T', title='Jour'), alt.Tooltip('aezone:N', title='Zone'),
+                         alt.Tooltip('n:Q', title='Prédictions'),
+                         alt.Tooltip('mean_yield:Q', title='Moyenne', format=',.0f'),
+                         alt.Tooltip('std_yield:Q', title='Écart-type', format=',.0f')]
+            ), use_container_width=True)
+
+        writer_stats = history_writer.stats()
+        st.caption(f"Agrégats journaliers lus en {query_ms:.1f} ms ; {writer_stats['pending']} ligne(s) en "
+                   f"attente d'écriture ({writer_stats['written']} écrites par lots depuis le démarrage)")
+        if writer_stats['dropped']:
+            st.warning(f"⚠️ {writer_stats['dropped']} ligne(s) d'historique perdue(s) après deux échecs d'écriture : "
+                       f"{writer_stats['error']}")
+        elif writer_stats['error']:
+            st.warning(f"⚠️ Erreur d'écriture de l'historique : {writer_stats['error']}")
 
 st.markdown("---")
 st.markdown("Développé pour le projet AGRI SMART")
+
+# Admin panel: per-stage latency percentiles
+if metrics.is_enabled():
+    with st.sidebar.expander("📊 Métriques de latence (admin)"):
+        stage_stats = metrics.snapshot()
+        if stage_stats:
+            st.dataframe(pd.DataFrame([
+                {
+                    'Étape': stage,
+                    'Appels': stats['count'],
+                    'p50 (ms)': round(stats['p50'] * 1000, 2),
+                    'p95 (ms)': round(stats['p95'] * 1000, 2),
+                    'p99 (ms)': round(stats['p99'] * 1000, 2),
+                }
+                for stage, stats in stage_stats.items()
+            ]), hide_index=True)
+        else:
+            st.caption("Aucune mesure pour le moment.")
+        st.download_button("Export Prometheus", metrics.render_prometheus(), file_name="metrics.prom", mime="text/plain")
+    if os.environ.get('AGRI_SMART_METRICS_FILE'):
+        metrics.write_prometheus(os.environ['AGRI_SMART_METRICS_FILE'])
+
+# Worker pool status: requests in flight and completed per process
+if inference_pool is not None:
+    with st.sidebar.expander("⚙️ Pool d'inférence"):
+        pool_stats = inference_pool.stats()
+        st.caption(f"{pool_stats['alive']}/{pool_stats['workers']} processus actifs")
+        st.dataframe(pd.DataFrame({
+            'Cœurs': [', '.join(map(str, cpus)) or '-' for cpus in pool_stats['cpu_sets']],
+            'En cours': pool_stats['in_flight'],
+            'Traitées': pool_stats['completed'],
+            'Relances': pool_stats['restarts'],
+        }), hide_index=True)
+
+# Prediction caches (probabilities and Grad-CAM maps): hit/miss counters
+with st.sidebar.expander("⚡ Cache des prédictions"):
+    st.dataframe(pd.DataFrame([
+        {
+            'Cache': name,
+            'Entrées': f"{cache_stats['entries']}/{cache_stats['max_entries']}",
+            'Succès mémoire': cache_stats['memory_hits'],
+            'Succès disque': cache_stats['disk_hits'],
+            'Échecs': cache_stats['misses'],
+            'Taux de succès': f"{100 * cache_stats['hit_rate']:.0f}%",
+            'Sur disque': (f"{cache_stats['disk_entries']}/{cache_stats['max_disk_entries']}"
+                           if cache_stats['disk_entries'] is not None else '-'),
+        }
+        for name, cache_stats in (("Probabilités", prediction_cache.stats()),
+                                  ("Grad-CAM", get_gradcam_cache().stats()))
+    ]), hide_index=True)
+    if st.button("🧹 Purger les versions de modèle retirées"):
+        # Versions of the disease artifacts currently on disk (one per available backend)
+        current_versions = [inference.model_artifact_version(backend) for backend in inference.DISEASE_BACKENDS
+                            if os.path.exists(inference.disease_model_path(backend))
+                            and (backend != 'cascade' or os.path.exists(inference.disease_model_path('keras')))]
+        purged = sum(cache.purge_versions(current_versions) for cache in (prediction_cache, get_gradcam_cache()))
+        st.caption(f"{purged} entrée(s) supprimée(s) du disque")
+
+# Model registry: served versions, hot swaps and shadow comparison
+registry_models = [model for model in (yield_model, disease_loader.get() if disease_loader.is_loaded else None)
+                   if isinstance(model, model_registry.HotSwapModel)]
+if registry_models:
+    with st.sidebar.expander("🗂️ Registre de modèles"):
+        for model in registry_models:
+            registry_stats = model.stats()
+            st.markdown(f"**{registry_stats['kind']}** : version `{registry_stats['version']}` "
+                        f"({registry_stats['swaps']} remplacement(s) à chaud)")
+            if registry_stats['error']:
+                st.warning(f"⚠️ Échec du chargement : {registry_stats['error']}")
+            shadow = registry_stats.get('shadow')
+            if shadow is not None:
+                st.caption(f"Fantôme `{registry_stats['shadow_version']}` : {shadow['samples']} requêtes comparées")
+                st.dataframe(pd.DataFrame([{
+                    'Active (ms)': round(shadow['active_ms'], 2),
+                    'Fantôme (ms)': round(shadow['shadow_ms'], 2),
+                    'Écart moyen': round(shadow['mean_abs_delta'], 4),
+                    'Accord top-1': (round(shadow['top1_agreement'], 3)
+                                     if shadow['top1_agreement'] is not None else '-'),
+                }]), hide_index=True)
+
+# The page is rendered: warm the disease model up without blocking it
+if disease_preload == 'background':
+    disease_loader.start_background()
@@ -0,0 +1,218 @@
+"""
+Manifeste des artefacts du dossier models/ : empreinte SHA-256, taille, date, chargeur
+
+Le manifeste (`models/manifest.json`) permet :
+  - de vérifier en une passe que les fichiers déployés sont ceux attendus ;
+  - de ne pas relire un fichier dont la taille et la date n'ont pas changé : son
+    empreinte enregistrée est réutilisée (`--deep` force le recalcul) ;
+  - de fournir des clés de cache fondées sur le contenu (`artifact_digest`), stables
+    lors d'une copie ou d'un redéploiement du même fichier.
+
+Utilisation :
+    python artifact_manifest.py write     # (re)génère le manifeste
+    python artifact_manifest.py verify    # compare models/ au manifeste
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+MODELS_DIR = 'models'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_PATH = os.path.join(MODELS_DIR, MANIFEST_NAME)
+# Registry pointers (model_registry.py) change on every activation, they are not artifacts
+POINTER_NAMES = {'ACTIVE', 'SHADOW'}
+HASH_CHUNK_BYTES = 1 << 20
+LOADER_TYPES = {
+    '.keras': 'keras',
+    '.h5': 'keras',
+    '.tflite': 'tflite',
+    '.pkl': 'joblib',
+    '.joblib': 'joblib',
+    '.npy': 'numpy',
+    '.json': 'json',
+}
+
+_digest_lock = threading.Lock()
+# (path, size, mtime_ns) -> sha256, so a process hashes each file version once
+_digest_cache = {}
+
+
+def loader_type(relative_path):
+    """Type de chargeur d'un artefact d'après son emplacement et son extension"""
+    parts = relative_path.split('/')
+    if any(part.endswith('.mmap') for part in parts[:-1]):
+        # Compiled forest arrays opened by yield_fast_path.load_compiled
+        return 'mmap'
+    return LOADER_TYPES.get(os.path.splitext(relative_path)[1].lower(), 'file')
+
+
+def sha256_file(path):
+    """Empreinte SHA-256 d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_artifacts(models_dir=MODELS_DIR):
+    """
+    Fichiers d'artefacts de `models_dir` (récursif), chemins relatifs avec '/'
+
+    Le manifeste lui-même, les pointeurs du registre et les fichiers/dossiers cachés
+    (écritures en cours) sont ignorés.
+    """
+    for root, dirs, files in os.walk(models_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.') or name in POINTER_NAMES:
+                continue
+            relative = os.path.relpath(os.path.join(root, name), models_dir).replace(os.sep, '/')
+            if relative != MANIFEST_NAME:
+                yield relative
+
+
+def _entry(path, relative, previous=None, rehash=False):
+    stat = os.stat(path)
+    if (not rehash and previous is not None and previous['size'] == stat.st_size
+            and previous['mtime_ns'] == stat.st_mtime_ns):
+        sha256 = previous['sha256']
+    else:
+        sha256 = sha256_file(path)
+    return {
+        'sha256': sha256,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'loader': loader_type(relative),
+    }
+
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """Manifeste enregistré, ou None s'il n'existe pas"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def build_manifest(models_dir=MODELS_DIR, previous=None, rehash=False):
+    """
+    Construit le manifeste de tous les artefacts de `models_dir`
+
+    Args:
+        previous: Manifeste précédent, dont les empreintes sont réutilisées pour les
+            fichiers de même taille et date
+        rehash: Recalculer toutes les empreintes
+
+    Returns:
+        dict {'created', 'artifacts': {chemin relatif: entrée}}
+    """
+    known = (previous or {}).get('artifacts', {})
+    artifacts = {
+        relative: _entry(os.path.join(models_dir, relative), relative, known.get(relative), rehash)
+        for relative in iter_artifacts(models_dir)
+    }
+    return {'created': datetime.now().isoformat(), 'artifacts': artifacts}
+
+
+def write_manifest(models_dir=MODELS_DIR, rehash=False):
+    """Régénère `models_dir/manifest.json` (écriture atomique) et renvoie le manifeste"""
+    manifest_path = os.path.join(models_dir, MANIFEST_NAME)
+    manifest = build_manifest(models_dir, load_manifest(manifest_path), rehash)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def verify_manifest(models_dir=MODELS_DIR, manifest=None, rehash=False):
+    """
+    Compare le contenu de `models_dir` au manifeste
+
+    Sans `rehash`, un fichier de même taille et date que dans le manifeste est considéré
+    inchangé sans être relu.
+
+    Returns:
+        dict de listes : 'ok', 'modified', 'missing', 'unlisted' (None si pas de manifeste)
+    """
+    if manifest is None:
+        manifest = load_manifest(os.path.join(models_dir, MANIFEST_NAME))
+    if manifest is None:
+        return None
+    known = manifest.get('artifacts', {})
+    present = set(iter_artifacts(models_dir))
+    result = {'ok': [], 'modified': [], 'missing': [], 'unlisted': sorted(present - set(known))}
+    for relative, expected in sorted(known.items()):
+        if relative not in present:
+            result['missing'].append(relative)
+            continue
+        current = _entry(os.path.join(models_dir, relative), relative, expected, rehash)
+        same = current['sha256'] == expected['sha256'] and current['size'] == expected['size']
+        result['ok' if same else 'modified'].append(relative)
+    return result
+
+
+def artifact_digest(path, models_dir=MODELS_DIR):
+    """
+    Empreinte SHA-256 du contenu d'un artefact, pour les clés de cache
+
+    Reprise du manifeste si la taille et la date correspondent, sinon calculée une fois
+    par version du fichier et gardée en mémoire.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        if key in _digest_cache:
+            return _digest_cache[key]
+
+    relative = os.path.relpath(path, models_dir).replace(os.sep, '/')
+    entry = ((load_manifest(os.path.join(models_dir, MANIFEST_NAME)) or {}).get('artifacts', {}).get(relative))
+    if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        digest = entry['sha256']
+    else:
+        digest = sha256_file(path)
+    with _digest_lock:
+        _digest_cache[key] = digest
+    return digest
+
+
+def print_verification(result):
+    """Affiche le résultat de `verify_manifest` ; renvoie True si tout correspond"""
+    if result is None:
+        print(f"⚠️  Manifeste absent : python artifact_manifest.py write")
+        return False
+    for relative in result['ok']:
+        print(f"  ✅ {relative}")
+    for relative in result['modified']:
+        print(f"  ❌ {relative} (contenu modifié)")
+    for relative in result['missing']:
+        print(f"  ❌ {relative} (absent)")
+    for relative in result['unlisted']:
+        print(f"  ℹ️  {relative} (absent du manifeste)")
+    return not (result['modified'] or result['missing'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manifeste SHA-256 des artefacts de models/")
+    parser.add_argument('command', choices=['write', 'verify'])
+    parser.add_argument('--models-dir', default=MODELS_DIR)
+    parser.add_argument('--deep', action='store_true', help="Recalculer toutes les empreintes")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'write':
+        manifest = write_manifest(args.models_dir, rehash=args.deep)
+        total = sum(entry['size'] for entry in manifest['artifacts'].values())
+        print(f"✅ Manifeste : {len(manifest['artifacts'])} artefacts ({total / 1e6:.1f} Mo) → "
+              f"{os.path.join(args.models_dir, MANIFEST_NAME)} en {time.perf_counter() - start:.2f} s")
+    else:
+        ok = print_verification(verify_manifest(args.models_dir, rehash=args.deep))
+        print(f"\n{'✅ Artefacts conformes au manifeste' if ok else '❌ Artefacts non conformes'} "
+              f"({time.perf_counter() - start:.2f} s)")
+        raise SystemExit(0 if ok else 1)
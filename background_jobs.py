@@ -0,0 +1,167 @@
+"""
+Exécution des prédictions en arrière-plan, suivies par session
+
+Un clic sur « Analyser » ne bloque plus le thread du script Streamlit : le travail est
+soumis à un `ThreadPoolExecutor` partagé et la session ne garde que l'identifiant du
+job. Tant que le job tourne, la page relit son état (progression, résultats partiels
+publiés au fil des lots) ; une interaction sur un widget relance le script, qui se
+rattache au job en cours au lieu de le recalculer.
+
+Un même travail (même session, même clé — ex. empreinte de l'image et version du
+modèle) n'est jamais soumis deux fois : `submit` renvoie le job existant.
+"""
+import itertools
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(os.environ.get('AGRI_SMART_JOB_WORKERS', 2))
+# Finished jobs are forgotten after this many seconds (their results are still in the page)
+JOB_TTL_SECONDS = 600
+POLL_INTERVAL = 0.5
+# The script waits this long after submitting, so quick jobs render without a poll
+INLINE_WAIT_SECONDS = 0.25
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Job:
+    """
+    Travail soumis par une session : état, progression, résultats partiels et final
+
+    La fonction exécutée reçoit le job en premier argument et publie son avancement
+    par `report(done, total, partial)`.
+    """
+
+    def __init__(self, job_id, session_id, kind, key):
+        self.id = job_id
+        self.session_id = session_id
+        self.kind = kind
+        self.key = key
+        self.status = PENDING
+        self.done = 0
+        self.total = None
+        self.partial = []
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    @property
+    def seconds(self):
+        """Durée d'exécution (jusqu'à maintenant si le job tourne encore)"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def report(self, done, total=None, partial=None):
+        """Publie l'avancement et, optionnellement, une liste de nouveaux résultats partiels"""
+        with self._lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+            if partial:
+                self.partial.extend(partial)
+
+    def snapshot(self):
+        """(fait, total, copie des résultats partiels) cohérents entre eux"""
+        with self._lock:
+            return self.done, self.total, list(self.partial)
+
+    def wait(self, timeout=None):
+        """Attend la fin du job ; renvoie True s'il est terminé"""
+        return self._finished.wait(timeout)
+
+    def _run(self, fn, args, kwargs):
+        self.started_at = time.time()
+        self.status = RUNNING
+        try:
+            self.result = fn(self, *args, **kwargs)
+            self.status = DONE
+        except Exception as e:
+            self.error = str(e) or traceback.format_exc(limit=1)
+            self.status = FAILED
+        finally:
+            self.finished_at = time.time()
+            self._finished.set()
+
+
+class JobManager:
+    """
+    Exécuteur partagé par toutes les sessions et registre de leurs jobs
+
+    Args:
+        max_workers: Threads d'exécution (les modèles relâchent le GIL pendant `predict`)
+        ttl: Durée de conservation des jobs terminés (secondes)
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='prediction-job')
+        self._jobs = {}
+        self._by_key = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, kind, key, fn, *args, **kwargs):
+        """
+        Soumet `fn(job, *args, **kwargs)`, ou renvoie le job de même clé déjà connu
+
+        Args:
+            session_id: Identifiant de la session Streamlit
+            kind: Type de travail ('disease', 'disease_batch', 'yield'...)
+            key: Clé identifiant les entrées (None : pas de dédoublonnage)
+
+        Returns:
+            Job
+        """
+        with self._lock:
+            self._forget_expired()
+            existing = self._by_key.get((session_id, kind, key)) if key is not None else None
+            if existing is not None and existing.status != FAILED:
+                return existing
+            job = Job(f"{kind}-{next(self._ids)}", session_id, kind, key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._by_key[(session_id, kind, key)] = job
+        self._executor.submit(job._run, fn, args, kwargs)
+        return job
+
+    def get(self, job_id, session_id=None):
+        """Job par identifiant (None s'il est inconnu, expiré ou d'une autre session)"""
+        job = self._jobs.get(job_id)
+        if job is None or (session_id is not None and job.session_id != session_id):
+            return None
+        return job
+
+    def _forget_expired(self):
+        # Caller holds the lock
+        now = time.time()
+        expired = [job for job in self._jobs.values()
+                   if job.finished and now - job.finished_at > self.ttl]
+        for job in expired:
+            del self._jobs[job.id]
+            if self._by_key.get((job.session_id, job.kind, job.key)) is job:
+                del self._by_key[(job.session_id, job.kind, job.key)]
+
+    def stats(self):
+        """Nombre de jobs par état"""
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in list(self._jobs.values()):
+            counts[job.status] += 1
+        return counts
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
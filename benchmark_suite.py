@@ -0,0 +1,249 @@
+"""
+Suite de benchmarks reproductible : chargement des modèles, prétraitement, inférence
+
+Mesure :
+  - joblib.load de models/yield_prediction_model.pkl
+  - chargement du modèle Keras de maladie
+  - prétraitement PIL à plusieurs résolutions d'entrée
+  - predict du modèle de maladie pour des lots de 1 à 64 images
+  - predict du modèle de rendement de 1 à 1 000 000 lignes
+
+Si models/maize_mobilenetv2_model.keras est absent, un MobileNetV2 de substitution
+(poids aléatoires, même architecture d'entrée/sortie) est construit pour que la suite
+tourne sur n'importe quelle machine CPU. Les résultats sont écrits en JSON.
+
+Utilisation :
+    python benchmark_suite.py --output benchmarks/run.json
+    python benchmark_suite.py --compare benchmarks/avant.json benchmarks/apres.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib import metadata
+
+import numpy as np
+
+import inference
+
+RESOLUTIONS = [(640, 480), (1920, 1080), (4032, 3024)]
+DISEASE_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+YIELD_ROWS = [1, 10, 100, 1_000, 10_000, 100_000, 1_000_000]
+PACKAGES = ['numpy', 'pandas', 'scikit-learn', 'joblib', 'pillow', 'tensorflow', 'tensorflow-cpu', 'keras']
+
+
+def _measure(fn, repeat=5, warmup=1):
+    """Exécute `fn` (après échauffement) et renvoie la médiane, le min et le p95 en ms"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(float(np.median(timings)), 3),
+        'min_ms': round(float(np.min(timings)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'repeat': repeat,
+    }
+
+
+def environment_info():
+    """Versions et matériel, pour comparer des exécutions entre elles"""
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'packages': versions,
+    }
+
+
+def random_yield_frame(n_rows, input_cols, seed=0, zones=('Forest/Transitional', 'Moist Savanna')):
+    """Jeu de données de rendement aléatoire (mêmes plages que regenerate_model.py)"""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'PL_HT': rng.integers(100, 250, n_rows),
+        'E_HT': rng.integers(50, 150, n_rows),
+        'DY_SK': rng.integers(45, 85, n_rows),
+        'AEZONE': rng.choice(list(zones), n_rows),
+        'RUST': rng.integers(1, 6, n_rows),
+        'BLIGHT': rng.integers(1, 6, n_rows),
+    })
+    return data[input_cols]
+
+
+def synthetic_jpeg(width, height, seed=0):
+    """Photo JPEG synthétique (dégradé + bruit) de la résolution demandée"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+    pixels = np.clip(gradient + rng.normal(0, 25, (height, width, 3)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def build_stand_in_disease_model():
+    """MobileNetV2 à poids aléatoires avec la même tête 4 classes que le modèle entraîné"""
+    import tensorflow as tf
+
+    base = tf.keras.applications.MobileNetV2(input_shape=(*inference.IMAGE_SIZE, 3), include_top=False, weights=None)
+    x = tf.keras.layers.GlobalAveragePooling2D()(base.output)
+    outputs = tf.keras.layers.Dense(len(inference.CLASS_NAMES), activation='softmax')(x)
+    return tf.keras.Model(base.input, outputs)
+
+
+def bench_yield_load(repeat):
+    import joblib
+    return _measure(lambda: joblib.load(inference.YIELD_MODEL_PATH), repeat)
+
+
+def bench_disease_load(repeat):
+    """Chargement du modèle Keras (ou du substitut sauvegardé dans un dossier temporaire)"""
+    import tensorflow as tf
+
+    model_path = inference.DISEASE_MODEL_PATH
+    stand_in = not os.path.exists(model_path)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if stand_in:
+            model_path = os.path.join(tmp_dir, 'stand_in_mobilenetv2.keras')
+            build_stand_in_disease_model().save(model_path)
+        result = _measure(lambda: tf.keras.models.load_model(model_path), repeat, warmup=0)
+        model = tf.keras.models.load_model(model_path)
+    result['stand_in'] = stand_in
+    return result, model
+
+
+def bench_preprocessing(repeat, resolutions=RESOLUTIONS):
+    results = {}
+    for width, height in resolutions:
+        data = synthetic_jpeg(width, height)
+        result = _measure(lambda: inference.preprocess_image(inference.open_image(io.BytesIO(data))), repeat)
+        result['jpeg_bytes'] = len(data)
+        results[f'{width}x{height}'] = result
+    return results
+
+
+def bench_disease_predict(model, repeat, batch_sizes=DISEASE_BATCH_SIZES):
+    rng = np.random.default_rng(0)
+    results = {}
+    for batch_size in batch_sizes:
+        batch = rng.random((batch_size, *inference.IMAGE_SIZE, 3), dtype=np.float32)
+        result = _measure(lambda: inference.predict_disease(model, batch, batch_size=batch_size), repeat)
+        result['images_per_second'] = round(batch_size / (result['median_ms'] / 1000), 1)
+        results[str(batch_size)] = result
+    return results
+
+
+def bench_yield_predict(model, input_cols, repeat, row_counts=YIELD_ROWS):
+    results = {}
+    for n_rows in row_counts:
+        data = random_yield_frame(n_rows, input_cols)
+        runs = repeat if n_rows <= 10_000 else max(1, repeat // 5)
+        result = _measure(lambda: model.predict(data), runs, warmup=1 if n_rows <= 10_000 else 0)
+        result['rows_per_second'] = round(n_rows / (result['median_ms'] / 1000), 1)
+        results[str(n_rows)] = result
+    return results
+
+
+def run_suite(repeat=5, max_yield_rows=max(YIELD_ROWS), skip_disease=False):
+    """Exécute toute la suite et renvoie le dictionnaire de résultats"""
+    report = {
+        'created_date': datetime.now().isoformat(),
+        'environment': environment_info(),
+        'results': {},
+    }
+    results = report['results']
+
+    print("📦 Chargement du modèle de rendement (joblib.load)...")
+    results['yield_model_load'] = bench_yield_load(repeat)
+
+    print("🖼️  Prétraitement PIL...")
+    results['preprocessing'] = bench_preprocessing(repeat)
+
+    if not skip_disease:
+        print("🦠 Chargement du modèle de maladie...")
+        results['disease_model_load'], disease_model = bench_disease_load(max(1, repeat // 2))
+        print("🦠 Prédiction maladie par lots...")
+        results['disease_predict'] = bench_disease_predict(disease_model, repeat)
+
+    print("🌾 Prédiction de rendement...")
+    yield_model, input_cols = inference.load_yield_model()
+    row_counts = [n for n in YIELD_ROWS if n <= max_yield_rows]
+    results['yield_predict'] = bench_yield_predict(yield_model, input_cols, repeat, row_counts)
+    return report
+
+
+def _flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict) and 'median_ms' in value:
+            flat[name] = value['median_ms']
+        elif isinstance(value, dict):
+            flat.update(_flatten(value, f'{name}/'))
+    return flat
+
+
+def compare_reports(before_path, after_path):
+    """Affiche la médiane de chaque benchmark pour deux exécutions et leur rapport"""
+    with open(before_path, 'r', encoding='utf-8') as f:
+        before = _flatten(json.load(f)['results'])
+    with open(after_path, 'r', encoding='utf-8') as f:
+        after = _flatten(json.load(f)['results'])
+
+    print(f"{'Benchmark':40s} {'Avant (ms)':>12s} {'Après (ms)':>12s} {'Rapport':>9s}")
+    print("-" * 76)
+    for name in sorted(set(before) | set(after)):
+        b, a = before.get(name), after.get(name)
+        ratio = f"{b / a:8.2f}x" if a and b else 'N/A'
+        print(f"{name:40s} {b if b is not None else float('nan'):12.3f} "
+              f"{a if a is not None else float('nan'):12.3f} {ratio:>9s}")
+
+
+def print_summary(report):
+    print()
+    print("=" * 60)
+    print("🎯 RÉSUMÉ (médianes)")
+    print("=" * 60)
+    for name, median_ms in _flatten(report['results']).items():
+        print(f"  {name:40s} : {median_ms:10.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks AGRI SMART (chargement, prétraitement, inférence)")
+    parser.add_argument('--output', default=None, help="Fichier JSON de résultats")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-yield-rows', type=int, default=max(YIELD_ROWS))
+    parser.add_argument('--skip-disease', action='store_true', help="Ne pas mesurer le modèle de maladie (sans TensorFlow)")
+    parser.add_argument('--compare', nargs=2, metavar=('AVANT', 'APRES'), help="Comparer deux fichiers de résultats")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_reports(*args.compare)
+        sys.exit(0)
+
+    report = run_suite(args.repeat, args.max_yield_rows, args.skip_disease)
+    print_summary(report)
+
+    output = args.output or f"benchmarks/results-{datetime.now():%Y%m%d-%H%M%S}.json"
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Résultats sauvegardés : {output}")
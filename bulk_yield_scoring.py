@@ -0,0 +1,188 @@
+"""
+Prédiction de rendement en masse sur des fichiers CSV/Parquet, en flux et par blocs
+
+Le fichier est lu par blocs de `chunk_size` lignes, les colonnes sont validées et
+réordonnées selon `input_columns` (models/model_metadata.json), `predict` est appelé
+une fois par bloc et les prédictions sont écrites au fur et à mesure. La mémoire
+maximale dépend de la taille de bloc, pas de celle du fichier.
+
+Utilisation :
+    python bulk_yield_scoring.py essais.csv predictions.parquet --chunk-size 100000
+"""
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+from save_model_with_metadata import load_model_with_version_check
+
+DEFAULT_CHUNK_SIZE = 100_000
+PREDICTION_COLUMN = 'YIELD_PRED'
+SUPPORTED_FORMATS = ('csv', 'parquet')
+
+
+def detect_format(path_or_name):
+    """Déduit le format ('csv' ou 'parquet') de l'extension du fichier"""
+    extension = os.path.splitext(str(path_or_name))[1].lower().lstrip('.')
+    if extension in ('parquet', 'pq'):
+        return 'parquet'
+    if extension in ('csv', 'txt'):
+        return 'csv'
+    raise ValueError(f"Format non supporté : '{extension}' (attendu : {', '.join(SUPPORTED_FORMATS)})")
+
+
+def read_input_columns(metadata_path='models/model_metadata.json'):
+    """Colonnes d'entrée enregistrées par save_model_with_metadata"""
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        return json.load(f)['input_columns']
+
+
+def iter_input_chunks(source, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Lit un fichier CSV ou Parquet par blocs
+
+    Args:
+        source: Chemin ou fichier binaire ouvert
+        fmt: 'csv' ou 'parquet'
+        chunk_size: Nombre de lignes par bloc
+
+    Yields:
+        pd.DataFrame de `chunk_size` lignes au plus
+    """
+    if fmt == 'csv':
+        yield from pd.read_csv(source, chunksize=chunk_size)
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(source)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Format non supporté : {fmt}")
+
+
+def validate_chunk(chunk, input_cols):
+    """
+    Vérifie la présence des colonnes du modèle et les réordonne
+
+    Returns:
+        pd.DataFrame avec exactement `input_cols`, dans l'ordre d'entraînement
+
+    Raises:
+        ValueError: si des colonnes requises sont absentes
+    """
+    missing = [col for col in input_cols if col not in chunk.columns]
+    if missing:
+        raise ValueError(f"Colonnes manquantes : {', '.join(missing)}")
+    return chunk[input_cols]
+
+
+class _PredictionWriter:
+    """Écrit les blocs prédits en CSV (ajout) ou Parquet (ParquetWriter) au fil de l'eau"""
+
+    def __init__(self, destination, fmt):
+        self.destination = destination
+        self.fmt = fmt
+        self._parquet_writer = None
+        self._wrote_header = False
+
+    def write(self, chunk):
+        if self.fmt == 'csv':
+            chunk.to_csv(self.destination, mode='w' if not self._wrote_header else 'a',
+                         header=not self._wrote_header, index=False)
+            self._wrote_header = True
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._parquet_writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                self._parquet_writer = pq.ParquetWriter(self.destination, table.schema)
+            else:
+                # Later chunks are cast to the first chunk's schema (e.g. int vs float columns in CSV)
+                table = pa.Table.from_pandas(chunk, schema=self._parquet_writer.schema, preserve_index=False)
+            self._parquet_writer.write_table(table)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def score_stream(model, input_cols, source, destination, input_format, output_format,
+                 chunk_size=DEFAULT_CHUNK_SIZE, progress_callback=None):
+    """
+    Prédit un fichier complet bloc par bloc et écrit les prédictions en flux
+
+    Les colonnes du fichier source sont conservées ; la prédiction est ajoutée
+    dans la colonne `YIELD_PRED`.
+
+    Args:
+        model: Pipeline de rendement
+        input_cols: Colonnes d'entrée du modèle
+        source: Chemin ou fichier binaire d'entrée
+        destination: Chemin ou fichier binaire de sortie
+        input_format, output_format: 'csv' ou 'parquet'
+        chunk_size: Nombre de lignes par bloc
+        progress_callback: Fonction optionnelle appelée avec (lignes traitées, lignes/s)
+
+    Returns:
+        dict avec le nombre de lignes, de blocs, la durée et le débit (lignes/s)
+    """
+    writer = _PredictionWriter(destination, output_format)
+    n_rows = 0
+    n_chunks = 0
+    start = time.perf_counter()
+    try:
+        for chunk in iter_input_chunks(source, input_format, chunk_size):
+            try:
+                predictions = model.predict(validate_chunk(chunk, input_cols))
+            except ValueError as e:
+                raise ValueError(f"Bloc {n_chunks + 1} (lignes {n_rows + 1}-{n_rows + len(chunk)}) : {e}") from e
+            writer.write(chunk.assign(**{PREDICTION_COLUMN: predictions}))
+            n_rows += len(chunk)
+            n_chunks += 1
+            if progress_callback is not None:
+                progress_callback(n_rows, n_rows / (time.perf_counter() - start))
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'rows': n_rows,
+        'chunks': n_chunks,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(n_rows / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prédiction de rendement en masse (CSV/Parquet)")
+    parser.add_argument('input', help="Fichier d'entrée (.csv ou .parquet)")
+    parser.add_argument('output', help="Fichier de sortie (.csv ou .parquet)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--model', default='models/yield_prediction_model.pkl')
+    parser.add_argument('--metadata', default='models/model_metadata.json')
+    parser.add_argument('--columns', default=None,
+                        help="Colonnes d'entrée (.pkl, par défaut celles indiquées dans les métadonnées)")
+    parser.add_argument('--mmap', action='store_true', help="Utiliser l'artefact mmap (forêt compilée partagée)")
+    args = parser.parse_args()
+
+    model, input_cols, warnings = load_model_with_version_check(args.model, args.metadata, mmap=args.mmap,
+                                                                columns_path=args.columns)
+    for warning in warnings:
+        print(warning)
+    if model is None:
+        raise SystemExit(1)
+    if os.path.exists(args.metadata):
+        input_cols = read_input_columns(args.metadata)
+
+    def report(rows, rate):
+        print(f"\r  {rows:,} lignes ({rate:,.0f} lignes/s)", end='', flush=True)
+
+    print(f"📊 Prédiction de {args.input} par blocs de {args.chunk_size:,} lignes...")
+    stats = score_stream(model, input_cols, args.input, args.output,
+                         detect_format(args.input), detect_format(args.output),
+                         args.chunk_size, progress_callback=report)
+    print()
+    print(f"✅ {stats['rows']:,} lignes prédites en {stats['seconds']:.2f} s "
+          f"({stats['rows_per_second']:,.0f} lignes/s) → {args.output}")
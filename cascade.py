@@ -0,0 +1,245 @@
+"""
+Inférence en cascade pour les maladies : petit modèle de tri, MobileNetV2 complet si incertain
+
+Le modèle de tri est un MobileNetV2 réduit (alpha=0.35, entrée 96×96) précédé d'une couche
+de redimensionnement : il reçoit le même tenseur (N, 224, 224, 3) normalisé que le modèle
+complet. Il est entraîné par distillation : ses cibles sont les probabilités du modèle
+complet sur un dossier d'images (aucune étiquette nécessaire).
+
+Décision : si la confiance du modèle de tri atteint `threshold` (%), sa réponse est
+retenue ; sinon l'image est transmise au modèle complet (`maize_mobilenetv2_model.keras`).
+
+Utilisation :
+    # Distiller le modèle de tri sur des images représentatives
+    python cascade.py train --images data/samples --epochs 10
+
+    # Débit et accord avec le modèle complet selon le seuil
+    python cascade.py report --samples data/samples
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import inference
+import metrics
+
+SCREENING_MODEL_PATH = inference.SCREENING_MODEL_PATH
+SCREENING_INPUT_SIZE = (96, 96)
+SCREENING_ALPHA = 0.35
+# Screening confidence (%) below which the full model is consulted
+CASCADE_THRESHOLD = float(os.environ.get('AGRI_SMART_CASCADE_THRESHOLD', 90))
+REPORT_PATH = 'models/cascade_report.json'
+REPORT_THRESHOLDS = [50, 60, 70, 80, 85, 90, 95, 99]
+
+
+def build_screening_model(n_classes=len(inference.CLASS_NAMES), input_size=SCREENING_INPUT_SIZE,
+                          alpha=SCREENING_ALPHA, imagenet_weights=False):
+    """Petit MobileNetV2 à entrée 224×224 (redimensionnée en interne)"""
+    import tensorflow as tf
+
+    inputs = tf.keras.Input((*inference.IMAGE_SIZE, 3))
+    x = tf.keras.layers.Resizing(*input_size)(inputs)
+    # MobileNetV2 expects [-1, 1]; the app feeds [0, 1]
+    x = tf.keras.layers.Rescaling(2.0, offset=-1.0)(x)
+    base = tf.keras.applications.MobileNetV2(
+        input_shape=(*input_size, 3), alpha=alpha, include_top=False,
+        weights='imagenet' if imagenet_weights else None
+    )
+    x = tf.keras.layers.GlobalAveragePooling2D()(base(x))
+    outputs = tf.keras.layers.Dense(n_classes, activation='softmax')(x)
+    return tf.keras.Model(inputs, outputs, name='maize_screening')
+
+
+def train_screening_model(image_dir, teacher=None, output_path=SCREENING_MODEL_PATH, epochs=10,
+                          batch_size=32, imagenet_weights=False, limit=None):
+    """
+    Distille le modèle complet dans le modèle de tri
+
+    Args:
+        image_dir: Dossier d'images (sous-dossiers acceptés, étiquettes non utilisées)
+        teacher: Modèle complet (chargé depuis DISEASE_MODEL_PATH si None)
+        output_path: Chemin du modèle de tri sauvegardé
+        epochs: Nombre d'époques
+        imagenet_weights: Initialiser le MobileNetV2 réduit avec les poids ImageNet
+
+    Returns:
+        Historique d'entraînement (dict des pertes par époque)
+    """
+    import tensorflow as tf
+    from convert_to_tflite import load_image_batch
+
+    images = load_image_batch(image_dir, limit)
+    teacher = teacher or inference.load_disease_model()
+    soft_labels = inference.predict_disease(teacher, images, batch_size=batch_size)
+
+    student = build_screening_model(imagenet_weights=imagenet_weights)
+    student.compile(optimizer=tf.keras.optimizers.Adam(1e-3), loss='kl_divergence')
+    dataset = (tf.data.Dataset.from_tensor_slices((images, soft_labels))
+               .shuffle(len(images), seed=0)
+               .map(lambda x, y: (tf.image.random_flip_left_right(x), y))
+               .batch(batch_size))
+    history = student.fit(dataset, epochs=epochs, verbose=2)
+    student.save(output_path)
+    print(f"✅ Modèle de tri : {output_path} ({os.path.getsize(output_path) / 1e6:.1f} Mo, "
+          f"{student.count_params():,} paramètres)")
+    return history.history
+
+
+class CascadeDiseaseModel:
+    """
+    Cascade modèle de tri → modèle complet, avec la même méthode `predict`
+
+    Seules les images dont la confiance de tri est sous le seuil sont envoyées au
+    modèle complet, dans un seul appel batché. Le taux d'escalade est compté.
+    """
+
+    def __init__(self, screening_model, full_model, threshold=CASCADE_THRESHOLD):
+        self.screening_model = screening_model
+        self.full_model = full_model
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._n_images = 0
+        self._n_escalated = 0
+
+    def predict(self, batch, batch_size=32, verbose=0):
+        """Prédit un tableau (N, 224, 224, 3) normalisé"""
+        with metrics.timer('disease_screen'):
+            probs = np.array(self.screening_model.predict(batch, batch_size=batch_size, verbose=0))
+        escalate = self.escalation_mask(probs)
+        if escalate.any():
+            with metrics.timer('disease_escalate'):
+                probs[escalate] = self.full_model.predict(
+                    np.asarray(batch)[escalate], batch_size=batch_size, verbose=0
+                )
+        with self._lock:
+            self._n_images += len(probs)
+            self._n_escalated += int(escalate.sum())
+        return probs
+
+    def escalation_mask(self, screening_probs):
+        """Images à transmettre au modèle complet (confiance de tri < seuil)"""
+        return 100 * np.max(screening_probs, axis=1) < self.threshold
+
+    def stats(self):
+        """Nombre d'images, d'escalades et taux d'escalade depuis le chargement"""
+        with self._lock:
+            return {
+                'threshold': self.threshold,
+                'images': self._n_images,
+                'escalated': self._n_escalated,
+                'escalation_rate': self._n_escalated / self._n_images if self._n_images else 0.0,
+            }
+
+
+def load_cascade_model(screening_path=SCREENING_MODEL_PATH, full_path=inference.DISEASE_MODEL_PATH,
+                       threshold=CASCADE_THRESHOLD):
+    """Charge les deux modèles (compilés et échauffés) et les assemble en cascade"""
+    import tensorflow as tf
+
+    screening = inference.CompiledDiseaseModel(tf.keras.models.load_model(screening_path))
+    full = inference.load_disease_model(full_path)
+    return CascadeDiseaseModel(screening, full, threshold)
+
+
+def _seconds_per_image(model, images, batch_size, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        inference.predict_disease(model, images, batch_size=batch_size)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) / len(images)
+
+
+def threshold_report(sample_dir, thresholds=REPORT_THRESHOLDS, batch_size=32, limit=None,
+                     report_path=REPORT_PATH):
+    """
+    Débit et accord de la cascade selon le seuil, sur un dossier d'images
+
+    L'accord est mesuré par rapport au modèle complet (top-1). Si les images sont rangées
+    dans des sous-dossiers nommés comme CLASS_NAMES, l'exactitude réelle est ajoutée.
+    """
+    from convert_to_tflite import iter_image_files, load_image_batch
+
+    cascade = load_cascade_model()
+    images = load_image_batch(sample_dir, limit)
+    paths = iter_image_files(sample_dir, limit)
+    labels = [os.path.basename(os.path.dirname(p)) for p in paths]
+    has_labels = all(label in inference.CLASS_NAMES for label in labels)
+    true_top1 = np.array([inference.CLASS_NAMES.index(l) for l in labels]) if has_labels else None
+
+    screen_probs = inference.predict_disease(cascade.screening_model, images, batch_size=batch_size)
+    full_probs = inference.predict_disease(cascade.full_model, images, batch_size=batch_size)
+    full_top1 = np.argmax(full_probs, axis=1)
+    screen_s = _seconds_per_image(cascade.screening_model, images, batch_size)
+    full_s = _seconds_per_image(cascade.full_model, images, batch_size)
+
+    rows = []
+    for threshold in thresholds:
+        escalate = 100 * np.max(screen_probs, axis=1) < threshold
+        top1 = np.where(escalate, full_top1, np.argmax(screen_probs, axis=1))
+        rate = float(escalate.mean())
+        row = {
+            'threshold': threshold,
+            'escalation_rate': round(rate, 4),
+            'agreement_with_full': round(float(np.mean(top1 == full_top1)), 4),
+            # Screening always runs; the full model only on escalated images
+            'images_per_second': round(1.0 / (screen_s + rate * full_s), 1),
+        }
+        if true_top1 is not None:
+            row['accuracy'] = round(float(np.mean(top1 == true_top1)), 4)
+        rows.append(row)
+
+    report = {
+        'sample_dir': sample_dir,
+        'n_images': len(images),
+        'full_model_images_per_second': round(1.0 / full_s, 1),
+        'screening_images_per_second': round(1.0 / screen_s, 1),
+        'full_model_accuracy': round(float(np.mean(full_top1 == true_top1)), 4) if true_top1 is not None else None,
+        'thresholds': rows,
+    }
+
+    print(f"\nModèle complet seul : {report['full_model_images_per_second']:.1f} images/s"
+          + (f", exactitude {100 * report['full_model_accuracy']:.1f}%" if true_top1 is not None else ''))
+    print(f"{'Seuil (%)':>9s} {'Escalade':>9s} {'Accord':>8s} {'Images/s':>9s}" + (f" {'Exactitude':>11s}" if true_top1 is not None else ''))
+    print("-" * (40 + (12 if true_top1 is not None else 0)))
+    for r in rows:
+        line = (f"{r['threshold']:9.0f} {100 * r['escalation_rate']:8.1f}% {100 * r['agreement_with_full']:7.1f}% "
+                f"{r['images_per_second']:9.1f}")
+        if true_top1 is not None:
+            line += f" {100 * r['accuracy']:10.1f}%"
+        print(line)
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Rapport sauvegardé : {report_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cascade modèle de tri / modèle complet pour les maladies")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help="Distiller le modèle de tri")
+    train_parser.add_argument('--images', required=True, help="Dossier d'images représentatives")
+    train_parser.add_argument('--epochs', type=int, default=10)
+    train_parser.add_argument('--batch-size', type=int, default=32)
+    train_parser.add_argument('--limit', type=int, help="Nombre maximum d'images")
+    train_parser.add_argument('--imagenet', action='store_true', help="Initialiser avec les poids ImageNet")
+    train_parser.add_argument('--output', default=SCREENING_MODEL_PATH)
+
+    report_parser = subparsers.add_parser('report', help="Débit et accord selon le seuil")
+    report_parser.add_argument('--samples', required=True, help="Dossier d'images échantillon")
+    report_parser.add_argument('--thresholds', type=float, nargs='+', default=REPORT_THRESHOLDS)
+    report_parser.add_argument('--limit', type=int)
+    report_parser.add_argument('--report', default=REPORT_PATH)
+
+    args = parser.parse_args()
+    if args.command == 'train':
+        train_screening_model(args.images, output_path=args.output, epochs=args.epochs,
+                              batch_size=args.batch_size, imagenet_weights=args.imagenet, limit=args.limit)
+    else:
+        threshold_report(args.samples, args.thresholds, limit=args.limit, report_path=args.report)
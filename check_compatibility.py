@@ -1,42 +1,63 @@
 """
 Script de vérification de compatibilité des versions
 Vérifie que les versions locales correspondent aux versions utilisées pour l'entraînement
+
+Les versions sont lues dans les métadonnées des paquets installés (importlib.metadata),
+sans importer TensorFlow, scikit-learn ou Streamlit. Les fichiers de models/ sont
+comparés au manifeste SHA-256 (artifact_manifest.py).
+
+Utilisation :
+    python check_compatibility.py
+    python check_compatibility.py --deep             # recalcule toutes les empreintes
+    python check_compatibility.py --write-manifest   # régénère models/manifest.json
 """
+import argparse
 import json
 import os
 import sys
+import time
+from importlib import metadata as importlib_metadata
+
+import artifact_manifest
+
+# Package name -> candidate distribution names (first installed one wins)
+DISTRIBUTIONS = {
+    'tensorflow': ['tensorflow', 'tensorflow-cpu', 'tensorflow-macos'],
+    'scikit-learn': ['scikit-learn'],
+    'numpy': ['numpy'],
+    'pandas': ['pandas'],
+    'joblib': ['joblib'],
+    'streamlit': ['streamlit'],
+}
+
 
-def check_compatibility():
+def installed_version(package):
+    """Version installée d'un paquet, lue sans l'importer (None s'il est absent)"""
+    for distribution in DISTRIBUTIONS.get(package, [package]):
+        try:
+            return importlib_metadata.version(distribution)
+        except importlib_metadata.PackageNotFoundError:
+            continue
+    return None
+
+
+def check_compatibility(deep=False):
     """Vérifie la compatibilité des versions entre Colab et Local"""
     
+    start = time.perf_counter()
     print("=" * 60)
     print("🔍 VÉRIFICATION DE COMPATIBILITÉ DES VERSIONS")
     print("=" * 60)
     print()
     
-    # Importer les packages
-    try:
-        import tensorflow as tf
-        import sklearn
-        import numpy as np
-        import pandas as pd
-        import joblib
-        import streamlit as st
-    except ImportError as e:
-        print(f"❌ Erreur d'importation: {e}")
+    # Versions locales (métadonnées des paquets, sans import)
+    local_versions = {pkg: installed_version(pkg) for pkg in DISTRIBUTIONS}
+    missing = [pkg for pkg, version in local_versions.items() if version is None]
+    if missing:
+        print(f"❌ Paquets non installés: {', '.join(missing)}")
         print("Installez les dépendances: pip install -r requirements.txt")
         return False
-    
-    # Versions locales
-    local_versions = {
-        'tensorflow': tf.__version__,
-        'scikit-learn': sklearn.__version__,
-        'numpy': np.__version__,
-        'pandas': pd.__version__,
-        'joblib': joblib.__version__,
-        'streamlit': st.__version__,
-        'python': f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
-    }
+    local_versions['python'] = f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
     
     print("📦 VERSIONS LOCALES")
     print("-" * 60)
@@ -139,6 +160,23 @@ def check_compatibility():
         print("❌ Certains fichiers de modèle sont manquants.")
         print("   Téléchargez-les depuis Google Colab ou régénérez-les.")
     
+    print()
+    
+    # Vérifier le contenu des artefacts (empreintes SHA-256)
+    print("🔐 VÉRIFICATION DU MANIFESTE DES ARTEFACTS")
+    print("-" * 60)
+    verification = artifact_manifest.verify_manifest(artifact_manifest.MODELS_DIR, rehash=deep)
+    manifest_ok = verification is not None and artifact_manifest.print_verification(verification)
+    if verification is None:
+        print("  ℹ️  Manifeste non trouvé, générez-le: python check_compatibility.py --write-manifest")
+    elif manifest_ok:
+        print()
+        print("✅ Artefacts conformes au manifeste!")
+    else:
+        print()
+        print("⚠️  Artefacts différents du manifeste. Après une mise à jour volontaire:")
+        print("   python check_compatibility.py --write-manifest")
+    
     print()
     print("=" * 60)
     print("🎯 RÉSUMÉ")
@@ -156,8 +194,18 @@ def check_compatibility():
     print("   - COLAB_LOCAL_COMPATIBILITY.md")
     print("   - VERSION_MANAGEMENT.md")
     print()
+    print(f"⏱️  Vérification en {time.perf_counter() - start:.2f} s")
     
     return True
 
 if __name__ == "__main__":
-    check_compatibility()
+    parser = argparse.ArgumentParser(description="Vérification de compatibilité des versions et des artefacts")
+    parser.add_argument('--deep', action='store_true', help="Recalculer toutes les empreintes SHA-256")
+    parser.add_argument('--write-manifest', action='store_true', help="Régénérer models/manifest.json")
+    args = parser.parse_args()
+    
+    if args.write_manifest:
+        manifest = artifact_manifest.write_manifest(rehash=args.deep)
+        print(f"✅ Manifeste régénéré : {len(manifest['artifacts'])} artefacts → {artifact_manifest.MANIFEST_PATH}")
+    else:
+        check_compatibility(deep=args.deep)
@@ -0,0 +1,213 @@
+"""
+Conversion du modèle de maladie MobileNetV2 en TFLite (float16 et int8)
+et rapport comparatif Keras / TFLite (latence, mémoire, accord top-1)
+
+Utilisation :
+    # Exporter les deux variantes (int8 calibré sur un dossier d'images)
+    python convert_to_tflite.py convert --calibration-dir data/calibration
+
+    # Comparer les backends sur un dossier d'images échantillon
+    python convert_to_tflite.py compare --samples data/samples
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import inference
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+REPORT_PATH = 'models/tflite_comparison_report.json'
+
+
+def iter_image_files(folder, limit=None):
+    """Liste (récursivement, triés) les fichiers image d'un dossier"""
+    paths = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+
+def load_image_batch(folder, limit=None):
+    """Charge et prétraite les images d'un dossier en un tableau (N, 224, 224, 3)"""
+    paths = iter_image_files(folder, limit)
+    if not paths:
+        raise FileNotFoundError(f"Aucune image trouvée dans {folder}")
+    return np.stack([inference.preprocess_image(inference.open_image(p)) for p in paths])
+
+
+def convert_disease_model(keras_path=inference.DISEASE_MODEL_PATH, calibration_dir=None,
+                          quantizations=('float16', 'int8'), n_calibration=100):
+    """
+    Exporte le modèle Keras en TFLite
+
+    Args:
+        keras_path: Chemin du modèle Keras source
+        calibration_dir: Dossier d'images pour calibrer la quantification int8
+        quantizations: Variantes à produire ('float16' et/ou 'int8')
+        n_calibration: Nombre maximum d'images de calibration
+
+    Returns:
+        dict {backend: chemin du fichier .tflite}
+    """
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(keras_path)
+    written = {}
+
+    for quantization in quantizations:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        if quantization == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantization == 'int8':
+            if calibration_dir is None:
+                raise ValueError("La quantification int8 nécessite --calibration-dir")
+            calibration = load_image_batch(calibration_dir, n_calibration)
+
+            def representative_dataset():
+                for img in calibration:
+                    yield [img[np.newaxis]]
+
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            # Float input/output keep the runtime a drop-in replacement
+            converter.inference_input_type = tf.float32
+            converter.inference_output_type = tf.float32
+        else:
+            raise ValueError(f"Quantification inconnue : {quantization}")
+
+        backend = f'tflite-{quantization}'
+        output_path = inference.TFLITE_MODEL_PATHS[backend]
+        with open(output_path, 'wb') as f:
+            f.write(converter.convert())
+        written[backend] = output_path
+        print(f"✅ {backend} : {output_path} ({os.path.getsize(output_path) / 1e6:.1f} Mo)")
+
+    return written
+
+
+def _rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_backend(backend, sample_dir, n_images=100):
+    """
+    Mesure un backend dans le processus courant (appelé dans un sous-processus neuf)
+
+    Returns:
+        dict avec temps de chargement, première prédiction, latences, RSS et top-1
+    """
+    batch = load_image_batch(sample_dir, n_images)
+    rss_before = _rss_mb()
+
+    start = time.perf_counter()
+    model = inference.load_disease_model(backend=backend)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.predict(batch[:1], verbose=0)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    top1 = []
+    for img in batch:
+        start = time.perf_counter()
+        probs = model.predict(img[np.newaxis], verbose=0)
+        latencies.append((time.perf_counter() - start) * 1000)
+        top1.append(int(np.argmax(probs[0])))
+
+    return {
+        'backend': backend,
+        'n_images': len(batch),
+        'load_seconds': round(load_seconds, 3),
+        'first_prediction_ms': round(first_ms, 2),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'latency_p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'peak_rss_mb': round(_rss_mb(), 1),
+        'model_rss_mb': round(_rss_mb() - rss_before, 1),
+        'top1': top1,
+    }
+
+
+def compare_backends(sample_dir, backends=None, n_images=100, report_path=REPORT_PATH):
+    """
+    Compare les backends (chacun dans un sous-processus pour isoler la mémoire)
+    et écrit un rapport JSON avec l'accord top-1 par rapport au modèle Keras
+    """
+    backends = backends or inference.DISEASE_BACKENDS
+    results = []
+    for backend in backends:
+        output = subprocess.run(
+            [sys.executable, __file__, '_measure', backend, '--samples', sample_dir, '--n-images', str(n_images)],
+            capture_output=True, text=True
+        )
+        if output.returncode != 0:
+            print(f"⚠️ {backend} : échec de la mesure\n{output.stderr[-500:]}")
+            continue
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    reference = next((r['top1'] for r in results if r['backend'] == 'keras'), None)
+    for r in results:
+        if reference is not None:
+            r['top1_agreement'] = round(float(np.mean(np.array(r['top1']) == np.array(reference))), 4)
+        r.pop('top1')
+
+    print()
+    print(f"{'Backend':16s} {'Charg. (s)':>10s} {'1re (ms)':>9s} {'p50 (ms)':>9s} {'p95 (ms)':>9s} "
+          f"{'RSS (Mo)':>9s} {'Accord':>7s}")
+    print("-" * 76)
+    for r in results:
+        agreement = f"{100 * r['top1_agreement']:.1f}%" if 'top1_agreement' in r else 'N/A'
+        print(f"{r['backend']:16s} {r['load_seconds']:10.2f} {r['first_prediction_ms']:9.1f} "
+              f"{r['latency_p50_ms']:9.2f} {r['latency_p95_ms']:9.2f} {r['peak_rss_mb']:9.0f} {agreement:>7s}")
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'sample_dir': sample_dir, 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Rapport sauvegardé : {report_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conversion TFLite du modèle de maladie")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help="Exporter en TFLite float16/int8")
+    convert_parser.add_argument('--keras-model', default=inference.DISEASE_MODEL_PATH)
+    convert_parser.add_argument('--calibration-dir', help="Dossier d'images pour la calibration int8")
+    convert_parser.add_argument('--quantization', nargs='+', default=['float16', 'int8'],
+                                choices=['float16', 'int8'])
+    convert_parser.add_argument('--n-calibration', type=int, default=100)
+
+    compare_parser = subparsers.add_parser('compare', help="Comparer Keras et TFLite")
+    compare_parser.add_argument('--samples', required=True, help="Dossier d'images échantillon")
+    compare_parser.add_argument('--backends', nargs='+', choices=inference.DISEASE_BACKENDS)
+    compare_parser.add_argument('--n-images', type=int, default=100)
+    compare_parser.add_argument('--report', default=REPORT_PATH)
+
+    # Internal: one backend measured in a fresh process
+    measure_parser = subparsers.add_parser('_measure')
+    measure_parser.add_argument('backend', choices=inference.DISEASE_BACKENDS)
+    measure_parser.add_argument('--samples', required=True)
+    measure_parser.add_argument('--n-images', type=int, default=100)
+
+    args = parser.parse_args()
+    if args.command == 'convert':
+        quantizations = [q for q in args.quantization if q != 'int8' or args.calibration_dir]
+        if 'int8' in args.quantization and not args.calibration_dir:
+            print("⚠️ int8 ignoré : --calibration-dir requis pour la calibration")
+        convert_disease_model(args.keras_model, args.calibration_dir, quantizations, args.n_calibration)
+    elif args.command == 'compare':
+        compare_backends(args.samples, args.backends, args.n_images, args.report)
+    else:
+        print(json.dumps(measure_backend(args.backend, args.samples, args.n_images)))
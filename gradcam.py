@@ -0,0 +1,196 @@
+"""
+Explications Grad-CAM des prédictions de maladie (modèle Keras)
+
+Une vue multi-sorties du MobileNetV2 chargé renvoie, dans la même passe avant, la carte
+de caractéristiques de la dernière couche convolutive (7×7×1280) et l'entrée de la tête
+Dense. Les logits sont recalculés à partir de cette entrée, si bien que la probabilité
+renvoyée est celle du modèle, et le gradient du logit de la classe prédite donne le
+poids de chaque canal : une seule passe avant + arrière par lot, sans appel
+supplémentaire au modèle. La passe est tracée une fois (`tf.function` à signature fixe)
+et traite un lot entier.
+
+Les cartes (7×7, normalisées dans [0, 1]) sont petites : elles se mettent en cache avec
+la même clé que les probabilités (empreinte de l'image + version du modèle).
+
+Utilisation (latence ajoutée par image) :
+    python gradcam.py --batch-sizes 1 8 32 --runs 10
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from PIL import Image
+
+import inference
+import metrics
+from tiled_analysis import CLASS_COLORS
+
+OVERLAY_ALPHA = 0.55
+
+
+def find_target_layer(keras_model):
+    """Nom de la dernière couche dont la sortie est une carte (N, H, W, C)"""
+    for layer in reversed(keras_model.layers):
+        output = getattr(layer, 'output', None)
+        if output is not None and len(output.shape) == 4:
+            return layer.name
+    raise ValueError("Aucune couche convolutive dans le modèle : Grad-CAM impossible")
+
+
+class GradCamExplainer:
+    """
+    Probabilités et cartes Grad-CAM d'un lot en une passe
+
+    Args:
+        keras_model: Modèle Keras chargé (celui de `CompiledDiseaseModel.keras_model`)
+        layer_name: Couche expliquée (par défaut la dernière couche convolutive)
+    """
+
+    def __init__(self, keras_model, layer_name=None, warm_up=True):
+        import tensorflow as tf
+
+        self.layer_name = layer_name or find_target_layer(keras_model)
+        head = keras_model.layers[-1]
+        features = keras_model.get_layer(self.layer_name).output
+        if isinstance(head, tf.keras.layers.Dense):
+            # Gradients of the pre-softmax logit: softmax saturates on confident predictions
+            view = tf.keras.Model(keras_model.inputs, [features, head.input])
+
+            def forward(x):
+                feature_maps, pooled = view(x, training=False)
+                logits = tf.matmul(pooled, head.kernel) + head.bias
+                return feature_maps, logits, head.activation(logits)
+        else:
+            view = tf.keras.Model(keras_model.inputs, [features, keras_model.output])
+
+            def forward(x):
+                feature_maps, probs = view(x, training=False)
+                return feature_maps, probs, probs
+
+        def explain(x):
+            with tf.GradientTape() as tape:
+                feature_maps, scores, probs = forward(x)
+                tape.watch(feature_maps)
+                target = tf.gather(scores, tf.argmax(probs, axis=1), batch_dims=1)
+            # Each image's score only depends on its own feature map: one gradient for the batch
+            grads = tape.gradient(target, feature_maps)
+            weights = tf.reduce_mean(grads, axis=(1, 2))
+            cams = tf.nn.relu(tf.einsum('nhwc,nc->nhw', feature_maps, weights))
+            # Raw maps can peak far below any absolute epsilon (~1e-13 on the demo model):
+            # divide by the max itself, all-zero maps stay zero
+            cams = tf.math.divide_no_nan(cams, tf.reduce_max(cams, axis=(1, 2), keepdims=True))
+            return probs, cams
+
+        self._explain = tf.function(
+            explain,
+            input_signature=[tf.TensorSpec((None, *inference.IMAGE_SIZE, 3), tf.float32)],
+            autograph=False
+        )
+        if warm_up:
+            self._explain(np.zeros((1, *inference.IMAGE_SIZE, 3), dtype=np.float32))
+
+    def explain(self, batch):
+        """
+        Args:
+            batch: Tableau (N, 224, 224, 3) normalisé
+
+        Returns:
+            (probabilités (N, nb_classes), cartes (N, h, w) dans [0, 1])
+        """
+        with metrics.timer('disease_explain'):
+            probs, cams = self._explain(np.asarray(batch, dtype=np.float32))
+        return probs.numpy(), cams.numpy()
+
+
+def explain_batches(model, batch, batch_size=32, chunk_callback=None):
+    """
+    Comme `inference.predict_disease`, avec les cartes Grad-CAM
+
+    Args:
+        model: Modèle exposant `explain` (CompiledDiseaseModel, ou HotSwapModel qui en sert un)
+        chunk_callback: Appelée avec (indice de début, probabilités, cartes) après chaque lot
+
+    Returns:
+        (probabilités (N, nb_classes), cartes (N, h, w))
+    """
+    probs, cams = [], []
+    for start in range(0, len(batch), batch_size):
+        chunk_probs, chunk_cams = model.explain(batch[start:start + batch_size])
+        probs.append(chunk_probs)
+        cams.append(chunk_cams)
+        if chunk_callback is not None:
+            chunk_callback(start, chunk_probs, chunk_cams)
+    return np.concatenate(probs), np.concatenate(cams)
+
+
+def overlay(image, cam, class_name, alpha=OVERLAY_ALPHA):
+    """
+    Superpose une carte Grad-CAM à une image (vignette PIL ou pixels uint8)
+
+    Returns:
+        Image PIL RGB de la taille de `image`
+    """
+    pixels = np.asarray(image.convert('RGB') if isinstance(image, Image.Image) else image, dtype=np.float32)
+    heat = Image.fromarray(np.uint8(255 * np.clip(cam, 0, 1)), mode='L')
+    heat = np.asarray(heat.resize((pixels.shape[1], pixels.shape[0]), Image.BILINEAR), dtype=np.float32) / 255
+    weight = alpha * heat[..., np.newaxis]
+    color = np.array(CLASS_COLORS.get(class_name, (255, 0, 0)), dtype=np.float32)
+    return Image.fromarray((pixels * (1 - weight) + color * weight).astype(np.uint8))
+
+
+def measure_latency(batch_sizes=(1, 8, 32), runs=10):
+    """
+    Latence par image : prédiction seule (`CompiledDiseaseModel.predict`) vs prédiction + Grad-CAM
+
+    Returns:
+        Liste de dict par taille de lot
+    """
+    model = inference.load_disease_model(backend='keras')
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    model.explain(np.zeros((1, *inference.IMAGE_SIZE, 3), dtype=np.float32))
+    build_seconds = time.perf_counter() - start
+
+    results = []
+    for batch_size in batch_sizes:
+        batch = rng.random((batch_size, *inference.IMAGE_SIZE, 3), dtype=np.float32)
+        model.predict(batch, batch_size=batch_size)
+        model.explain(batch)
+        timings = {'predict': [], 'explain': []}
+        for _ in range(runs):
+            for mode, fn in (('predict', lambda: model.predict(batch, batch_size=batch_size)),
+                             ('explain', lambda: model.explain(batch))):
+                t0 = time.perf_counter()
+                fn()
+                timings[mode].append(time.perf_counter() - t0)
+        predict_ms = 1000 * float(np.median(timings['predict'])) / batch_size
+        explain_ms = 1000 * float(np.median(timings['explain'])) / batch_size
+        results.append({
+            'batch_size': batch_size,
+            'predict_ms_per_image': round(predict_ms, 2),
+            'explain_ms_per_image': round(explain_ms, 2),
+            'added_ms_per_image': round(explain_ms - predict_ms, 2),
+            'build_seconds': round(build_seconds, 2),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latence ajoutée par Grad-CAM (modèle Keras)")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help="Afficher le résultat en JSON")
+    args = parser.parse_args()
+
+    results = measure_latency(args.batch_sizes, args.runs)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"🔍 Grad-CAM (trace et échauffement : {results[0]['build_seconds']:.2f} s, une fois par modèle)")
+        print()
+        print(f"{'Lot':>5s} {'Prédiction (ms/img)':>20s} {'+ Grad-CAM (ms/img)':>20s} {'Ajout (ms/img)':>15s}")
+        print("-" * 63)
+        for r in results:
+            print(f"{r['batch_size']:5d} {r['predict_ms_per_image']:20.2f} {r['explain_ms_per_image']:20.2f} "
+                  f"{r['added_ms_per_image']:15.2f}")
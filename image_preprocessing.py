@@ -0,0 +1,217 @@
+"""
+Prétraitement des images de feuilles économe en allocations
+
+- Décodage réduit : pour les JPEG, `Image.draft` demande au décodeur une réduction
+  DCT (1/2, 1/4, 1/8) qui atterrit près de 224×224 au lieu de décoder une photo de
+  12 Mpx en pleine résolution. Les autres formats utilisent `reducing_gap` au
+  redimensionnement.
+- Données en uint8 jusqu'à la frontière du modèle ; la normalisation se fait en
+  float32 (et non float64 comme `img_array / 255.0`).
+- `ImageBatchBuffer` remplit un tampon (N, 224, 224, 3) préalloué, sans pile
+  intermédiaire de tableaux.
+
+Utilisation (mesure avant/après) :
+    python image_preprocessing.py --resolution 4032x3024 --n-images 20
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import metrics
+
+IMAGE_SIZE = (224, 224)
+REDUCING_GAP = 3.0
+
+
+def decode_reduced(source, size=IMAGE_SIZE):
+    """
+    Décode une image en RGB, réduite dès le décodage quand le format le permet
+
+    Returns:
+        Image PIL RGB d'au moins `size` pixels (JPEG) ou pleine résolution (autres formats)
+    """
+    with metrics.timer('image_decode'):
+        image = Image.open(source)
+        if image.format == 'JPEG':
+            # The decoder picks the largest DCT scale that stays >= size
+            image.draft('RGB', size)
+        image.load()
+    if image.mode != "RGB":
+        with metrics.timer('image_rgb_convert'):
+            image = image.convert("RGB")
+    return image
+
+
+def to_uint8(image, size=IMAGE_SIZE, out=None):
+    """
+    Redimensionne une image PIL et renvoie ses pixels en uint8 (H, W, 3)
+
+    Args:
+        image: Image PIL RGB
+        size: Taille cible (largeur, hauteur)
+        out: Tableau uint8 (H, W, 3) préalloué à remplir (optionnel)
+    """
+    with metrics.timer('image_resize'):
+        img = image.resize(size, reducing_gap=REDUCING_GAP)
+    pixels = np.asarray(img, dtype=np.uint8)
+    if out is None:
+        return pixels
+    out[...] = pixels
+    return out
+
+
+def load_uint8(source, size=IMAGE_SIZE, out=None):
+    """Décode (réduit) et redimensionne une image en pixels uint8 (H, W, 3)"""
+    return to_uint8(decode_reduced(source, size), size, out)
+
+
+def normalize(pixels, out=None):
+    """Convertit des pixels uint8 en float32 dans [0, 1] (frontière du modèle)"""
+    with metrics.timer('image_normalize'):
+        if out is None:
+            out = np.empty(pixels.shape, dtype=np.float32)
+        np.multiply(pixels, np.float32(1 / 255), out=out, dtype=np.float32)
+    return out
+
+
+class ImageBatchBuffer:
+    """
+    Tampon préalloué (capacité, 224, 224, 3) en uint8 rempli image par image
+
+    La version float32 pour le modèle est calculée une seule fois, dans un
+    second tampon lui aussi réutilisé.
+    """
+
+    def __init__(self, capacity, size=IMAGE_SIZE):
+        self.size = size
+        self.pixels = np.empty((capacity, size[1], size[0], 3), dtype=np.uint8)
+        self._model_input = None
+        self.count = 0
+
+    @property
+    def capacity(self):
+        return len(self.pixels)
+
+    def add(self, source):
+        """Décode une image dans le prochain emplacement libre et renvoie son indice"""
+        if self.count >= self.capacity:
+            raise IndexError(f"Tampon plein ({self.capacity} images)")
+        load_uint8(source, self.size, out=self.pixels[self.count])
+        self.count += 1
+        return self.count - 1
+
+    def clear(self):
+        self.count = 0
+
+    def as_model_input(self):
+        """Vue float32 normalisée des images chargées, prête pour `predict`"""
+        if self._model_input is None:
+            self._model_input = np.empty(self.pixels.shape, dtype=np.float32)
+        return normalize(self.pixels[:self.count], out=self._model_input[:self.count])
+
+
+def legacy_preprocess(source):
+    """Ancien prétraitement de l'onglet maladie (décodage complet, float64)"""
+    image = Image.open(source)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    img = image.resize(IMAGE_SIZE)
+    img_array = np.array(img)
+    return img_array / 255.0
+
+
+def _peak_rss_mb():
+    """Pic de mémoire résidente du processus (Mo)"""
+    # VmHWM is reset by exec, unlike ru_maxrss which keeps the parent's peak
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure_method(method, image_dir):
+    """Mesure une méthode dans le processus courant : temps par image et pic de RSS ajouté"""
+    paths = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir))
+    data = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data.append(f.read())
+    rss_before = _peak_rss_mb()
+
+    start = time.perf_counter()
+    if method == 'legacy':
+        batch = np.stack([legacy_preprocess(io.BytesIO(d)) for d in data])
+    else:
+        buffer = ImageBatchBuffer(len(data))
+        for d in data:
+            buffer.add(io.BytesIO(d))
+        batch = buffer.as_model_input()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'method': method,
+        'ms_per_image': round(elapsed / len(data) * 1000, 2),
+        'peak_rss_increase_mb': round(_peak_rss_mb() - rss_before, 1),
+        'batch_dtype': str(batch.dtype),
+        'batch_mb': round(batch.nbytes / 1e6, 1),
+    }
+
+
+def compare_methods(resolution=(4032, 3024), n_images=20):
+    """Compare l'ancien et le nouveau prétraitement, chacun dans un processus neuf"""
+    from benchmark_suite import synthetic_jpeg
+
+    results = []
+    with tempfile.TemporaryDirectory() as image_dir:
+        for i in range(n_images):
+            with open(os.path.join(image_dir, f'{i:04d}.jpg'), 'wb') as f:
+                f.write(synthetic_jpeg(*resolution, seed=i))
+        for method in ('legacy', 'reduced'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--measure', method, '--image-dir', image_dir],
+                capture_output=True, text=True, check=True
+            )
+            results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesure du prétraitement d'images (ancien vs réduit/uint8)")
+    parser.add_argument('--resolution', default='4032x3024', help="Résolution des photos synthétiques (LxH)")
+    parser.add_argument('--n-images', type=int, default=20)
+    # Internal: one method measured in a fresh process
+    parser.add_argument('--measure', choices=['legacy', 'reduced'], help=argparse.SUPPRESS)
+    parser.add_argument('--image-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(_measure_method(args.measure, args.image_dir)))
+        sys.exit(0)
+
+    resolution = tuple(int(v) for v in args.resolution.lower().split('x'))
+
+    print(f"🖼️  {args.n_images} photos JPEG {resolution[0]}x{resolution[1]} → lot {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]}")
+    print()
+    print(f"{'Méthode':10s} {'ms/image':>10s} {'Pic RSS (Mo)':>13s} {'Lot':>18s}")
+    print("-" * 55)
+    results = compare_methods(resolution, args.n_images)
+    for r in results:
+        print(f"{r['method']:10s} {r['ms_per_image']:10.2f} {r['peak_rss_increase_mb']:13.1f} "
+              f"{r['batch_dtype'] + ' ' + str(r['batch_mb']) + ' Mo':>18s}")
+    legacy, reduced = results
+    print()
+    print(f"✅ Temps par image : {legacy['ms_per_image'] / reduced['ms_per_image']:.1f}x plus rapide, "
+          f"pic mémoire : {legacy['peak_rss_increase_mb'] - reduced['peak_rss_increase_mb']:.1f} Mo de moins")
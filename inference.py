@@ -0,0 +1,397 @@
+"""
+Logique d'inférence partagée (maladies et rendement)
+Utilisable depuis l'application Streamlit, le service HTTP ou des scripts batch
+"""
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import joblib
+
+import image_preprocessing
+import metrics
+
+DISEASE_MODEL_PATH = 'models/maize_mobilenetv2_model.keras'
+TFLITE_MODEL_PATHS = {
+    'tflite-float16': 'models/maize_mobilenetv2_model_float16.tflite',
+    'tflite-int8': 'models/maize_mobilenetv2_model_int8.tflite',
+}
+# Small screening model of the cascade backend (see cascade.py)
+SCREENING_MODEL_PATH = 'models/maize_screening_model.keras'
+DISEASE_BACKENDS = ['keras'] + list(TFLITE_MODEL_PATHS) + ['cascade']
+YIELD_MODEL_PATH = 'models/yield_prediction_model.pkl'
+YIELD_MMAP_PATH = 'models/yield_prediction_model.mmap'
+YIELD_ARTIFACTS = ['pickle', 'mmap']
+INPUT_COLUMNS_PATH = 'models/model_input_columns.pkl'
+
+IMAGE_SIZE = (224, 224)
+
+# Class Names (Must match training order)
+CLASS_NAMES = ['Blight', 'Common_Rust', 'Gray_Leaf_Spot', 'Healthy']
+CLASS_TRANSLATIONS = {
+    'Blight': 'Helminthosporiose (Blight)',
+    'Common_Rust': 'Rouille Commune',
+    'Gray_Leaf_Spot': 'Tache Grise (Gray Leaf Spot)',
+    'Healthy': 'Saine'
+}
+
+# Below this confidence (%) the image is reported as "non reconnue"
+CONFIDENCE_THRESHOLD = 60
+
+
+def _load_tflite_interpreter(model_path):
+    """Crée un interpréteur TFLite, via `tflite_runtime` si disponible (sans TensorFlow complet)"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path)
+
+
+class TFLiteDiseaseModel:
+    """
+    Modèle de maladie exécuté par l'interpréteur TFLite
+
+    Expose la même méthode `predict` que le modèle Keras pour être utilisé par
+    `predict_disease` sans modification. Les modèles à entrées/sorties quantifiées
+    (int8/uint8) sont (dé)quantifiés ici.
+    """
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.interpreter = _load_tflite_interpreter(model_path)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        # One interpreter, shared by the sessions and background jobs: invoke is not thread-safe
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            self.interpreter.resize_tensor_input(self._input['index'], [batch_size, *IMAGE_SIZE, 3])
+            self.interpreter.allocate_tensors()
+            self._input = self.interpreter.get_input_details()[0]
+            self._output = self.interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        """Prédit un tableau (N, 224, 224, 3) normalisé dans [0, 1]"""
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            self._resize(len(batch))
+
+            input_dtype = self._input['dtype']
+            if input_dtype != np.float32:
+                scale, zero_point = self._input['quantization']
+                batch = np.clip(np.round(batch / scale + zero_point),
+                                np.iinfo(input_dtype).min, np.iinfo(input_dtype).max).astype(input_dtype)
+
+            self.interpreter.set_tensor(self._input['index'], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output['index'])
+
+        if output.dtype != np.float32:
+            scale, zero_point = self._output['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+class CompiledDiseaseModel:
+    """
+    Modèle Keras exécuté par une `tf.function` à signature fixe (None, 224, 224, 3)
+
+    Une seule trace sert toutes les tailles de lot ; elle est faite au chargement par
+    une passe d'échauffement sur un lot factice, pas à la première requête. Les appels
+    contournent `Model.predict` et son coût fixe (création d'un dataset, callbacks),
+    prépondérant pour une image seule.
+    """
+
+    def __init__(self, keras_model, warm_up=True):
+        import tensorflow as tf
+        self.keras_model = keras_model
+        # autograph is useless for a plain forward pass and cannot parse lambdas
+        self._forward = tf.function(
+            lambda x: keras_model(x, training=False),
+            input_signature=[tf.TensorSpec((None, *IMAGE_SIZE, 3), tf.float32)],
+            autograph=False
+        )
+        self.warm_up_seconds = None
+        self._explainer = None
+        self._explainer_lock = threading.Lock()
+        if warm_up:
+            self.warm_up()
+
+    def warm_up(self, batch_size=1):
+        """Trace la fonction et alloue ses tampons avec un lot factice"""
+        start = time.perf_counter()
+        with metrics.timer('disease_warm_up'):
+            self._forward(np.zeros((batch_size, *IMAGE_SIZE, 3), dtype=np.float32))
+        self.warm_up_seconds = time.perf_counter() - start
+
+    def predict(self, batch, batch_size=32, verbose=0):
+        """Prédit un tableau (N, 224, 224, 3) normalisé, par tranches de `batch_size`"""
+        batch = np.asarray(batch, dtype=np.float32)
+        batch_size = batch_size or 32
+        if len(batch) <= batch_size:
+            return self._forward(batch).numpy()
+        return np.concatenate([self._forward(batch[start:start + batch_size]).numpy()
+                               for start in range(0, len(batch), batch_size)])
+
+    def explain(self, batch):
+        """
+        Probabilités et cartes Grad-CAM d'un lot en une passe (voir gradcam.py)
+
+        L'explication est tracée au premier appel seulement.
+        """
+        if self._explainer is None:
+            with self._explainer_lock:
+                if self._explainer is None:
+                    from gradcam import GradCamExplainer
+                    self._explainer = GradCamExplainer(self.keras_model)
+        return self._explainer.explain(batch)
+
+
+def load_disease_model(model_path=DISEASE_MODEL_PATH, backend='keras', compiled=True):
+    """
+    Charge le modèle de détection de maladies
+
+    Args:
+        model_path: Chemin du modèle Keras (backend 'keras')
+        backend: 'keras', 'tflite-float16', 'tflite-int8' ou 'cascade'
+        compiled: Envelopper le modèle Keras dans un `CompiledDiseaseModel` échauffé
+    """
+    with metrics.timer('disease_model_load'):
+        if backend == 'keras':
+            import tensorflow as tf
+            model = tf.keras.models.load_model(model_path)
+            return CompiledDiseaseModel(model) if compiled else model
+        if backend in TFLITE_MODEL_PATHS:
+            return TFLiteDiseaseModel(TFLITE_MODEL_PATHS[backend])
+        if backend == 'cascade':
+            from cascade import load_cascade_model
+            return load_cascade_model(full_path=model_path)
+    raise ValueError(f"Backend inconnu : {backend} (attendu : {', '.join(DISEASE_BACKENDS)})")
+
+
+def disease_model_path(backend='keras'):
+    """
+    Chemin du fichier modèle d'un backend (vérifiable sans importer TensorFlow)
+
+    Pris dans la version active du registre (models/registry/disease) s'il y en a une.
+    """
+    from model_registry import active_file
+
+    if backend == 'cascade':
+        path = SCREENING_MODEL_PATH
+    else:
+        path = DISEASE_MODEL_PATH if backend == 'keras' else TFLITE_MODEL_PATHS[backend]
+    return active_file('disease', path) or path
+
+
+def model_artifact_version(backend='keras'):
+    """
+    Identifiant de version de l'artefact modèle (backend, empreinte SHA-256 du contenu)
+
+    Sert de clé de cache : un nouveau fichier modèle invalide les prédictions en cache,
+    une simple copie ou un redéploiement du même fichier les conserve. L'empreinte vient
+    du manifeste (models/manifest.json) quand la taille et la date correspondent.
+    """
+    from artifact_manifest import artifact_digest
+
+    version = f"{backend}-{artifact_digest(disease_model_path(backend))[:16]}"
+    if backend == 'cascade':
+        # The answer also depends on the full model and on the escalation threshold
+        from cascade import CASCADE_THRESHOLD
+        version += f"-{artifact_digest(disease_model_path('keras'))[:16]}-t{CASCADE_THRESHOLD:g}"
+    return version
+
+
+class LazyModelLoader:
+    """
+    Charge un modèle à la première utilisation, ou dans un thread d'arrière-plan
+
+    Le chargement (et donc l'import de TensorFlow) n'a lieu qu'une fois, même si
+    plusieurs threads appellent `get` en même temps.
+    """
+
+    def __init__(self, load_fn):
+        self._load_fn = load_fn
+        self._lock = threading.Lock()
+        self._model = None
+        self.error = None
+        self.load_seconds = None
+
+    @property
+    def is_loaded(self):
+        return self._model is not None
+
+    def get(self):
+        """Renvoie le modèle, en le chargeant si nécessaire (None si le chargement échoue)"""
+        if self._model is not None or self.error is not None:
+            return self._model
+        with self._lock:
+            if self._model is None and self.error is None:
+                start = time.perf_counter()
+                try:
+                    self._model = self._load_fn()
+                except Exception as e:
+                    self.error = str(e)
+                self.load_seconds = time.perf_counter() - start
+        return self._model
+
+    def start_background(self):
+        """Lance le chargement dans un thread démon s'il n'a pas encore eu lieu"""
+        if self._model is None and self.error is None and not self._lock.locked():
+            threading.Thread(target=self.get, name="model-preload", daemon=True).start()
+
+
+def load_yield_model(model_path=YIELD_MODEL_PATH, columns_path=INPUT_COLUMNS_PATH, artifact=None,
+                     mmap_path=YIELD_MMAP_PATH):
+    """
+    Charge le pipeline de rendement et la liste de ses colonnes d'entrée
+
+    Args:
+        artifact: 'pickle' (pipeline sklearn) ou 'mmap' (forêt compilée en mémoire mappée,
+            une seule copie partagée par tous les processus) ; par défaut la variable
+            d'environnement AGRI_SMART_YIELD_ARTIFACT, sinon 'pickle'
+
+    Returns:
+        model, input_columns
+    """
+    artifact = artifact or os.environ.get('AGRI_SMART_YIELD_ARTIFACT', 'pickle')
+    if artifact not in YIELD_ARTIFACTS:
+        raise ValueError(f"Artefact de rendement inconnu : {artifact}")
+    with metrics.timer('yield_model_load'):
+        if artifact == 'mmap' and os.path.exists(model_path):
+            from yield_fast_path import matches_source
+            if not os.path.isdir(mmap_path):
+                # Models that cannot be compiled (e.g. gradient boosting) have no mmap artifact
+                warnings.warn(f"Artefact mmap absent ({mmap_path}), chargement du pickle")
+                artifact = 'pickle'
+            elif not matches_source(mmap_path, model_path):
+                # Compiled from an older pickle: never serve a previous forest
+                warnings.warn(f"Artefact mmap périmé ({mmap_path} ne correspond pas à {model_path}), "
+                              "chargement du pickle")
+                artifact = 'pickle'
+        if artifact == 'mmap':
+            from yield_fast_path import load_compiled
+            model = load_compiled(mmap_path, mmap_mode='r')
+            return model, model.input_cols
+        model = joblib.load(model_path)
+        input_columns = joblib.load(columns_path)
+    return model, input_columns
+
+
+def open_image(source):
+    """Ouvre et décode une image (chemin, fichier ou upload Streamlit)"""
+    from PIL import Image
+    # Image.open is lazy: load() does the actual decoding
+    with metrics.timer('image_decode'):
+        image = Image.open(source)
+        image.load()
+    return image
+
+
+def preprocess_image(image):
+    """Convertit une image PIL en tableau normalisé (224, 224, 3) float32"""
+    if image.mode != "RGB":
+        with metrics.timer('image_rgb_convert'):
+            image = image.convert("RGB")
+    return image_preprocessing.normalize(image_preprocessing.to_uint8(image, IMAGE_SIZE))
+
+
+def preprocess_batch(sources):
+    """
+    Décode (réduit dès le décodage) une liste d'images dans un tampon uint8 préalloué
+
+    Args:
+        sources: Chemins, fichiers ou uploads Streamlit
+
+    Returns:
+        np.ndarray (N, 224, 224, 3) float32 normalisé, prêt pour `predict_disease`
+    """
+    buffer = image_preprocessing.ImageBatchBuffer(len(sources), IMAGE_SIZE)
+    for source in sources:
+        buffer.add(source)
+    return buffer.as_model_input()
+
+
+def predict_disease(model, batch, batch_size=32, progress_callback=None, chunk_callback=None):
+    """
+    Prédit un tenseur empilé (N, 224, 224, 3) en quelques appels batchés à `predict`
+
+    Args:
+        model: Modèle de maladie chargé
+        batch: Tableau (N, 224, 224, 3) produit par `preprocess_image`
+        batch_size: Nombre d'images par appel au modèle
+        progress_callback: Fonction optionnelle appelée avec (images traitées, total)
+        chunk_callback: Fonction optionnelle appelée avec (indice de début, probabilités)
+            après chaque appel, pour publier les résultats au fil de l'eau
+
+    Returns:
+        np.ndarray (N, nb_classes) des probabilités
+    """
+    outputs = []
+    n_images = len(batch)
+    for start in range(0, n_images, batch_size):
+        chunk = batch[start:start + batch_size]
+        with metrics.timer('disease_predict'):
+            outputs.append(model.predict(chunk, batch_size=len(chunk), verbose=0))
+        if chunk_callback is not None:
+            chunk_callback(start, outputs[-1])
+        if progress_callback is not None:
+            progress_callback(min(start + batch_size, n_images), n_images)
+    return np.concatenate(outputs, axis=0)
+
+
+def interpret_disease_prediction(probs):
+    """
+    Traduit un vecteur de probabilités en résultat lisible
+
+    Returns:
+        dict avec la classe (en/fr), la confiance (%) et le drapeau `recognized`
+    """
+    class_en = CLASS_NAMES[int(np.argmax(probs))]
+    confidence = float(100 * np.max(probs))
+    return {
+        'class_en': class_en,
+        'class_fr': CLASS_TRANSLATIONS.get(class_en, class_en),
+        'confidence': confidence,
+        'recognized': confidence >= CONFIDENCE_THRESHOLD,
+    }
+
+
+def build_yield_input(input_cols, rows):
+    """
+    Construit le DataFrame attendu par le pipeline de rendement
+
+    Les colonnes absentes de `rows` restent à 0, comme dans le formulaire de l'application.
+
+    Args:
+        input_cols: Colonnes d'entrée du modèle (ordre d'entraînement)
+        rows: Un dict ou une liste de dicts {colonne: valeur}
+
+    Returns:
+        pd.DataFrame avec exactement `input_cols`
+    """
+    if isinstance(rows, dict):
+        rows = [rows]
+    with metrics.timer('yield_dataframe'):
+        input_data = pd.DataFrame(0, index=range(len(rows)), columns=input_cols)
+        values = pd.DataFrame(rows)
+        for col in input_cols:
+            if col in values.columns:
+                input_data[col] = values[col].fillna(0).to_numpy()
+    return input_data
+
+
+def predict_yield(model, input_cols, rows):
+    """Prédit le rendement (kg/ha) pour un dict ou une liste de dicts"""
+    input_data = build_yield_input(input_cols, rows)
+    with metrics.timer('yield_predict'):
+        return model.predict(input_data)
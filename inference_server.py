@@ -0,0 +1,291 @@
+"""
+Service HTTP local d'inférence avec micro-batching des requêtes concurrentes
+
+Les requêtes maladie et rendement sont regroupées en micro-lots (taille max et
+attente max en millisecondes) avant chaque appel au modèle.
+
+Utilisation :
+    python inference_server.py --port 8600 --max-batch-size 32 --max-wait-ms 10
+
+Points d'accès :
+    POST /predict/disease   corps = octets bruts de l'image (jpg/png)
+    POST /predict/yield     corps = JSON, un objet ou une liste d'objets {colonne: valeur}
+    GET  /stats             profondeur des files et statistiques de taille de lot
+    GET  /health
+
+Les corps sont limités à `AGRI_SMART_MAX_UPLOAD_MB` (413 au-delà) ; une image illisible,
+d'un format non pris en charge ou trop grande en pixels est refusée avec 422.
+"""
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import inference
+import upload_ingestion
+
+MAX_BODY_BYTES = int(upload_ingestion.MAX_UPLOAD_MB * 1e6)
+
+
+class MicroBatcher:
+    """
+    Regroupe les requêtes soumises par plusieurs threads en micro-lots
+
+    Un thread dédié attend la première requête, puis collecte les suivantes jusqu'à
+    `max_batch_size` éléments ou `max_wait_ms` millisecondes, et appelle
+    `process_batch(items)` qui doit renvoyer un résultat par élément. Si le lot
+    échoue, chaque élément est retraité seul pour isoler la requête fautive.
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=10, name="batcher"):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._n_items = 0
+        self._n_batches = 0
+        self._busy_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Ajoute un élément à la file et renvoie un `Future` de son résultat"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            start = time.perf_counter()
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    # One invalid request must not fail the whole batch
+                    for item, future in batch:
+                        try:
+                            future.set_result(self.process_batch([item])[0])
+                        except Exception as item_error:
+                            future.set_exception(item_error)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            with self._lock:
+                self._busy_seconds += time.perf_counter() - start
+                self._batch_sizes[len(batch)] += 1
+                self._n_items += len(batch)
+                self._n_batches += 1
+
+    def stats(self):
+        """Profondeur de file et statistiques de taille de lot"""
+        with self._lock:
+            n_batches = self._n_batches
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'requests': self._n_items,
+                'batches': n_batches,
+                'mean_batch_size': self._n_items / n_batches if n_batches else 0.0,
+                'largest_batch': max(self._batch_sizes, default=0),
+                'batch_size_histogram': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                'model_seconds': round(self._busy_seconds, 4),
+            }
+
+
+def make_disease_processor(model):
+    """Traite un lot d'images (octets bruts) en un seul appel batché au modèle"""
+    def process(items):
+        batch = inference.preprocess_batch([io.BytesIO(data) for data in items])
+        predictions = inference.predict_disease(model, batch, batch_size=len(batch))
+        results = []
+        for probs in predictions:
+            result = inference.interpret_disease_prediction(probs)
+            result['probabilities'] = {c: float(p) for c, p in zip(inference.CLASS_NAMES, probs)}
+            results.append(result)
+        return results
+    return process
+
+
+def make_yield_processor(model, input_cols):
+    """Concatène les lignes de toutes les requêtes du lot et les prédit en un appel"""
+    def process(items):
+        rows = [row for item in items for row in item]
+        predictions = inference.predict_yield(model, input_cols, rows)
+        results = []
+        offset = 0
+        for item in items:
+            results.append([float(p) for p in predictions[offset:offset + len(item)]])
+            offset += len(item)
+        return results
+    return process
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    server_version = "AgriSmartInference/1.0"
+    # Set by serve()
+    batchers = {}
+    request_timeout = 30.0
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        """
+        Corps de la requête, ou None après avoir répondu 400/413
+
+        La taille annoncée est vérifiée avant toute lecture.
+        """
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {'error': "En-tête Content-Length invalide"})
+            return None
+        if length > MAX_BODY_BYTES:
+            # The body is left unread: the connection cannot be reused
+            self.close_connection = True
+            self._send_json(413, {'error': f"Corps trop volumineux ({length / 1e6:.1f} Mo > "
+                                           f"{upload_ingestion.MAX_UPLOAD_MB:g} Mo)"})
+            return None
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok', 'models': sorted(self.batchers)})
+        elif self.path == '/stats':
+            self._send_json(200, {name: b.stats() for name, b in self.batchers.items()})
+        else:
+            self._send_json(404, {'error': f"Route inconnue : {self.path}"})
+
+    def do_POST(self):
+        if self.path == '/predict/disease':
+            name = 'disease'
+            item = self._read_body()
+            if item is None:
+                return
+            if not item:
+                self._send_json(400, {'error': "Corps de requête vide (image attendue)"})
+                return
+            try:
+                # Header only: format and pixel count checked before the image joins a batch
+                upload_ingestion.open_checked(item)
+            except upload_ingestion.UploadRejected as e:
+                self._send_json(422, {'error': str(e)})
+                return
+        elif self.path == '/predict/yield':
+            name = 'yield'
+            body = self._read_body()
+            if body is None:
+                return
+            try:
+                item = json.loads(body or b'null')
+            except json.JSONDecodeError as e:
+                self._send_json(400, {'error': f"JSON invalide : {e}"})
+                return
+            if isinstance(item, dict):
+                item = [item]
+            if not isinstance(item, list) or not item:
+                self._send_json(400, {'error': "Objet ou liste d'objets JSON attendu"})
+                return
+        else:
+            self._send_json(404, {'error': f"Route inconnue : {self.path}"})
+            return
+
+        batcher = self.batchers.get(name)
+        if batcher is None:
+            self._send_json(503, {'error': f"Modèle '{name}' non chargé"})
+            return
+
+        try:
+            result = batcher.submit(item).result(timeout=self.request_timeout)
+        except (ValueError, TypeError, OSError) as e:
+            # Invalid input values (unknown category, wrong type, truncated image...)
+            self._send_json(422, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+
+        if name == 'yield':
+            result = {'predictions': result}
+        self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host='127.0.0.1', port=8600, max_batch_size=32, max_wait_ms=10):
+    """Charge les modèles disponibles et démarre le serveur HTTP"""
+    batchers = {}
+
+    try:
+        disease_model = inference.load_disease_model()
+        batchers['disease'] = MicroBatcher(
+            make_disease_processor(disease_model), max_batch_size, max_wait_ms, name='disease'
+        )
+        print("✅ Modèle de maladie chargé")
+    except Exception as e:
+        print(f"⚠️ Modèle de maladie non chargé : {e}")
+
+    try:
+        yield_model, input_cols = inference.load_yield_model()
+        batchers['yield'] = MicroBatcher(
+            make_yield_processor(yield_model, input_cols), max_batch_size, max_wait_ms, name='yield'
+        )
+        print("✅ Modèle de rendement chargé")
+    except Exception as e:
+        print(f"⚠️ Modèle de rendement non chargé : {e}")
+
+    InferenceRequestHandler.batchers = batchers
+    server = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+    server.daemon_threads = True
+    print(f"🚀 Service d'inférence sur http://{host}:{port} "
+          f"(lot max={max_batch_size}, attente max={max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Service HTTP local d'inférence AGRI SMART")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=10)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.max_batch_size, args.max_wait_ms)
@@ -0,0 +1,102 @@
+"""
+Latence du modèle de maladie : `Model.predict` contre fonction compilée échauffée
+
+Pour chaque mode, dans un processus Python neuf :
+  - temps de chargement (échauffement compris pour le mode compilé)
+  - latence de la première requête (une image), telle que la voit le premier utilisateur
+  - latence en régime établi : p50/p95 pour une image, médiane pour un lot
+
+Utilisation :
+    python measure_disease_latency.py --runs 30 --batch-size 32
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import inference
+
+MODES = ('predict', 'compiled')
+REPORT_PATH = 'models/disease_latency_report.json'
+
+
+def measure_mode(mode, runs=30, batch_size=32):
+    """Mesure un mode dans le processus courant (appelé dans un sous-processus neuf)"""
+    rng = np.random.default_rng(0)
+    single = rng.random((1, *inference.IMAGE_SIZE, 3), dtype=np.float32)
+    batch = rng.random((batch_size, *inference.IMAGE_SIZE, 3), dtype=np.float32)
+
+    start = time.perf_counter()
+    model = inference.load_disease_model(compiled=(mode == 'compiled'))
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    inference.predict_disease(model, single)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        inference.predict_disease(model, single)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    batch_latencies = []
+    for _ in range(max(3, runs // 10)):
+        start = time.perf_counter()
+        inference.predict_disease(model, batch, batch_size=batch_size)
+        batch_latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'mode': mode,
+        'load_seconds': round(load_seconds, 3),
+        'first_request_ms': round(first_ms, 2),
+        'single_p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'single_p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'batch_size': batch_size,
+        'batch_median_ms': round(float(np.median(batch_latencies)), 2),
+    }
+
+
+def compare_modes(runs=30, batch_size=32, report_path=REPORT_PATH):
+    """Mesure chaque mode dans un sous-processus et écrit le rapport JSON"""
+    results = []
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, '--measure', mode, '--runs', str(runs), '--batch-size', str(batch_size)],
+            capture_output=True, text=True
+        )
+        if output.returncode != 0:
+            print(f"⚠️ {mode} : échec de la mesure\n{output.stderr[-500:]}")
+            continue
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print()
+    print(f"{'Mode':10s} {'Charg. (s)':>10s} {'1re (ms)':>9s} {'p50 (ms)':>9s} {'p95 (ms)':>9s} "
+          f"{f'Lot {batch_size} (ms)':>14s}")
+    print("-" * 66)
+    for r in results:
+        print(f"{r['mode']:10s} {r['load_seconds']:10.2f} {r['first_request_ms']:9.1f} {r['single_p50_ms']:9.2f} "
+              f"{r['single_p95_ms']:9.2f} {r['batch_median_ms']:14.1f}")
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'runs': runs, 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Rapport sauvegardé : {report_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latence du modèle de maladie (predict vs compilé)")
+    parser.add_argument('--runs', type=int, default=30, help="Requêtes unitaires en régime établi")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--report', default=REPORT_PATH)
+    # Internal: one mode measured in a fresh process
+    parser.add_argument('--measure', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_mode(args.measure, args.runs, args.batch_size)))
+    else:
+        compare_modes(args.runs, args.batch_size, args.report)
@@ -0,0 +1,149 @@
+"""
+Rapport mémoire / temps de chargement du modèle de rendement : pickle contre mmap
+
+Pour chaque format, N répliques (processus Python neufs, comme N replicas Streamlit)
+chargent le modèle, prédisent une ligne puis restent en vie pendant que le parent lit
+leur /proc/<pid>/smaps_rollup :
+  - RSS : mémoire résidente vue par chaque processus
+  - PSS : part proportionnelle (les pages partagées sont divisées entre processus)
+  - Shared_Clean : pages partagées en lecture seule (cache de pages du fichier mappé)
+
+Le chargement « à froid » est mesuré après avoir évincé les fichiers du cache de pages
+(posix_fadvise DONTNEED), le chargement « à chaud » sur les répliques suivantes.
+
+Utilisation :
+    python measure_model_memory.py --replicas 4
+    python measure_model_memory.py --export   # écrit d'abord l'artefact mmap depuis le pickle
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import inference
+
+REPORT_PATH = 'models/model_memory_report.json'
+
+REPLICA_SNIPPET = """
+import json, sys, time
+import inference
+start = time.perf_counter()
+model, cols = inference.load_yield_model(artifact={artifact!r})
+load_seconds = time.perf_counter() - start
+model.predict(inference.build_yield_input(cols, [{{'AEZONE': {zone!r}}}]))
+print(json.dumps({{'load_seconds': load_seconds}}), flush=True)
+sys.stdin.readline()
+"""
+
+
+def export_mmap_artifact(model_path=inference.YIELD_MODEL_PATH, columns_path=inference.INPUT_COLUMNS_PATH,
+                         mmap_path=inference.YIELD_MMAP_PATH):
+    """Compile le pickle existant et l'écrit au format mmap"""
+    from artifact_manifest import sha256_file
+    from yield_fast_path import compile_yield_pipeline, save_compiled
+
+    model, cols = inference.load_yield_model(model_path, columns_path, artifact='pickle')
+    return save_compiled(compile_yield_pipeline(model, cols), mmap_path, source_digest=sha256_file(model_path))
+
+
+def artifact_files(artifact):
+    if artifact == 'mmap':
+        return [os.path.join(inference.YIELD_MMAP_PATH, name) for name in os.listdir(inference.YIELD_MMAP_PATH)]
+    return [inference.YIELD_MODEL_PATH, inference.INPUT_COLUMNS_PATH]
+
+
+def evict_page_cache(paths):
+    """Retire les fichiers du cache de pages (les pages propres sont simplement oubliées)"""
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def read_smaps_rollup(pid):
+    """RSS, PSS et pages partagées d'un processus (Mo)"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': round(fields.get('Rss', 0.0), 1),
+        'pss_mb': round(fields.get('Pss', 0.0), 1),
+        'shared_clean_mb': round(fields.get('Shared_Clean', 0.0), 1),
+    }
+
+
+def measure_artifact(artifact, replicas=4, zone='Forest/Transitional'):
+    """
+    Lance `replicas` processus qui chargent le même artefact et les garde en vie
+    le temps de relever leur mémoire
+
+    Returns:
+        dict avec temps de chargement (froid/chaud) et mémoire par réplique
+    """
+    evict_page_cache(artifact_files(artifact))
+    env = dict(os.environ, PYTHONWARNINGS='ignore')
+    code = REPLICA_SNIPPET.format(artifact=artifact, zone=zone)
+    processes = []
+    load_times = []
+    try:
+        for _ in range(replicas):
+            # Started one after the other: only the first replica sees a cold page cache
+            process = subprocess.Popen(
+                [sys.executable, '-c', code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            line = process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"La réplique {artifact} s'est arrêtée avant d'être prête")
+            processes.append(process)
+            load_times.append(json.loads(line)['load_seconds'])
+        memory = [read_smaps_rollup(p.pid) for p in processes]
+    finally:
+        for process in processes:
+            process.communicate('\n')
+
+    return {
+        'artifact': artifact,
+        'replicas': replicas,
+        'artifact_bytes': sum(os.path.getsize(p) for p in artifact_files(artifact)),
+        'cold_load_seconds': round(load_times[0], 4),
+        'warm_load_seconds': round(statistics.median(load_times[1:]), 4) if replicas > 1 else None,
+        'rss_mb_per_replica': round(statistics.mean(m['rss_mb'] for m in memory), 1),
+        'pss_mb_per_replica': round(statistics.mean(m['pss_mb'] for m in memory), 1),
+        'shared_clean_mb_per_replica': round(statistics.mean(m['shared_clean_mb'] for m in memory), 1),
+        'total_pss_mb': round(sum(m['pss_mb'] for m in memory), 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mémoire et temps de chargement : pickle contre mmap")
+    parser.add_argument('--replicas', type=int, default=4, help="Nombre de processus simultanés")
+    parser.add_argument('--export', action='store_true', help="Écrire l'artefact mmap depuis le pickle")
+    parser.add_argument('--report', default=REPORT_PATH)
+    args = parser.parse_args()
+
+    if args.export or not os.path.isdir(inference.YIELD_MMAP_PATH):
+        print(f"📦 Export de l'artefact mmap : {export_mmap_artifact()}")
+
+    results = [measure_artifact(artifact, args.replicas) for artifact in inference.YIELD_ARTIFACTS]
+
+    print()
+    print(f"{'Format':8s} {'Taille (Mo)':>11s} {'Froid (ms)':>11s} {'Chaud (ms)':>11s} "
+          f"{'RSS (Mo)':>9s} {'PSS (Mo)':>9s} {'PSS total':>10s}")
+    print("-" * 76)
+    for r in results:
+        warm = f"{r['warm_load_seconds'] * 1000:11.1f}" if r['warm_load_seconds'] is not None else f"{'N/A':>11s}"
+        print(f"{r['artifact']:8s} {r['artifact_bytes'] / 1e6:11.2f} {r['cold_load_seconds'] * 1000:11.1f} {warm} "
+              f"{r['rss_mb_per_replica']:9.1f} {r['pss_mb_per_replica']:9.1f} {r['total_pss_mb']:10.1f}")
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({'replicas': args.replicas, 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Rapport sauvegardé : {args.report} ({args.replicas} répliques par format)")
@@ -0,0 +1,99 @@
+"""
+Mesure du temps de démarrage de l'application
+
+Compare, chacun dans un processus Python neuf :
+  - le temps d'import des dépendances avec et sans TensorFlow
+  - le temps jusqu'au premier rendu de app.py (via streamlit.testing) selon le mode
+    de chargement du modèle de maladie : 'eager' (ancien comportement : import de
+    TensorFlow et chargement du .keras avant le rendu) contre 'lazy' et 'background'
+
+Utilisation :
+    python measure_startup.py --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import streamlit, PIL.Image, numpy, pandas, joblib
+{extra}
+print(time.perf_counter() - start)
+"""
+
+RENDER_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app_path!r}, default_timeout=300).run()
+elapsed = time.perf_counter() - start
+assert not at.exception, [e.value for e in at.exception]
+print(elapsed, 'tensorflow' in sys.modules)
+"""
+
+
+def _run_snippet(code, env=None):
+    output = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr[-1000:])
+    return output.stdout.strip().splitlines()[-1].split()
+
+
+def measure_imports(runs=3):
+    """Temps d'import (s) des dépendances de l'application, avec et sans TensorFlow"""
+    results = {}
+    for label, extra in [('sans_tensorflow', 'import inference'), ('avec_tensorflow', 'import tensorflow')]:
+        timings = [float(_run_snippet(IMPORT_SNIPPET.format(extra=extra))[0]) for _ in range(runs)]
+        results[label] = round(statistics.median(timings), 3)
+    return results
+
+
+def measure_first_render(runs=3, modes=('eager', 'lazy', 'background'), app_path='app.py'):
+    """Temps (s) jusqu'au premier rendu complet de l'application pour chaque mode"""
+    results = {}
+    for mode in modes:
+        env = dict(os.environ, AGRI_SMART_DISEASE_PRELOAD=mode)
+        timings = []
+        tf_imported = False
+        for _ in range(runs):
+            elapsed, tf_flag = _run_snippet(RENDER_SNIPPET.format(app_path=os.path.abspath(app_path)), env)
+            timings.append(float(elapsed))
+            tf_imported = tf_flag == 'True'
+        results[mode] = {
+            'first_render_seconds': round(statistics.median(timings), 3),
+            'tensorflow_imported_at_render': tf_imported,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesure du temps de démarrage de l'application")
+    parser.add_argument('--runs', type=int, default=3, help="Nombre de mesures (médiane)")
+    parser.add_argument('--output', help="Fichier JSON optionnel pour les résultats")
+    args = parser.parse_args()
+
+    print("⏱️  Temps d'import des dépendances (médiane)")
+    print("-" * 60)
+    imports = measure_imports(args.runs)
+    for label, seconds in imports.items():
+        print(f"  {label:20s} : {seconds:.2f} s")
+    print()
+
+    print("⏱️  Temps jusqu'au premier rendu de app.py (médiane)")
+    print("-" * 60)
+    renders = measure_first_render(args.runs)
+    for mode, result in renders.items():
+        tf_status = "TensorFlow importé" if result['tensorflow_imported_at_render'] else "TensorFlow non importé"
+        print(f"  {mode:20s} : {result['first_render_seconds']:.2f} s ({tf_status})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'imports': imports, 'first_render': renders}, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Résultats sauvegardés : {args.output}")
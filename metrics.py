@@ -0,0 +1,152 @@
+"""
+Instrumentation de latence par étape (décodage, redimensionnement, predict, chargement...)
+
+Activée par `AGRI_SMART_METRICS=1` (ou `metrics.enable()`). Désactivée, `timer()`
+renvoie un contexte vide partagé : le coût se limite à un test de booléen.
+
+Les durées sont agrégées par étape (nombre, somme, p50/p95/p99 sur une fenêtre
+glissante) et exportées au format texte Prometheus :
+  - fichier : `AGRI_SMART_METRICS_FILE=metrics.prom` (réécrit après chaque requête)
+  - HTTP    : `AGRI_SMART_METRICS_PORT=9464` (GET /metrics)
+"""
+import contextlib
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+WINDOW_SIZE = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_NAME = 'agri_smart_stage_seconds'
+
+_enabled = os.environ.get('AGRI_SMART_METRICS', '0') == '1'
+_lock = threading.Lock()
+_stages = {}
+_null_timer = contextlib.nullcontext()
+
+
+class _StageStats:
+    __slots__ = ('count', 'total', 'window')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.window = deque(maxlen=WINDOW_SIZE)
+
+
+def enable(flag=True):
+    """Active ou désactive la collecte"""
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled():
+    return _enabled
+
+
+def observe(stage, seconds):
+    """Enregistre une durée (en secondes) pour une étape"""
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = _StageStats()
+        stats.count += 1
+        stats.total += seconds
+        stats.window.append(seconds)
+
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def timer(stage):
+    """Contexte qui mesure la durée d'une étape (sans effet si la collecte est désactivée)"""
+    if not _enabled:
+        return _null_timer
+    return _Timer(stage)
+
+
+def reset():
+    """Efface toutes les mesures"""
+    with _lock:
+        _stages.clear()
+
+
+def snapshot():
+    """
+    Agrège les mesures par étape
+
+    Returns:
+        dict {étape: {'count', 'sum', 'p50', 'p95', 'p99'}} (durées en secondes)
+    """
+    with _lock:
+        items = [(stage, s.count, s.total, np.array(s.window)) for stage, s in _stages.items()]
+    result = {}
+    for stage, count, total, window in sorted(items):
+        quantiles = np.quantile(window, QUANTILES) if len(window) else [0.0] * len(QUANTILES)
+        result[stage] = {'count': count, 'sum': total}
+        for q, value in zip(QUANTILES, quantiles):
+            result[stage][f'p{int(q * 100)}'] = float(value)
+    return result
+
+
+def render_prometheus():
+    """Exporte les mesures au format texte Prometheus (type summary)"""
+    lines = [
+        f"# HELP {METRIC_NAME} Durée des étapes d'inférence AGRI SMART",
+        f"# TYPE {METRIC_NAME} summary",
+    ]
+    for stage, stats in snapshot().items():
+        for q in QUANTILES:
+            lines.append(f'{METRIC_NAME}{{stage="{stage}",quantile="{q}"}} {stats[f"p{int(q * 100)}"]:.6f}')
+        lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {stats["sum"]:.6f}')
+        lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {stats["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """Écrit l'export Prometheus dans un fichier (écriture atomique)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """Sert /metrics dans un thread démon et renvoie le serveur"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
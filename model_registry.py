@@ -0,0 +1,485 @@
+"""
+Registre de modèles versionné, rechargé à chaud sans redémarrer l'application
+
+Organisation :
+    models/registry/<type>/v1/, v2/, ...   un dossier immuable par version
+    models/registry/<type>/ACTIVE          nom de la version servie (ex. « v2 »)
+    models/registry/<type>/SHADOW          version candidate en mode fantôme (optionnel)
+
+<type> vaut 'yield' (pickle, colonnes, métadonnées, artefact mmap) ou 'disease'
+(fichiers .keras / .tflite avec les mêmes noms que dans models/).
+
+`HotSwapModel` sert la version active avec la même interface que le modèle (`predict`,
+`predict_one`...). Un thread de surveillance relit les pointeurs (un `stat` toutes les
+`AGRI_SMART_REGISTRY_POLL` secondes) ; quand ACTIVE change, la nouvelle version est chargée
+en arrière-plan puis remplace l'ancienne d'une seule affectation : les requêtes en cours
+finissent sur l'ancienne, les suivantes utilisent la nouvelle. En mode fantôme, une
+fraction `AGRI_SMART_SHADOW_FRACTION` des requêtes est rejouée sur la version SHADOW dans
+un thread à part, pour comparer latences et prédictions.
+
+Utilisation :
+    python model_registry.py publish yield --activate          # depuis models/ (pickle, colonnes, mmap)
+    python model_registry.py publish disease --activate
+    python model_registry.py activate yield v2
+    python model_registry.py shadow yield v3                   # ou : shadow yield --off
+    python model_registry.py list
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import artifact_manifest
+import inference
+
+REGISTRY_DIR = os.path.join('models', 'registry')
+KINDS = ('yield', 'disease')
+ACTIVE_POINTER = 'ACTIVE'
+SHADOW_POINTER = 'SHADOW'
+POLL_INTERVAL = float(os.environ.get('AGRI_SMART_REGISTRY_POLL', 2.0))
+SHADOW_FRACTION = float(os.environ.get('AGRI_SMART_SHADOW_FRACTION', 0.1))
+# Methods returning (predictions, ...) tuples: the shadow comparison uses the first item
+_PREDICTION_FIRST = ('contributions', 'explain')
+# Files copied from models/ by `publish` (missing optional files are skipped)
+KIND_FILES = {
+    'yield': [inference.YIELD_MODEL_PATH, inference.INPUT_COLUMNS_PATH, 'models/model_metadata.json',
+              inference.YIELD_MMAP_PATH],
+    'disease': [inference.DISEASE_MODEL_PATH, *inference.TFLITE_MODEL_PATHS.values(),
+                inference.SCREENING_MODEL_PATH],
+}
+
+
+def kind_dir(kind, registry_dir=REGISTRY_DIR):
+    if kind not in KINDS:
+        raise ValueError(f"Type de modèle inconnu : {kind} (attendu : {', '.join(KINDS)})")
+    return os.path.join(registry_dir, kind)
+
+
+def list_versions(kind, registry_dir=REGISTRY_DIR):
+    """Versions publiées, de la plus ancienne à la plus récente"""
+    directory = kind_dir(kind, registry_dir)
+    if not os.path.isdir(directory):
+        return []
+    versions = [name for name in os.listdir(directory)
+                if name.startswith('v') and name[1:].isdigit() and os.path.isdir(os.path.join(directory, name))]
+    return sorted(versions, key=lambda name: int(name[1:]))
+
+
+def read_pointer(kind, pointer=ACTIVE_POINTER, registry_dir=REGISTRY_DIR):
+    """Version désignée par un pointeur (None s'il n'existe pas)"""
+    try:
+        with open(os.path.join(kind_dir(kind, registry_dir), pointer), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_pointer(kind, version, pointer=ACTIVE_POINTER, registry_dir=REGISTRY_DIR):
+    """
+    Fait pointer ACTIVE (ou SHADOW) sur `version` par remplacement atomique du fichier
+
+    Args:
+        version: Version publiée, ou None pour supprimer le pointeur (SHADOW uniquement)
+    """
+    path = os.path.join(kind_dir(kind, registry_dir), pointer)
+    if version is None:
+        if pointer == ACTIVE_POINTER:
+            raise ValueError("Le pointeur ACTIVE ne peut pas être supprimé")
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if version not in list_versions(kind, registry_dir):
+        raise ValueError(f"Version inconnue pour {kind} : {version}")
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f'.{pointer}-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, path)
+
+
+def has_active(kind, registry_dir=REGISTRY_DIR):
+    return read_pointer(kind, ACTIVE_POINTER, registry_dir) is not None
+
+
+def version_dir(kind, version, registry_dir=REGISTRY_DIR):
+    return os.path.join(kind_dir(kind, registry_dir), version)
+
+
+def active_file(kind, flat_path, registry_dir=REGISTRY_DIR):
+    """
+    Emplacement, dans la version active, du fichier qui porte le nom de `flat_path`
+
+    Returns:
+        Chemin dans le registre, ou None si le registre n'a pas de version active
+    """
+    version = read_pointer(kind, ACTIVE_POINTER, registry_dir)
+    if version is None:
+        return None
+    return os.path.join(version_dir(kind, version, registry_dir), os.path.basename(flat_path))
+
+
+def publish(kind, files=None, activate=False, registry_dir=REGISTRY_DIR):
+    """
+    Copie des fichiers modèle dans une nouvelle version immuable
+
+    Args:
+        files: Fichiers ou dossiers à publier (par défaut ceux de KIND_FILES présents)
+        activate: Faire pointer ACTIVE sur la nouvelle version
+
+    Returns:
+        Nom de la version créée (ex. 'v3')
+    """
+    files = [path for path in (files or KIND_FILES[kind]) if os.path.exists(path)]
+    if not files:
+        raise FileNotFoundError(f"Aucun fichier à publier pour {kind}")
+    directory = kind_dir(kind, registry_dir)
+    os.makedirs(directory, exist_ok=True)
+    versions = list_versions(kind, registry_dir)
+    version = f"v{int(versions[-1][1:]) + 1 if versions else 1}"
+
+    # Copied into a hidden directory first: a watcher never sees a half-written version
+    tmp_dir = tempfile.mkdtemp(dir=directory, prefix='.publish-')
+    for path in files:
+        target = os.path.join(tmp_dir, os.path.basename(os.path.normpath(path)))
+        if os.path.isdir(path):
+            shutil.copytree(path, target)
+        else:
+            shutil.copy2(path, target)
+    os.replace(tmp_dir, os.path.join(directory, version))
+
+    models_dir = os.path.dirname(os.path.normpath(registry_dir))
+    if os.path.exists(os.path.join(models_dir, artifact_manifest.MANIFEST_NAME)):
+        artifact_manifest.write_manifest(models_dir)
+    if activate:
+        write_pointer(kind, version, ACTIVE_POINTER, registry_dir)
+    return version
+
+
+class YieldVersion:
+    """Version du modèle de rendement : pipeline, colonnes et chemin rapide compilé si possible"""
+
+    def __init__(self, model, input_cols):
+        from yield_fast_path import compile_yield_pipeline
+
+        self.model = model
+        self.input_cols = input_cols
+        if hasattr(model, 'predict_one'):
+            # mmap artifact: already the compiled forest
+            self.fast = model
+            return
+        try:
+            self.fast = compile_yield_pipeline(model, input_cols)
+        except ValueError:
+            self.fast = None
+
+    def predict(self, X):
+        return self.model.predict(X)
+
+    def predict_one(self, row):
+        if self.fast is not None:
+            return self.fast.predict_one(row)
+        return float(inference.predict_yield(self.model, self.input_cols, row)[0])
+
+    def contributions(self, X):
+        """
+        (prédictions, biais, contributions par colonne) du chemin rapide
+
+        Sans forêt compilée : les prédictions du pipeline, biais et contributions à None.
+        """
+        if self.fast is None:
+            return np.asarray(inference.predict_yield(self.model, self.input_cols, X)), None, None
+        return self.fast.contributions(X)
+
+
+def load_version(kind, version, backend='keras', registry_dir=REGISTRY_DIR):
+    """Charge une version publiée (YieldVersion ou modèle de maladie du backend demandé)"""
+    directory = version_dir(kind, version, registry_dir)
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"Version absente du registre : {directory}")
+    if kind == 'yield':
+        model, cols = inference.load_yield_model(
+            os.path.join(directory, os.path.basename(inference.YIELD_MODEL_PATH)),
+            os.path.join(directory, os.path.basename(inference.INPUT_COLUMNS_PATH)),
+            mmap_path=os.path.join(directory, os.path.basename(inference.YIELD_MMAP_PATH)),
+        )
+        return YieldVersion(model, cols)
+    keras_path = os.path.join(directory, os.path.basename(inference.DISEASE_MODEL_PATH))
+    if backend in inference.TFLITE_MODEL_PATHS:
+        return inference.TFLiteDiseaseModel(
+            os.path.join(directory, os.path.basename(inference.TFLITE_MODEL_PATHS[backend])))
+    if backend == 'cascade':
+        from cascade import load_cascade_model
+        return load_cascade_model(os.path.join(directory, os.path.basename(inference.SCREENING_MODEL_PATH)),
+                                  keras_path)
+    return inference.load_disease_model(keras_path, backend)
+
+
+class _ShadowStats:
+    __slots__ = ('samples', 'errors', 'skipped', 'active_seconds', 'shadow_seconds', 'abs_delta', 'agreement')
+
+    def __init__(self):
+        self.samples = 0
+        self.errors = 0
+        self.skipped = 0
+        self.active_seconds = 0.0
+        self.shadow_seconds = 0.0
+        self.abs_delta = 0.0
+        self.agreement = 0.0
+
+
+class HotSwapModel:
+    """
+    Modèle servi depuis le registre, remplacé à chaud quand le pointeur ACTIVE change
+
+    Expose `predict`, `predict_one`, `contributions` (rendement) et `explain` (maladie) comme
+    le modèle sous-jacent, tous échantillonnés pour le mode fantôme ; les autres attributs
+    (ex. `input_cols`) sont lus sur la version active au moment de l'accès.
+
+    Args:
+        kind: 'yield' ou 'disease'
+        backend: Backend de maladie (ignoré pour le rendement)
+        poll_interval: Intervalle de surveillance des pointeurs (secondes, 0 : pas de thread)
+        shadow_fraction: Part des requêtes rejouée sur la version SHADOW
+    """
+
+    def __init__(self, kind, backend='keras', registry_dir=REGISTRY_DIR, poll_interval=POLL_INTERVAL,
+                 shadow_fraction=SHADOW_FRACTION):
+        self.kind = kind
+        self.backend = backend
+        self.registry_dir = registry_dir
+        self.shadow_fraction = shadow_fraction
+        self.swaps = 0
+        self.error = None
+        self._pointer_stamps = {}
+        self._lock = threading.Lock()
+        # Guards the (shadow, stats, executor) triple read by every request
+        self._shadow_lock = threading.Lock()
+        # (version, model) tuples, replaced in a single assignment
+        self._active = None
+        self._shadow = None
+        self._shadow_stats = _ShadowStats()
+        self._shadow_pending = threading.Event()
+        self._shadow_executor = None
+        self._stop = threading.Event()
+
+        version = read_pointer(kind, ACTIVE_POINTER, registry_dir)
+        if version is None:
+            raise FileNotFoundError(f"Aucune version active pour {kind} dans {registry_dir}")
+        self._active = (version, load_version(kind, version, backend, registry_dir))
+        self.loaded_at = time.time()
+        self.check()
+        if poll_interval > 0:
+            threading.Thread(target=self._watch, args=(poll_interval,), name=f"registry-{kind}",
+                             daemon=True).start()
+
+    @property
+    def version(self):
+        return self._active[0]
+
+    @property
+    def model(self):
+        return self._active[1]
+
+    @property
+    def shadow_version(self):
+        shadow = self._shadow
+        return shadow[0] if shadow is not None else None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._active[1], name)
+
+    def _pointer_changed(self, pointer):
+        """Vrai si le fichier pointeur a changé depuis la dernière lecture (un seul `stat`)"""
+        try:
+            stat = os.stat(os.path.join(kind_dir(self.kind, self.registry_dir), pointer))
+            stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except FileNotFoundError:
+            stamp = None
+        if self._pointer_stamps.get(pointer, 0) == stamp:
+            return False
+        self._pointer_stamps[pointer] = stamp
+        return True
+
+    def check(self):
+        """Recharge la version active (et fantôme) si leurs pointeurs ont changé"""
+        with self._lock:
+            if self._pointer_changed(ACTIVE_POINTER):
+                version = read_pointer(self.kind, ACTIVE_POINTER, self.registry_dir)
+                if version is not None and version != self._active[0]:
+                    self._swap_in(version)
+            if self._pointer_changed(SHADOW_POINTER):
+                version = read_pointer(self.kind, SHADOW_POINTER, self.registry_dir)
+                if version is None:
+                    with self._shadow_lock:
+                        self._shadow = None
+                elif self._shadow is None or version != self._shadow[0]:
+                    self._load_shadow(version)
+
+    def _swap_in(self, version):
+        # Loaded while the previous version keeps serving; the swap itself is one assignment
+        try:
+            model = load_version(self.kind, version, self.backend, self.registry_dir)
+        except Exception as e:
+            self.error = f"{version} : {e}"
+            return
+        self._active = (version, model)
+        self.loaded_at = time.time()
+        self.swaps += 1
+        self.error = None
+
+    def _load_shadow(self, version):
+        try:
+            model = load_version(self.kind, version, self.backend, self.registry_dir)
+        except Exception as e:
+            with self._shadow_lock:
+                self._shadow = None
+            self.error = f"fantôme {version} : {e}"
+            return
+        if self._shadow_executor is None:
+            self._shadow_executor = ThreadPoolExecutor(1, thread_name_prefix=f"shadow-{self.kind}")
+        # Published last: a request that sees the shadow also sees its executor and fresh stats
+        with self._shadow_lock:
+            self._shadow_stats = _ShadowStats()
+            self._shadow = (version, model)
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            self.check()
+
+    def close(self):
+        self._stop.set()
+        if self._shadow_executor is not None:
+            self._shadow_executor.shutdown(wait=False)
+
+    def _call(self, method, *args, **kwargs):
+        version, model = self._active
+        with self._shadow_lock:
+            shadow, stats, executor = self._shadow, self._shadow_stats, self._shadow_executor
+        if shadow is None or random.random() >= self.shadow_fraction:
+            return getattr(model, method)(*args, **kwargs)
+        start = time.perf_counter()
+        output = getattr(model, method)(*args, **kwargs)
+        active_seconds = time.perf_counter() - start
+        if self._shadow_pending.is_set():
+            # One replay at a time: shadow traffic never queues up behind live requests
+            stats.skipped += 1
+        else:
+            self._shadow_pending.set()
+            try:
+                executor.submit(self._replay, shadow, stats, method, args, kwargs, output, active_seconds)
+            except Exception:
+                # e.g. executor shut down by close(): the active answer is still served
+                self._shadow_pending.clear()
+                stats.errors += 1
+        return output
+
+    def _replay(self, shadow, stats, method, args, kwargs, active_output, active_seconds):
+        try:
+            start = time.perf_counter()
+            shadow_output = getattr(shadow[1], method)(*args, **kwargs)
+            shadow_seconds = time.perf_counter() - start
+            if method in _PREDICTION_FIRST:
+                # (predictions, ...) tuples: only the predictions are compared
+                active_output, shadow_output = active_output[0], shadow_output[0]
+            active = np.asarray(active_output, dtype=np.float64)
+            candidate = np.asarray(shadow_output, dtype=np.float64)
+            stats.abs_delta += float(np.mean(np.abs(active - candidate)))
+            if active.ndim == 2:
+                # Class probabilities: share of identical top-1 answers
+                stats.agreement += float(np.mean(active.argmax(axis=1) == candidate.argmax(axis=1)))
+            stats.active_seconds += active_seconds
+            stats.shadow_seconds += shadow_seconds
+            stats.samples += 1
+        except Exception:
+            stats.errors += 1
+        finally:
+            self._shadow_pending.clear()
+
+    def predict(self, *args, **kwargs):
+        return self._call('predict', *args, **kwargs)
+
+    def predict_one(self, *args, **kwargs):
+        return self._call('predict_one', *args, **kwargs)
+
+    def contributions(self, *args, **kwargs):
+        return self._call('contributions', *args, **kwargs)
+
+    def explain(self, *args, **kwargs):
+        return self._call('explain', *args, **kwargs)
+
+    def stats(self):
+        """Version active, remplacements et comparaison avec la version fantôme"""
+        result = {
+            'kind': self.kind,
+            'version': self.version,
+            'loaded_at': self.loaded_at,
+            'swaps': self.swaps,
+            'error': self.error,
+            'shadow_version': self.shadow_version,
+        }
+        with self._shadow_lock:
+            shadow, stats = self._shadow, self._shadow_stats
+        if shadow is not None:
+            n = max(stats.samples, 1)
+            result['shadow'] = {
+                'samples': stats.samples,
+                'errors': stats.errors,
+                'skipped': stats.skipped,
+                'active_ms': 1000 * stats.active_seconds / n,
+                'shadow_ms': 1000 * stats.shadow_seconds / n,
+                'mean_abs_delta': stats.abs_delta / n,
+                'top1_agreement': stats.agreement / n if self.kind == 'disease' else None,
+            }
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Registre de modèles versionné")
+    parser.add_argument('--registry-dir', default=REGISTRY_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    publish_parser = subparsers.add_parser('publish', help="Publier une nouvelle version")
+    publish_parser.add_argument('kind', choices=KINDS)
+    publish_parser.add_argument('--file', action='append', dest='files',
+                                help="Fichier ou dossier à publier (répétable, défaut : ceux de models/)")
+    publish_parser.add_argument('--activate', action='store_true')
+
+    activate_parser = subparsers.add_parser('activate', help="Changer la version active")
+    activate_parser.add_argument('kind', choices=KINDS)
+    activate_parser.add_argument('version')
+
+    shadow_parser = subparsers.add_parser('shadow', help="Version évaluée en mode fantôme")
+    shadow_parser.add_argument('kind', choices=KINDS)
+    shadow_parser.add_argument('version', nargs='?')
+    shadow_parser.add_argument('--off', action='store_true')
+
+    subparsers.add_parser('list', help="Versions publiées et pointeurs")
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        version = publish(args.kind, args.files, args.activate, args.registry_dir)
+        print(f"✅ {args.kind} {version} publiée{' et activée' if args.activate else ''} : "
+              f"{version_dir(args.kind, version, args.registry_dir)}")
+    elif args.command == 'activate':
+        write_pointer(args.kind, args.version, ACTIVE_POINTER, args.registry_dir)
+        print(f"✅ {args.kind} : version active → {args.version}")
+    elif args.command == 'shadow':
+        if not args.off and not args.version:
+            parser.error("version ou --off requis")
+        write_pointer(args.kind, None if args.off else args.version, SHADOW_POINTER, args.registry_dir)
+        print(f"✅ {args.kind} : mode fantôme {'désactivé' if args.off else '→ ' + args.version}")
+    else:
+        for kind in KINDS:
+            active = read_pointer(kind, ACTIVE_POINTER, args.registry_dir)
+            shadow = read_pointer(kind, SHADOW_POINTER, args.registry_dir)
+            versions = list_versions(kind, args.registry_dir)
+            labels = [v + (' (active)' if v == active else '') + (' (fantôme)' if v == shadow else '')
+                      for v in versions]
+            print(f"{kind:8s} : {', '.join(labels) if labels else 'aucune version'}")
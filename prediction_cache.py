@@ -0,0 +1,223 @@
+"""
+Cache des prédictions de maladie, adressé par le contenu des images
+
+La clé combine le SHA-256 des octets de l'image et la version de l'artefact modèle :
+une même photo renvoie le résultat sans repasser par le CNN, et un nouveau modèle
+invalide naturellement les anciennes entrées.
+
+Deux niveaux :
+  - mémoire : LRU borné (OrderedDict)
+  - disque (optionnel) : un fichier .npy par entrée, conservé entre les redémarrages,
+    rangé dans un sous-dossier par version de modèle. Au-delà de `max_disk_entries`
+    (`AGRI_SMART_PREDICTION_CACHE_DISK_ENTRIES`, 20 000), les entrées les moins
+    récemment lues sont supprimées ; `purge_versions` efface les modèles retirés.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_DISK_ENTRIES = int(os.environ.get('AGRI_SMART_PREDICTION_CACHE_DISK_ENTRIES', 20_000))
+# Eviction brings the disk tier down to this share of its cap, so directory scans stay rare
+DISK_EVICTION_TARGET = 0.9
+_VERSION_DIR_PREFIX = 'v-'
+
+
+def image_digest(image_bytes):
+    """SHA-256 hexadécimal des octets bruts d'une image"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class PredictionCache:
+    """
+    Cache LRU mémoire + disque optionnel des vecteurs de probabilités
+
+    Args:
+        max_entries: Nombre maximum d'entrées gardées en mémoire
+        disk_dir: Dossier du niveau disque (None pour le désactiver)
+        max_disk_entries: Nombre maximum de fichiers du niveau disque
+    """
+
+    def __init__(self, max_entries=512, disk_dir=None, max_disk_entries=MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_entries = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_entries = len(self._disk_files())
+
+    @staticmethod
+    def make_key(image_bytes, model_version):
+        """Clé du cache : hash du contenu de l'image + version du modèle"""
+        return PredictionCache.digest_key(image_digest(image_bytes), model_version)
+
+    @staticmethod
+    def digest_key(digest, model_version):
+        """Clé du cache à partir d'une empreinte SHA-256 déjà calculée"""
+        return f"{model_version}:{digest}"
+
+    @staticmethod
+    def _version_dir_name(model_version):
+        return _VERSION_DIR_PREFIX + hashlib.sha256(str(model_version).encode('utf-8')).hexdigest()[:16]
+
+    def _disk_path(self, key):
+        # Keys are "<model version>:<image digest>": one subdirectory per model version
+        version = key.rpartition(':')[0]
+        return os.path.join(self.disk_dir, self._version_dir_name(version),
+                            hashlib.sha256(key.encode('utf-8')).hexdigest() + '.npy')
+
+    def _version_dirs(self):
+        return [entry.path for entry in os.scandir(self.disk_dir)
+                if entry.is_dir() and entry.name.startswith(_VERSION_DIR_PREFIX)]
+
+    def _disk_files(self):
+        """(date de dernière lecture, chemin) de chaque entrée du niveau disque"""
+        files = []
+        for directory in self._version_dirs():
+            for entry in os.scandir(directory):
+                if entry.name.endswith('.npy'):
+                    try:
+                        files.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        pass
+        return files
+
+    def _evict_disk(self):
+        # One thread scans at a time; the others keep writing
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            files = sorted(self._disk_files())
+            excess = len(files) - int(self.max_disk_entries * DISK_EVICTION_TARGET)
+            for _, path in files[:max(excess, 0)]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            with self._lock:
+                self._disk_entries = len(files) - max(excess, 0)
+        finally:
+            self._evict_lock.release()
+
+    def _remember(self, key, probs):
+        # Caller holds the lock
+        self._entries[key] = probs
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Renvoie les probabilités en cache, ou None"""
+        with self._lock:
+            probs = self._entries.get(key)
+            if probs is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return probs
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                probs = np.load(path)
+                # Eviction removes the least recently read entries first
+                os.utime(path)
+            except (FileNotFoundError, ValueError, OSError):
+                probs = None
+            if probs is not None:
+                probs.setflags(write=False)
+                with self._lock:
+                    self._remember(key, probs)
+                    self.disk_hits += 1
+                return probs
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, probs):
+        """Enregistre un vecteur de probabilités (mémoire, puis disque si activé)"""
+        probs = np.array(probs, dtype=np.float32)
+        probs.setflags(write=False)
+        with self._lock:
+            self._remember(key, probs)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            is_new = not os.path.exists(path)
+            # Atomic write: readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, probs)
+                os.replace(tmp_path, path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return
+            if is_new:
+                with self._lock:
+                    self._disk_entries += 1
+                    over_cap = self._disk_entries > self.max_disk_entries
+                if over_cap:
+                    self._evict_disk()
+
+    def clear(self, disk=False):
+        """Vide le niveau mémoire, et le niveau disque si `disk`"""
+        with self._lock:
+            self._entries.clear()
+        if disk and self.disk_dir:
+            for directory in self._version_dirs():
+                shutil.rmtree(directory, ignore_errors=True)
+            with self._lock:
+                self._disk_entries = 0
+
+    def purge_versions(self, keep_versions):
+        """
+        Supprime les entrées (mémoire et disque) des versions de modèle absentes de `keep_versions`
+
+        Returns:
+            Nombre d'entrées supprimées
+        """
+        keep_versions = {str(version) for version in keep_versions}
+        with self._lock:
+            for key in [key for key in self._entries if key.rpartition(':')[0] not in keep_versions]:
+                del self._entries[key]
+        if not self.disk_dir:
+            return 0
+        kept = {self._version_dir_name(version) for version in keep_versions}
+        removed = 0
+        for directory in self._version_dirs():
+            if os.path.basename(directory) in kept:
+                continue
+            removed += sum(1 for name in os.listdir(directory) if name.endswith('.npy'))
+            shutil.rmtree(directory, ignore_errors=True)
+        with self._lock:
+            self._disk_entries = max(self._disk_entries - removed, 0)
+        return removed
+
+    def stats(self):
+        """Compteurs de succès/échecs et taille courante"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'disk_entries': self._disk_entries if self.disk_dir else None,
+                'max_disk_entries': self.max_disk_entries if self.disk_dir else None,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -4,6 +4,7 @@ Utiliser ce script lors de l'entraînement pour éviter les problèmes de compat
 """
 import joblib
 import json
+import os
 from datetime import datetime
 import sklearn
 import pandas as pd
@@ -11,7 +12,9 @@ import numpy as np
 import sys
 
 def save_model_with_metadata(model, input_columns, model_path='models/yield_prediction_model.pkl', 
-                             metadata_path='models/model_metadata.json'):
+                             metadata_path='models/model_metadata.json', mmap_artifact=False,
+                             mmap_path=None, training_metadata=None,
+                             columns_path='models/model_input_columns.pkl'):
     """
     Sauvegarde un modèle avec ses métadonnées de version
     
@@ -20,11 +23,21 @@ def save_model_with_metadata(model, input_columns, model_path='models/yield_pred
         input_columns: Liste des colonnes d'entrée
         model_path: Chemin pour sauvegarder le modèle
         metadata_path: Chemin pour sauvegarder les métadonnées
+        mmap_artifact: Écrire aussi la forêt compilée en tableaux .npy (partageables en mmap)
+        mmap_path: Dossier de l'artefact mmap (par défaut à côté de model_path, en .mmap)
+        training_metadata: Informations d'entraînement (temps, mémoire, scores de validation croisée)
+        columns_path: Chemin pour sauvegarder les colonnes d'entrée
     """
     
-    # Sauvegarder le modèle
-    joblib.dump(model, model_path)
-    joblib.dump(input_columns, 'models/model_input_columns.pkl')
+    import artifact_manifest
+
+    if mmap_path is None:
+        mmap_path = os.path.splitext(model_path)[0] + '.mmap'
+
+    # Sauvegarder le modèle (non compressé : les tableaux NumPy restent mappables)
+    joblib.dump(model, model_path, compress=0)
+    joblib.dump(input_columns, columns_path)
+    model_digest = artifact_manifest.sha256_file(model_path)
     
     # Créer les métadonnées
     metadata = {
@@ -38,28 +51,59 @@ def save_model_with_metadata(model, input_columns, model_path='models/yield_pred
             'numpy': np.__version__
         },
         'input_columns': input_columns,
-        'model_type': type(model).__name__
+        'columns_path': columns_path,
+        'model_type': type(model).__name__,
+        'model_sha256': model_digest
     }
+    if hasattr(model, 'named_steps') and 'regressor' in model.named_steps:
+        metadata['regressor_type'] = type(model.named_steps['regressor']).__name__
+    
+    if training_metadata is not None:
+        metadata['training'] = training_metadata
+    
+    if mmap_artifact:
+        from yield_fast_path import compile_yield_pipeline, save_compiled
+        try:
+            save_compiled(compile_yield_pipeline(model, input_columns), mmap_path, source_digest=model_digest)
+            metadata['mmap_artifact'] = mmap_path
+        except ValueError as e:
+            # Not a forest (e.g. gradient boosting)
+            print(f"⚠️ Pas d'artefact mmap pour ce modèle : {e}")
+            mmap_artifact = False
     
     # Sauvegarder les métadonnées
     with open(metadata_path, 'w', encoding='utf-8') as f:
         json.dump(metadata, f, indent=2, ensure_ascii=False)
     
+    # Refresh the artifact manifest if the models directory has one
+    models_dir = os.path.dirname(model_path) or '.'
+    if os.path.exists(os.path.join(models_dir, artifact_manifest.MANIFEST_NAME)):
+        artifact_manifest.write_manifest(models_dir)
+        print(f"✅ Manifeste des artefacts mis à jour : {os.path.join(models_dir, artifact_manifest.MANIFEST_NAME)}")
+    
     print(f"✅ Modèle sauvegardé : {model_path}")
+    if mmap_artifact:
+        print(f"✅ Artefact mmap sauvegardé : {mmap_path}")
     print(f"✅ Métadonnées sauvegardées : {metadata_path}")
     print(f"\nVersions enregistrées :")
     for pkg, version in metadata['package_versions'].items():
         print(f"  - {pkg}: {version}")
 
 def load_model_with_version_check(model_path='models/yield_prediction_model.pkl',
-                                  metadata_path='models/model_metadata.json'):
+                                  metadata_path='models/model_metadata.json', mmap=False,
+                                  columns_path=None):
     """
     Charge un modèle et vérifie la compatibilité des versions
     
+    Args:
+        mmap: Ouvrir l'artefact mmap (forêt compilée partagée entre processus) s'il existe
+        columns_path: Colonnes d'entrée (par défaut celles enregistrées dans les métadonnées)
+    
     Returns:
         model, input_columns, warnings (list)
     """
     warnings = []
+    metadata = {}
     
     # Charger les métadonnées
     try:
@@ -89,10 +133,23 @@ def load_model_with_version_check(model_path='models/yield_prediction_model.pkl'
     except FileNotFoundError:
         warnings.append("⚠️ Fichier de métadonnées non trouvé")
     
+    if mmap:
+        mmap_path = metadata.get('mmap_artifact', os.path.splitext(model_path)[0] + '.mmap')
+        from yield_fast_path import load_compiled, matches_source
+        if not os.path.isdir(mmap_path):
+            warnings.append(f"⚠️ Artefact mmap non trouvé ({mmap_path}), chargement du pickle")
+        elif os.path.exists(model_path) and not matches_source(mmap_path, model_path):
+            warnings.append(f"⚠️ Artefact mmap périmé ({mmap_path} ne correspond pas à {model_path}), "
+                            "chargement du pickle")
+        else:
+            model = load_compiled(mmap_path, mmap_mode='r')
+            return model, model.input_cols, warnings
+    
     # Charger le modèle
     try:
-        model = joblib.load(model_path)
-        input_columns = joblib.load('models/model_input_columns.pkl')
+        model = joblib.load(model_path, mmap_mode='r' if mmap else None)
+        columns_path = columns_path or metadata.get('columns_path', 'models/model_input_columns.pkl')
+        input_columns = joblib.load(columns_path)
         return model, input_columns, warnings
     except Exception as e:
         return None, None, warnings + [f"❌ Erreur de chargement: {str(e)}"]
@@ -106,3 +163,6 @@ if __name__ == "__main__":
     print("\nUtilisation dans votre application :")
     print("  from save_model_with_metadata import load_model_with_version_check")
     print("  model, cols, warnings = load_model_with_version_check()")
+    print("\nArtefact partagé entre processus (mmap) :")
+    print("  save_model_with_metadata(model, X.columns.tolist(), mmap_artifact=True)")
+    print("  model, cols, warnings = load_model_with_version_check(mmap=True)")
@@ -0,0 +1,509 @@
+"""
+Analyse par tuiles des images de parcelles (drone, mosaïques)
+
+Une image de parcelle est découpée en tuiles 224×224 qui se chevauchent, produites par
+un générateur bande par bande, puis notées par lots par le modèle de maladie. Le
+résultat est une grille de probabilités (une case par tuile), d'où l'on tire une carte
+de chaleur par classe superposée à l'image et un résumé à l'échelle de la parcelle.
+
+Lecture des pixels :
+  - `.npy` (uint8, H×W×3 ou H×W×4) et images non compressées (TIFF brut, BMP, PPM) :
+    fichier mappé en mémoire, seules les bandes en cours d'analyse sont résidentes
+    (les lignes déjà traitées sont rendues au noyau avec `madvise`). La mémoire reste
+    bornée quelle que soit la taille de l'image.
+  - Autres formats (JPEG, PNG, TIFF compressé) : décodage complet par PIL, la mémoire
+    croît avec la taille de l'image. Convertir en `.npy` les très grandes mosaïques.
+
+Utilisation :
+    python tiled_analysis.py parcelle.npy --overlap 32 --output-dir field_analysis
+    python tiled_analysis.py --scaling 2000 4000 8000   # débit et pic mémoire selon la taille
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import image_preprocessing
+import inference
+import metrics
+
+TILE_SIZE = 224
+TILE_OVERLAP = 32
+TILE_BATCH_SIZE = 32
+PREVIEW_MAX_SIDE = 1024
+# Limits for field images uploaded through the app (the CLI reads local files without limit)
+MAX_FIELD_UPLOAD_MB = float(os.environ.get('AGRI_SMART_MAX_FIELD_UPLOAD_MB', 500))
+MAX_FIELD_MEGAPIXELS = float(os.environ.get('AGRI_SMART_MAX_FIELD_MEGAPIXELS', 400))
+OUTPUT_DIR = 'field_analysis'
+# Overlay colour per class (RGB)
+CLASS_COLORS = {
+    'Blight': (230, 81, 0),
+    'Common_Rust': (198, 40, 40),
+    'Gray_Leaf_Spot': (94, 53, 177),
+    'Healthy': (46, 125, 50),
+}
+
+
+class FieldRaster:
+    """
+    Pixels RGB uint8 (H, W, 3) d'une image de parcelle, mappés en mémoire si possible
+
+    Args:
+        pixels: Tableau (H, W, 3) uint8, éventuellement une vue sur `mapping`
+        mapping: Objet `mmap.mmap` sous-jacent (None si l'image est décodée en mémoire)
+        data_offset: Position des pixels dans le fichier mappé (octets)
+        row_stride: Octets par ligne dans le fichier mappé
+        bottom_up: Lignes stockées de bas en haut (BMP)
+    """
+
+    def __init__(self, pixels, mapping=None, data_offset=0, row_stride=0, bottom_up=False):
+        self.pixels = pixels
+        self._mapping = mapping
+        self._data_offset = data_offset
+        self._row_stride = row_stride
+        self._bottom_up = bottom_up
+
+    @property
+    def height(self):
+        return self.pixels.shape[0]
+
+    @property
+    def width(self):
+        return self.pixels.shape[1]
+
+    @property
+    def is_mapped(self):
+        return self._mapping is not None
+
+    def release_rows(self, end):
+        """Rend au noyau les pages des lignes [0, end) déjà analysées (fichier mappé uniquement)"""
+        if self._mapping is None or end <= 0 or not hasattr(self._mapping, 'madvise'):
+            return
+        if self._bottom_up:
+            start_byte = self._data_offset + (self.height - end) * self._row_stride
+        else:
+            start_byte = self._data_offset
+        end_byte = start_byte + end * self._row_stride
+        # madvise works on whole pages: shrink the range to pages fully inside it
+        start_byte = -(-start_byte // mmap.PAGESIZE) * mmap.PAGESIZE
+        end_byte = end_byte // mmap.PAGESIZE * mmap.PAGESIZE
+        if end_byte > start_byte:
+            self._mapping.madvise(mmap.MADV_DONTNEED, start_byte, end_byte - start_byte)
+
+    def preview(self, max_side=PREVIEW_MAX_SIDE):
+        """Aperçu sous-échantillonné (pas entier) de l'image, en uint8 contigu"""
+        step = max(1, math.ceil(max(self.height, self.width) / max_side))
+        preview = np.ascontiguousarray(self.pixels[::step, ::step])
+        self.release_rows(self.height)
+        return preview, step
+
+    def close(self):
+        self.pixels = None
+        if self._mapping is not None:
+            try:
+                self._mapping.close()
+            except BufferError:
+                # Tile views still alive elsewhere: the mapping is released with them
+                pass
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _map_file(path, offset, height, row_stride):
+    """Mappe `height` lignes de `row_stride` octets à partir de `offset`, en lecture seule"""
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    rows = np.frombuffer(mapping, dtype=np.uint8, count=height * row_stride, offset=offset)
+    return mapping, rows.reshape(height, row_stride)
+
+
+def _open_npy(path):
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if dtype != np.uint8 or fortran_order or len(shape) != 3 or shape[2] not in (3, 4):
+        raise ValueError(f"{path} : tableau uint8 (H, W, 3|4) en ordre C attendu, "
+                         f"reçu {dtype} {shape}{' (Fortran)' if fortran_order else ''}")
+    height, width, channels = shape
+    mapping, rows = _map_file(path, offset, height, width * channels)
+    pixels = rows.reshape(height, width, channels)[..., :3]
+    return FieldRaster(pixels, mapping, offset, width * channels)
+
+
+def _open_raw_image(path, image):
+    """
+    Mappe directement les pixels d'une image non compressée (TIFF brut, BMP, PPM)
+
+    Returns:
+        FieldRaster, ou None si le fichier n'est pas un RGB brut contigu
+    """
+    if image.mode != 'RGB' or not image.tile:
+        return None
+    width, height = image.size
+    first = image.tile[0]
+    args = (first.args,) if isinstance(first.args, str) else tuple(first.args)
+    rawmode = args[0]
+    row_stride = args[1] if len(args) > 1 and args[1] else width * 3
+    orientation = args[2] if len(args) > 2 else 1
+    if rawmode not in ('RGB', 'BGR') or row_stride < width * 3:
+        return None
+    # Multi-strip TIFFs are fine as long as the strips follow each other in the file
+    for tile in image.tile:
+        top = tile.extents[1]
+        if (tile.codec_name != 'raw' or tile.args != first.args
+                or tile.offset != first.offset + top * row_stride):
+            return None
+    mapping, rows = _map_file(path, first.offset, height, row_stride)
+    pixels = rows[:, :width * 3].reshape(height, width, 3)
+    if orientation < 0:
+        pixels = pixels[::-1]
+    if rawmode == 'BGR':
+        pixels = pixels[..., ::-1]
+    return FieldRaster(pixels, mapping, first.offset, row_stride, bottom_up=orientation < 0)
+
+
+def _check_megapixels(width, height, max_megapixels):
+    from upload_ingestion import UploadRejected
+
+    megapixels = width * height / 1e6
+    if max_megapixels is not None and megapixels > max_megapixels:
+        raise UploadRejected(f"Image de parcelle trop grande ({width}×{height}, {megapixels:.0f} Mpx > "
+                             f"{max_megapixels:g} Mpx)")
+
+
+def open_raster(path, max_megapixels=None):
+    """
+    Ouvre une image de parcelle, mappée en mémoire si le format le permet
+
+    Args:
+        path: Chemin d'un fichier `.npy` ou d'une image lisible par PIL
+        max_megapixels: Taille maximale, vérifiée avant tout décodage (None : pas de limite)
+
+    Returns:
+        FieldRaster (à fermer avec `close()` ou dans un bloc `with`)
+
+    Raises:
+        UploadRejected: Image plus grande que `max_megapixels`
+    """
+    if path.lower().endswith('.npy'):
+        raster = _open_npy(path)
+        try:
+            _check_megapixels(raster.width, raster.height, max_megapixels)
+        except Exception:
+            raster.close()
+            raise
+        return raster
+    try:
+        image = Image.open(path)
+    except Image.DecompressionBombError as e:
+        from upload_ingestion import UploadRejected
+        raise UploadRejected(f"Image de parcelle refusée (bombe de décompression) : {e}") from e
+    with image:
+        # Header dimensions: a compressed mosaic is rejected before it is decoded
+        _check_megapixels(image.width, image.height, max_megapixels)
+        raster = _open_raw_image(path, image)
+        if raster is not None:
+            return raster
+        with metrics.timer('image_decode'):
+            pixels = np.asarray(image.convert('RGB'))
+    return FieldRaster(pixels)
+
+
+def tile_starts(length, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Positions de départ des tuiles sur un axe ; la dernière tuile est alignée sur le bord
+
+    Returns:
+        Liste d'entiers (une seule position 0 si l'axe est plus court qu'une tuile)
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"Chevauchement invalide : {overlap} (0 <= chevauchement < {tile_size})")
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size + 1, tile_size - overlap))
+    if starts[-1] + tile_size < length:
+        starts.append(length - tile_size)
+    return starts
+
+
+def iter_tiles(raster, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Générateur de tuiles, bande par bande, dans l'ordre des lignes
+
+    Les lignes d'une bande terminée sont libérées avant de lire la suivante.
+
+    Yields:
+        (indice de ligne, indice de colonne, vue uint8 (≤tile, ≤tile, 3))
+    """
+    ys = tile_starts(raster.height, tile_size, overlap)
+    xs = tile_starts(raster.width, tile_size, overlap)
+    for iy, y in enumerate(ys):
+        band = raster.pixels[y:y + tile_size]
+        for ix, x in enumerate(xs):
+            yield iy, ix, band[:, x:x + tile_size]
+        raster.release_rows(ys[iy + 1] if iy + 1 < len(ys) else raster.height)
+
+
+def iter_tile_batches(raster, batch_size=TILE_BATCH_SIZE, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Regroupe les tuiles en lots dans des tampons préalloués et réutilisés
+
+    Les tuiles d'une taille différente de l'entrée du modèle (bords d'une petite image,
+    `tile_size` ≠ 224) sont redimensionnées.
+
+    Yields:
+        (positions (n, 2) int, lot (n, 224, 224, 3) float32 normalisé) — le lot est
+        réécrit à l'itération suivante
+    """
+    width, height = inference.IMAGE_SIZE
+    pixels = np.empty((batch_size, height, width, 3), dtype=np.uint8)
+    model_input = np.empty(pixels.shape, dtype=np.float32)
+    positions = np.empty((batch_size, 2), dtype=np.int64)
+    count = 0
+    tiles = iter_tiles(raster, tile_size, overlap)
+    while True:
+        with metrics.timer('tile_read'):
+            for iy, ix, tile in tiles:
+                if tile.shape[:2] == (height, width):
+                    pixels[count] = tile
+                else:
+                    image_preprocessing.to_uint8(Image.fromarray(np.ascontiguousarray(tile)),
+                                                 inference.IMAGE_SIZE, out=pixels[count])
+                positions[count] = iy, ix
+                count += 1
+                if count == batch_size:
+                    break
+        if count == 0:
+            return
+        yield positions[:count], image_preprocessing.normalize(pixels[:count], out=model_input[:count])
+        count = 0
+
+
+def summarize_tiles(grid):
+    """
+    Résumé à l'échelle de la parcelle à partir de la grille de probabilités
+
+    Returns:
+        dict : part des tuiles par classe (tuiles reconnues), part non reconnue,
+        probabilités moyennes, part malade des tuiles reconnues et maladie dominante
+    """
+    probs = grid.reshape(-1, grid.shape[-1])
+    top1 = np.argmax(probs, axis=1)
+    recognized = 100 * np.max(probs, axis=1) >= inference.CONFIDENCE_THRESHOLD
+    class_fractions = {c: float(np.mean(recognized & (top1 == i))) for i, c in enumerate(inference.CLASS_NAMES)}
+    diseases = {c: f for c, f in class_fractions.items() if c != 'Healthy'}
+    n_recognized = int(recognized.sum())
+    dominant = max(diseases, key=diseases.get)
+    return {
+        'tiles': len(probs),
+        'class_fractions': class_fractions,
+        'unrecognized_fraction': float(1 - recognized.mean()),
+        'mean_probabilities': {c: float(p) for c, p in zip(inference.CLASS_NAMES, probs.mean(axis=0))},
+        # Share of the recognized tiles that show a disease
+        'affected_fraction': sum(diseases.values()) * len(probs) / n_recognized if n_recognized else 0.0,
+        'dominant_disease': dominant if diseases[dominant] > 0 else None,
+    }
+
+
+def analyze_field_image(raster, model, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                        batch_size=TILE_BATCH_SIZE, progress_callback=None):
+    """
+    Analyse une image de parcelle tuile par tuile
+
+    Args:
+        raster: FieldRaster ouvert par `open_raster`
+        model: Modèle de maladie chargé (n'importe quel moteur)
+        tile_size: Côté des tuiles en pixels de l'image
+        overlap: Chevauchement entre tuiles voisines (pixels)
+        batch_size: Tuiles par appel au modèle
+        progress_callback: Fonction optionnelle appelée avec (tuiles traitées, total)
+
+    Returns:
+        dict avec `grid` (lignes, colonnes, nb_classes), les positions des tuiles
+        (`y_starts`, `x_starts`), `summary` et le débit (`tiles_per_second`)
+    """
+    ys = tile_starts(raster.height, tile_size, overlap)
+    xs = tile_starts(raster.width, tile_size, overlap)
+    n_tiles = len(ys) * len(xs)
+    grid = np.zeros((len(ys), len(xs), len(inference.CLASS_NAMES)), dtype=np.float32)
+
+    done = 0
+    start = time.perf_counter()
+    for positions, batch in iter_tile_batches(raster, batch_size, tile_size, overlap):
+        grid[positions[:, 0], positions[:, 1]] = inference.predict_disease(model, batch, batch_size=len(batch))
+        done += len(batch)
+        if progress_callback is not None:
+            progress_callback(done, n_tiles)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'grid': grid,
+        'y_starts': ys,
+        'x_starts': xs,
+        'tile_size': tile_size,
+        'image_size': (raster.width, raster.height),
+        'summary': summarize_tiles(grid),
+        'seconds': elapsed,
+        'tiles_per_second': n_tiles / elapsed if elapsed > 0 else float('inf'),
+    }
+
+
+def class_heatmap(result, class_name, shape, step):
+    """
+    Probabilité d'une classe par pixel d'aperçu (moyenne des tuiles qui se chevauchent)
+
+    Args:
+        result: Résultat de `analyze_field_image`
+        class_name: Classe de CLASS_NAMES
+        shape: (hauteur, largeur) de l'aperçu
+        step: Pas de sous-échantillonnage de l'aperçu
+    """
+    c = inference.CLASS_NAMES.index(class_name)
+    heat = np.zeros(shape, dtype=np.float32)
+    coverage = np.zeros(shape, dtype=np.float32)
+    size = result['tile_size']
+    for iy, y in enumerate(result['y_starts']):
+        rows = slice(y // step, -(-(y + size) // step))
+        for ix, x in enumerate(result['x_starts']):
+            cols = slice(x // step, -(-(x + size) // step))
+            heat[rows, cols] += result['grid'][iy, ix, c]
+            coverage[rows, cols] += 1
+    return heat / np.maximum(coverage, 1)
+
+
+def heatmap_overlay(preview, step, result, class_name, alpha=0.6):
+    """
+    Superpose la carte de chaleur d'une classe à l'aperçu de la parcelle
+
+    Returns:
+        Image PIL RGB de la taille de l'aperçu
+    """
+    heat = class_heatmap(result, class_name, preview.shape[:2], step)[..., np.newaxis]
+    color = np.array(CLASS_COLORS.get(class_name, (255, 0, 0)), dtype=np.float32)
+    weight = alpha * heat
+    blended = preview.astype(np.float32) * (1 - weight) + color * weight
+    return Image.fromarray(blended.astype(np.uint8))
+
+
+def write_synthetic_raster(path, width, height, seed=0, band_rows=256):
+    """Écrit une mosaïque `.npy` synthétique bande par bande (mémoire bornée)"""
+    rng = np.random.default_rng(seed)
+    pixels = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(height, width, 3))
+    gradient = np.linspace(40, 200, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+    for y in range(0, height, band_rows):
+        rows = min(band_rows, height - y)
+        pixels[y:y + rows] = np.clip(gradient + rng.normal(0, 25, (rows, width, 3)), 0, 255).astype(np.uint8)
+    pixels.flush()
+    del pixels
+    return path
+
+
+def _measure_scaling_point(path, batch_size):
+    """Analyse une mosaïque dans le processus courant : débit et pic de RSS ajouté"""
+    model = inference.load_disease_model()
+    # One full batch first, so the model's own working memory is not counted
+    inference.predict_disease(model, np.zeros((batch_size, *inference.IMAGE_SIZE, 3), dtype=np.float32),
+                              batch_size=batch_size)
+    rss_before = image_preprocessing._peak_rss_mb()
+    with open_raster(path) as raster:
+        result = analyze_field_image(raster, model, batch_size=batch_size)
+        size = (raster.width, raster.height)
+    return {
+        'image': f'{size[0]}x{size[1]}',
+        'megapixels': round(size[0] * size[1] / 1e6, 1),
+        'tiles': result['summary']['tiles'],
+        'tiles_per_second': round(result['tiles_per_second'], 1),
+        'peak_rss_increase_mb': round(image_preprocessing._peak_rss_mb() - rss_before, 1),
+    }
+
+
+def measure_scaling(sides, batch_size=TILE_BATCH_SIZE):
+    """Débit et pic mémoire pour des mosaïques carrées de côtés croissants (processus neufs)"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for side in sides:
+            path = write_synthetic_raster(os.path.join(tmp, f'{side}.npy'), side, side)
+            output = subprocess.run(
+                [sys.executable, __file__, '--measure', path, '--batch-size', str(batch_size)],
+                capture_output=True, text=True, check=True
+            )
+            results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+            os.remove(path)
+    return results
+
+
+def print_summary(result):
+    summary = result['summary']
+    width, height = result['image_size']
+    print(f"\n🗺️  Image {width}x{height} : {summary['tiles']} tuiles en {result['seconds']:.1f} s "
+          f"({result['tiles_per_second']:.1f} tuiles/s)")
+    for class_name, fraction in summary['class_fractions'].items():
+        print(f"  {inference.CLASS_TRANSLATIONS[class_name]:32s} {100 * fraction:6.1f}% des tuiles")
+    print(f"  {'Non reconnue':32s} {100 * summary['unrecognized_fraction']:6.1f}% des tuiles")
+    print(f"Part malade (tuiles reconnues) : {100 * summary['affected_fraction']:.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse par tuiles d'une image de parcelle")
+    parser.add_argument('image', nargs='?', help="Image de parcelle (.npy, TIFF, PNG, JPEG...)")
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE)
+    parser.add_argument('--overlap', type=int, default=TILE_OVERLAP)
+    parser.add_argument('--batch-size', type=int, default=TILE_BATCH_SIZE)
+    parser.add_argument('--backend', default='keras', choices=inference.DISEASE_BACKENDS)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help="Résumé JSON et cartes de chaleur PNG")
+    parser.add_argument('--scaling', type=int, nargs='+', metavar='COTE',
+                        help="Mesurer débit et mémoire sur des mosaïques synthétiques de ces côtés")
+    # Internal: one scaling point measured in a fresh process
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(_measure_scaling_point(args.measure, args.batch_size)))
+        sys.exit(0)
+
+    if args.scaling:
+        print(f"{'Image':>12s} {'Mpx':>7s} {'Tuiles':>8s} {'Tuiles/s':>9s} {'Pic RSS (Mo)':>13s}")
+        print("-" * 53)
+        for r in measure_scaling(args.scaling, args.batch_size):
+            print(f"{r['image']:>12s} {r['megapixels']:7.1f} {r['tiles']:8d} {r['tiles_per_second']:9.1f} "
+                  f"{r['peak_rss_increase_mb']:13.1f}")
+        sys.exit(0)
+
+    if not args.image:
+        parser.error("une image de parcelle ou --scaling est requis")
+
+    model = inference.load_disease_model(backend=args.backend)
+    with open_raster(args.image) as raster:
+        if not raster.is_mapped:
+            print("ℹ️ Format compressé : image décodée entièrement en mémoire (convertir en .npy pour les très grandes mosaïques)")
+        result = analyze_field_image(raster, model, args.tile_size, args.overlap, args.batch_size)
+        preview, step = raster.preview()
+    print_summary(result)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for class_name in inference.CLASS_NAMES:
+        heatmap_overlay(preview, step, result, class_name).save(
+            os.path.join(args.output_dir, f'heatmap_{class_name}.png'))
+    summary_path = os.path.join(args.output_dir, 'summary.json')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump({'image': args.image, 'image_size': result['image_size'], 'tile_size': args.tile_size,
+                   'overlap': args.overlap, 'tiles_per_second': round(result['tiles_per_second'], 1),
+                   'summary': result['summary']}, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Résumé et cartes de chaleur : {args.output_dir}/")
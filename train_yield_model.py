@@ -0,0 +1,323 @@
+"""
+Entraînement du modèle de rendement sur des données d'essais réelles (CSV/Parquet)
+
+- Lecture en flux par blocs (`bulk_yield_scoring.iter_input_chunks`) : seules les
+  colonnes utiles sont gardées, en float32 / category, ce qui tient 10⁶ lignes en
+  quelques dizaines de Mo.
+- Recherche d'hyperparamètres aléatoire avec validation croisée, les ajustements étant
+  répartis sur `n_jobs` processus (sur un sous-échantillon de `search_rows` lignes),
+  puis réentraînement du meilleur modèle sur toutes les lignes avec `n_jobs` arbres en
+  parallèle.
+- La taille des arbres est bornée (`max_leaf_nodes`, `min_samples_leaf`, `max_samples`)
+  pour que la forêt tienne en mémoire sur un seul nœud, même à 10⁶ lignes.
+- Des familles plus rapides (gradient boosting, forêt peu profonde, forêt distillée) sont
+  ajustées à côté de la grande forêt et comparées sur un jeu mis de côté ; le candidat
+  retenu est sauvegardé (voir `yield_model_selection.py`).
+- Temps, pic mémoire, scores de validation croisée et rapport de sélection sont enregistrés
+  dans `model_metadata.json` (clé `training`) via `save_model_with_metadata`.
+
+Utilisation :
+    python train_yield_model.py essais.parquet --n-jobs -1 --n-iter 12 --cv 3
+    python train_yield_model.py essais.csv --synthetic 1000000   # écrit d'abord des essais synthétiques
+"""
+import argparse
+import os
+import resource
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import KFold, RandomizedSearchCV, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from bulk_yield_scoring import DEFAULT_CHUNK_SIZE, detect_format, iter_input_chunks
+from save_model_with_metadata import save_model_with_metadata
+from yield_model_selection import CANDIDATES, R2_TOLERANCE, REPORT_PATH, select_yield_model
+
+NUMERIC_FEATURES = ['PL_HT', 'E_HT', 'DY_SK', 'RUST', 'BLIGHT']
+CATEGORICAL_FEATURES = ['AEZONE']
+INPUT_COLUMNS = ['PL_HT', 'E_HT', 'DY_SK', 'AEZONE', 'RUST', 'BLIGHT']
+TARGET = 'YIELD'
+SEARCH_ROWS = 200_000
+# Rows set aside to compare the candidate models
+HOLDOUT_FRACTION = 0.1
+MAX_HOLDOUT_ROWS = 100_000
+# Every candidate bounds tree size, so a forest fitted on 10⁶ rows stays a few hundred MB
+PARAM_DISTRIBUTIONS = {
+    'regressor__n_estimators': [100, 200],
+    'regressor__max_leaf_nodes': [1024, 4096, 16384],
+    'regressor__min_samples_leaf': [1, 5, 20],
+    'regressor__max_features': [1.0, 0.6],
+    'regressor__max_samples': [0.25, 0.5, None],
+}
+SCORING = {'r2': 'r2', 'rmse': 'neg_root_mean_squared_error'}
+
+
+def synthetic_trials(n_rows, seed=42):
+    """Essais synthétiques (même formule que regenerate_model.py)"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'PL_HT': rng.integers(100, 250, n_rows),
+        'E_HT': rng.integers(50, 150, n_rows),
+        'DY_SK': rng.integers(45, 85, n_rows),
+        'AEZONE': rng.choice(['Forest/Transitional', 'Moist Savanna'], n_rows),
+        'RUST': rng.integers(1, 6, n_rows),
+        'BLIGHT': rng.integers(1, 6, n_rows),
+    })
+    df[TARGET] = (
+        df['PL_HT'] * 10 + df['E_HT'] * 8 - df['DY_SK'] * 5 - df['RUST'] * 100 - df['BLIGHT'] * 100
+        + rng.normal(3000, 500, n_rows)
+    )
+    return df
+
+
+def write_synthetic_trials(path, n_rows, chunk_size=DEFAULT_CHUNK_SIZE, seed=42):
+    """Écrit `n_rows` essais synthétiques en CSV ou Parquet, bloc par bloc"""
+    fmt = detect_format(path)
+    writer = None
+    for i, start in enumerate(range(0, n_rows, chunk_size)):
+        chunk = synthetic_trials(min(chunk_size, n_rows - start), seed=seed + i)
+        if fmt == 'csv':
+            chunk.to_csv(path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    if writer is not None:
+        writer.close()
+    return path
+
+
+def load_training_data(path, numeric_features=NUMERIC_FEATURES, categorical_features=CATEGORICAL_FEATURES,
+                       target=TARGET, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Lit un fichier d'essais par blocs en ne gardant que les colonnes utiles, compactées
+
+    Args:
+        path: Fichier .csv ou .parquet
+        chunk_size: Nombre de lignes lues par bloc
+
+    Returns:
+        X (pd.DataFrame float32 / category), y (np.ndarray float32)
+
+    Raises:
+        ValueError: si des colonnes requises sont absentes
+    """
+    columns = numeric_features + categorical_features + [target]
+    chunks = []
+    for chunk in iter_input_chunks(path, detect_format(path), chunk_size):
+        missing = [col for col in columns if col not in chunk.columns]
+        if missing:
+            raise ValueError(f"Colonnes manquantes : {', '.join(missing)}")
+        chunk = chunk[columns].dropna(subset=[target])
+        chunk[numeric_features + [target]] = chunk[numeric_features + [target]].astype(np.float32)
+        chunks.append(chunk)
+    data = pd.concat(chunks, ignore_index=True)
+    del chunks
+    for col in categorical_features:
+        data[col] = data[col].astype('category')
+    y = data.pop(target).to_numpy()
+    # Column order expected at inference (model_input_columns.pkl)
+    ordered = [col for col in INPUT_COLUMNS if col in data.columns]
+    ordered += [col for col in data.columns if col not in ordered]
+    return data[ordered], y
+
+
+def build_pipeline(numeric_features=NUMERIC_FEATURES, categorical_features=CATEGORICAL_FEATURES,
+                   **regressor_params):
+    """Pipeline StandardScaler + OneHotEncoder puis RandomForestRegressor (pris en charge par yield_fast_path)"""
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', StandardScaler(), numeric_features),
+            ('cat', OneHotEncoder(drop='first', sparse_output=False, dtype=np.float32), categorical_features)
+        ],
+        remainder='drop'
+    )
+    return Pipeline([
+        ('preprocessor', preprocessor),
+        ('regressor', RandomForestRegressor(**{'random_state': 42, **regressor_params}))
+    ])
+
+
+def peak_memory_mb():
+    """Pic de mémoire résidente (Mo) du processus et du plus gros processus de calcul terminé"""
+    process = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    process = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return {
+        'process_mb': round(process, 1),
+        'worker_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def _shutdown_workers():
+    """Arrête les processus joblib réutilisables (leur pic mémoire devient mesurable)"""
+    from joblib.externals.loky import get_reusable_executor
+    get_reusable_executor().shutdown(wait=True)
+
+
+def search_hyperparameters(X, y, n_iter=12, cv=3, n_jobs=-1, search_rows=SEARCH_ROWS, seed=42):
+    """
+    Recherche aléatoire avec validation croisée, ajustements en parallèle
+
+    Args:
+        n_iter: Nombre de combinaisons essayées
+        cv: Nombre de plis
+        n_jobs: Processus pour la recherche (-1 : tous les cœurs)
+        search_rows: Taille du sous-échantillon de recherche (None : toutes les lignes)
+
+    Returns:
+        RandomizedSearchCV ajusté (sans réentraînement final)
+    """
+    if search_rows is not None and search_rows < len(X):
+        rows = np.random.default_rng(seed).choice(len(X), search_rows, replace=False)
+        X, y = X.iloc[rows], y[rows]
+    search = RandomizedSearchCV(
+        # One core per fit: the search itself spreads the fits over n_jobs workers
+        build_pipeline(list(X.columns.intersection(NUMERIC_FEATURES)),
+                       list(X.columns.intersection(CATEGORICAL_FEATURES)), n_jobs=1),
+        PARAM_DISTRIBUTIONS, n_iter=n_iter, scoring=SCORING, refit=False,
+        cv=KFold(cv, shuffle=True, random_state=seed), n_jobs=n_jobs, random_state=seed
+    )
+    search.fit(X, y)
+    return search
+
+
+def _cv_summary(search):
+    results = search.cv_results_
+    order = np.argsort(results['rank_test_r2'])
+    candidates = [{
+        'params': {k.split('__', 1)[1]: v for k, v in results['params'][i].items()},
+        'r2_mean': round(float(results['mean_test_r2'][i]), 4),
+        'r2_std': round(float(results['std_test_r2'][i]), 4),
+        'rmse_mean': round(float(-results['mean_test_rmse'][i]), 2),
+        'fit_seconds_mean': round(float(results['mean_fit_time'][i]), 2),
+    } for i in order]
+    return candidates[0], candidates
+
+
+def train_yield_model(data_path, n_jobs=-1, n_iter=12, cv=3, search_rows=SEARCH_ROWS,
+                      chunk_size=DEFAULT_CHUNK_SIZE, seed=42, candidates=CANDIDATES,
+                      r2_tolerance=R2_TOLERANCE, report_path=REPORT_PATH):
+    """
+    Charge les essais, cherche les hyperparamètres, réentraîne la meilleure forêt puis
+    choisit entre elle et les familles alternatives
+
+    Args:
+        candidates: Candidats comparés (['forest'] : pas de sélection, forêt sur toutes les lignes)
+        r2_tolerance: Perte de R² acceptée pour un candidat plus rapide
+        report_path: Rapport de sélection JSON
+
+    Returns:
+        (pipeline entraîné, colonnes d'entrée, métadonnées d'entraînement)
+    """
+    timings = {}
+    start = time.perf_counter()
+    X, y = load_training_data(data_path, chunk_size=chunk_size)
+    timings['load_seconds'] = time.perf_counter() - start
+    print(f"📥 {len(X):,} lignes chargées en {timings['load_seconds']:.1f} s "
+          f"({(X.memory_usage(deep=True).sum() + y.nbytes) / 1e6:.1f} Mo)")
+    X_test = y_test = None
+    if list(candidates) != ['forest']:
+        X, X_test, y, y_test = train_test_split(
+            X, y, test_size=min(HOLDOUT_FRACTION, MAX_HOLDOUT_ROWS / len(X)), random_state=seed)
+
+    start = time.perf_counter()
+    search = search_hyperparameters(X, y, n_iter, cv, n_jobs, search_rows, seed)
+    timings['search_seconds'] = time.perf_counter() - start
+    best, cv_candidates = _cv_summary(search)
+    print(f"🔎 {n_iter} combinaisons × {cv} plis en {timings['search_seconds']:.1f} s : "
+          f"R² = {best['r2_mean']:.3f} ± {best['r2_std']:.3f}, RMSE = {best['rmse_mean']:,.0f} kg/ha")
+
+    start = time.perf_counter()
+    # Out-of-bag predictions are the distilled candidate's targets (one extra pass, no refits)
+    oob_score = 'distilled_forest' in candidates and X_test is not None
+    model = build_pipeline(list(X.columns.intersection(NUMERIC_FEATURES)),
+                           list(X.columns.intersection(CATEGORICAL_FEATURES)),
+                           n_jobs=n_jobs, oob_score=oob_score, **best['params'])
+    model.fit(X, y)
+    # The app predicts one row at a time: thread fan-out would only add overhead
+    model.set_params(regressor__n_jobs=None)
+    timings['refit_seconds'] = time.perf_counter() - start
+    print(f"🌲 Réentraînement sur {len(X):,} lignes en {timings['refit_seconds']:.1f} s")
+
+    selection = None
+    if X_test is not None:
+        start = time.perf_counter()
+        model, selection = select_yield_model(model, list(X.columns), X, y, X_test, y_test, candidates,
+                                              n_jobs, r2_tolerance, report_path)
+        timings['selection_seconds'] = time.perf_counter() - start
+    regressor = model.named_steps['regressor']
+    if hasattr(regressor, 'oob_prediction_'):
+        # One float per training row, only needed for distillation: kept out of the pickle
+        del regressor.oob_prediction_
+
+    _shutdown_workers()
+    training = {
+        'data_path': data_path,
+        'n_rows': len(X) + (len(X_test) if X_test is not None else 0),
+        'train_rows': len(X),
+        'n_jobs': n_jobs,
+        'cpu_count': os.cpu_count(),
+        'search_rows': min(search_rows or len(X), len(X)),
+        'cv_folds': cv,
+        'n_iter': n_iter,
+        'best_params': best['params'],
+        'cv_scores': {'r2_mean': best['r2_mean'], 'r2_std': best['r2_std'], 'rmse_mean': best['rmse_mean']},
+        'cv_candidates': cv_candidates,
+        **{k: round(v, 2) for k, v in timings.items()},
+        'wall_seconds': round(sum(timings.values()), 2),
+        'peak_memory_mb': peak_memory_mb(),
+    }
+    if selection is not None:
+        training['selected_model'] = selection['selected']
+        training['model_selection'] = selection
+    return model, list(X.columns), training
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement du modèle de rendement (CSV/Parquet, parallèle)")
+    parser.add_argument('data', help="Fichier d'essais (.csv ou .parquet) avec la colonne YIELD")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Processus / arbres en parallèle (-1 : tous les cœurs)")
+    parser.add_argument('--n-iter', type=int, default=12, help="Combinaisons d'hyperparamètres essayées")
+    parser.add_argument('--cv', type=int, default=3, help="Nombre de plis de validation croisée")
+    parser.add_argument('--search-rows', type=int, default=SEARCH_ROWS,
+                        help="Lignes utilisées pour la recherche (0 : toutes)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--candidates', nargs='+', default=CANDIDATES, choices=CANDIDATES,
+                        help="Familles comparées (forest seule : pas de sélection)")
+    parser.add_argument('--r2-tolerance', type=float, default=R2_TOLERANCE,
+                        help="Perte de R² acceptée pour un modèle plus rapide")
+    parser.add_argument('--report', default=REPORT_PATH, help="Rapport de sélection JSON")
+    parser.add_argument('--synthetic', type=int, metavar='N', help="Écrire d'abord N essais synthétiques dans DATA")
+    parser.add_argument('--mmap', action='store_true', help="Écrire aussi l'artefact mmap (forêt compilée)")
+    parser.add_argument('--model', default='models/yield_prediction_model.pkl')
+    parser.add_argument('--columns', default='models/model_input_columns.pkl')
+    parser.add_argument('--metadata', default='models/model_metadata.json')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        print(f"🧪 Écriture de {args.synthetic:,} essais synthétiques : {args.data}")
+        write_synthetic_trials(args.data, args.synthetic, args.chunk_size)
+
+    model, input_columns, training = train_yield_model(
+        args.data, args.n_jobs, args.n_iter, args.cv, args.search_rows or None, args.chunk_size,
+        candidates=args.candidates, r2_tolerance=args.r2_tolerance, report_path=args.report
+    )
+    print(f"⏱️  Temps total : {training['wall_seconds']:.1f} s, pic mémoire : "
+          f"{training['peak_memory_mb']['process_mb']:.0f} Mo (processus), "
+          f"{training['peak_memory_mb']['worker_mb']:.0f} Mo (plus gros processus de calcul)")
+    save_model_with_metadata(model, input_columns, args.model, args.metadata,
+                             mmap_artifact=args.mmap, mmap_path=os.path.splitext(args.model)[0] + '.mmap',
+                             training_metadata=training, columns_path=args.columns)
@@ -0,0 +1,256 @@
+"""
+Réception des photos téléversées à mémoire bornée
+
+- Limites vérifiées avant tout décodage : taille en octets (`AGRI_SMART_MAX_UPLOAD_MB`,
+  20 Mo) puis nombre de pixels lu dans l'en-tête (`AGRI_SMART_MAX_MEGAPIXELS`, 50 Mpx),
+  ce qui écarte les « bombes de décompression » (petit fichier, image gigantesque).
+- Un seul décodage, réduit dès le décodeur pour les JPEG (`Image.draft`), produit à la
+  fois l'entrée du modèle (uint8 224×224) et une vignette d'affichage (512 px au plus) :
+  le navigateur ne reçoit plus la photo en pleine résolution.
+- Seuls l'empreinte SHA-256, la vignette et les pixels du modèle sont conservés ; les
+  octets d'origine et l'image décodée sont libérés dès la fin de `ingest`.
+
+Utilisation (pic de mémoire par téléversement simultané, avant/après) :
+    python upload_ingestion.py --concurrency 1 4 8 --resolution 4032x3024
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+from PIL import Image
+
+import image_preprocessing
+import metrics
+from image_preprocessing import IMAGE_SIZE
+
+MAX_UPLOAD_MB = float(os.environ.get('AGRI_SMART_MAX_UPLOAD_MB', 20))
+MAX_MEGAPIXELS = float(os.environ.get('AGRI_SMART_MAX_MEGAPIXELS', 50))
+THUMBNAIL_SIDE = 512
+ALLOWED_FORMATS = ('JPEG', 'PNG')
+
+
+class UploadRejected(ValueError):
+    """Téléversement refusé (trop lourd, trop de pixels, format non pris en charge)"""
+
+
+class IngestedImage:
+    """
+    Ce qu'il reste d'un téléversement après réception
+
+    Attributes:
+        name: Nom du fichier
+        digest: SHA-256 des octets d'origine (clé du cache de prédictions)
+        n_bytes: Taille du fichier d'origine
+        original_size: (largeur, hauteur) d'origine
+        pixels: Entrée du modèle, uint8 (224, 224, 3)
+        thumbnail: Vignette PIL RGB pour l'affichage
+    """
+
+    __slots__ = ('name', 'digest', 'n_bytes', 'original_size', 'pixels', 'thumbnail')
+
+    def __init__(self, name, digest, n_bytes, original_size, pixels, thumbnail):
+        self.name = name
+        self.digest = digest
+        self.n_bytes = n_bytes
+        self.original_size = original_size
+        self.pixels = pixels
+        self.thumbnail = thumbnail
+
+    @property
+    def megapixels(self):
+        return self.original_size[0] * self.original_size[1] / 1e6
+
+
+def read_upload(source, max_mb=MAX_UPLOAD_MB):
+    """
+    Octets d'un téléversement (upload Streamlit, fichier ou chemin), refusés au-delà de `max_mb`
+
+    La taille annoncée (`size` des uploads Streamlit, taille du fichier) est vérifiée avant
+    la lecture.
+    """
+    max_bytes = int(max_mb * 1e6)
+    if isinstance(source, (str, os.PathLike)):
+        declared = os.path.getsize(source)
+    else:
+        declared = getattr(source, 'size', None)
+    if declared is not None and declared > max_bytes:
+        raise UploadRejected(f"Fichier trop volumineux ({declared / 1e6:.1f} Mo > {max_mb:g} Mo)")
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            data = f.read(max_bytes + 1)
+    elif hasattr(source, 'getvalue'):
+        data = source.getvalue()
+    else:
+        data = source.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise UploadRejected(f"Fichier trop volumineux (> {max_mb:g} Mo)")
+    return data
+
+
+def open_checked(data, max_megapixels=MAX_MEGAPIXELS):
+    """
+    Ouvre une image (en-tête seulement) et vérifie son format et son nombre de pixels
+
+    Returns:
+        Image PIL non décodée
+    """
+    try:
+        with warnings.catch_warnings():
+            # PIL's own bomb check only warns below twice its limit: make it an error
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(io.BytesIO(data))
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        raise UploadRejected(f"Image refusée (bombe de décompression) : {e}") from e
+    except Exception as e:
+        raise UploadRejected(f"Fichier illisible comme image : {e}") from e
+    if image.format not in ALLOWED_FORMATS:
+        raise UploadRejected(f"Format non pris en charge : {image.format} (attendu : {', '.join(ALLOWED_FORMATS)})")
+    megapixels = image.width * image.height / 1e6
+    if megapixels > max_megapixels:
+        raise UploadRejected(f"Image trop grande ({image.width}×{image.height}, {megapixels:.0f} Mpx > "
+                             f"{max_megapixels:g} Mpx)")
+    return image
+
+
+def ingest(source, name=None, size=IMAGE_SIZE, thumbnail_side=THUMBNAIL_SIDE, max_mb=MAX_UPLOAD_MB,
+           max_megapixels=MAX_MEGAPIXELS):
+    """
+    Vérifie, décode une fois et réduit un téléversement
+
+    Args:
+        source: Upload Streamlit, fichier ouvert, chemin ou octets
+        name: Nom affiché (par défaut celui de l'upload)
+
+    Returns:
+        IngestedImage
+
+    Raises:
+        UploadRejected: Fichier trop lourd, trop de pixels, format non pris en charge
+    """
+    data = source if isinstance(source, bytes) else read_upload(source, max_mb)
+    if len(data) > max_mb * 1e6:
+        raise UploadRejected(f"Fichier trop volumineux ({len(data) / 1e6:.1f} Mo > {max_mb:g} Mo)")
+    digest = hashlib.sha256(data).hexdigest()
+    image = open_checked(data, max_megapixels)
+    original_size = image.size
+
+    with metrics.timer('image_decode'):
+        if image.format == 'JPEG':
+            # The DCT scale is chosen for the larger of the two outputs (thumbnail)
+            image.draft('RGB', (max(thumbnail_side, size[0]), max(thumbnail_side, size[1])))
+        image.load()
+    if image.mode != 'RGB':
+        with metrics.timer('image_rgb_convert'):
+            image = image.convert('RGB')
+
+    pixels = image_preprocessing.to_uint8(image, size)
+    thumbnail = image.copy()
+    thumbnail.thumbnail((thumbnail_side, thumbnail_side))
+    image.close()
+    return IngestedImage(name or getattr(source, 'name', None), digest, len(data), original_size, pixels, thumbnail)
+
+
+def _measure_ingestion(method, image_dir, concurrency):
+    """
+    `concurrency` téléversements traités en parallèle, chacun gardant ce que la session garde
+
+    'legacy' : octets + image décodée en pleine résolution + image envoyée au navigateur
+    (encodée en pleine résolution, comme `st.image`) ; 'bounded' : `ingest` + vignette encodée.
+    """
+    from inference import open_image, preprocess_image
+
+    paths = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir))[:concurrency]
+    rss_before = image_preprocessing._peak_rss_mb()
+    sessions = [None] * len(paths)
+
+    def handle(i, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if method == 'legacy':
+            image = open_image(io.BytesIO(data))
+            model_input = preprocess_image(image)
+            shown = io.BytesIO()
+            image.save(shown, format='JPEG')
+            sessions[i] = (data, image, model_input, shown.getvalue())
+        else:
+            ingested = ingest(data, name=os.path.basename(path))
+            shown = io.BytesIO()
+            ingested.thumbnail.save(shown, format='JPEG')
+            sessions[i] = (ingested, shown.getvalue())
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=handle, args=(i, path)) for i, path in enumerate(paths)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    increase = image_preprocessing._peak_rss_mb() - rss_before
+    return {
+        'method': method,
+        'concurrency': len(paths),
+        'seconds': round(elapsed, 3),
+        'peak_rss_increase_mb': round(increase, 1),
+        'peak_rss_per_upload_mb': round(increase / len(paths), 1),
+        'shown_kb': round(len(sessions[0][-1]) / 1e3, 1),
+    }
+
+
+def compare_ingestion(concurrency_levels=(1, 4, 8), resolution=(4032, 3024)):
+    """Ancienne réception vs réception bornée, chaque mesure dans un processus neuf"""
+    from benchmark_suite import synthetic_jpeg
+
+    results = []
+    with tempfile.TemporaryDirectory() as image_dir:
+        for i in range(max(concurrency_levels)):
+            with open(os.path.join(image_dir, f'{i:04d}.jpg'), 'wb') as f:
+                f.write(synthetic_jpeg(*resolution, seed=i))
+        for concurrency in concurrency_levels:
+            for method in ('legacy', 'bounded'):
+                output = subprocess.run(
+                    [sys.executable, __file__, '--measure', method, '--image-dir', image_dir,
+                     '--concurrency', str(concurrency)],
+                    capture_output=True, text=True, check=True
+                )
+                results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mémoire de la réception des photos : ancienne vs bornée")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8],
+                        help="Téléversements simultanés")
+    parser.add_argument('--resolution', default='4032x3024', help="Résolution des photos synthétiques (LxH)")
+    # Internal: one method measured in a fresh process
+    parser.add_argument('--measure', choices=['legacy', 'bounded'], help=argparse.SUPPRESS)
+    parser.add_argument('--image-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(_measure_ingestion(args.measure, args.image_dir, args.concurrency[0])))
+        sys.exit(0)
+
+    resolution = tuple(int(v) for v in args.resolution.lower().split('x'))
+    print(f"📤 Photos JPEG {resolution[0]}x{resolution[1]} téléversées simultanément "
+          f"(limites : {MAX_UPLOAD_MB:g} Mo, {MAX_MEGAPIXELS:g} Mpx)")
+    print()
+    print(f"{'Méthode':10s} {'Simultanés':>10s} {'Temps (s)':>10s} {'Pic RSS (Mo)':>13s} "
+          f"{'Mo / upload':>12s} {'Affiché (ko)':>13s}")
+    print("-" * 73)
+    results = compare_ingestion(args.concurrency, resolution)
+    for r in results:
+        print(f"{r['method']:10s} {r['concurrency']:10d} {r['seconds']:10.2f} {r['peak_rss_increase_mb']:13.1f} "
+              f"{r['peak_rss_per_upload_mb']:12.1f} {r['shown_kb']:13.1f}")
+    legacy, bounded = results[-2:]
+    print()
+    print(f"✅ À {legacy['concurrency']} téléversements simultanés : "
+          f"{legacy['peak_rss_per_upload_mb']:.1f} → {bounded['peak_rss_per_upload_mb']:.1f} Mo par téléversement")
@@ -0,0 +1,518 @@
+"""
+Pool de processus d'inférence partagé par toutes les sessions Streamlit
+
+Avec `@st.cache_resource`, chaque processus Streamlit garde un seul modèle et les appels
+`predict` de toutes les sessions se disputent le GIL de ce processus. En mode pool
+(`AGRI_SMART_WORKER_POOL=4`), les modèles vivent dans des processus dédiés, chacun
+épinglé sur ses propres cœurs (`os.sched_setaffinity`). Les sessions envoient leurs
+requêtes par une socket locale (`multiprocessing.connection`, messages picklés).
+
+`PooledDiseaseModel` et `PooledYieldModel` exposent la même méthode `predict` que les
+modèles chargés localement : `inference.predict_disease`, `yield_sweep` et
+`bulk_yield_scoring` les utilisent sans modification.
+
+Utilisation (mesure du passage à l'échelle) :
+    python worker_pool.py --workers 0 1 2 4 --clients 8 --requests 400 --kind yield
+"""
+import argparse
+import itertools
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+# Batches up to this size use the compiled fast path inside the worker (see yield_fast_path)
+FAST_PATH_MAX_ROWS = 100
+# Restarts allowed per worker process before it stays down (a crash loop must not spin forever)
+MAX_RESTARTS = int(os.environ.get('AGRI_SMART_WORKER_MAX_RESTARTS', 5))
+
+
+def _thread_env(cpus):
+    """Variables limitant les threads des bibliothèques natives au nombre de cœurs du processus"""
+    n_threads = str(len(cpus) if cpus else 1)
+    return {var: n_threads for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                                       'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')}
+
+
+class _WorkerState:
+    """Modèles d'un processus de travail, chargés à la première requête"""
+
+    def __init__(self):
+        import inference
+        self.inference = inference
+        self.disease_models = {}
+        self.yield_model = None
+        self.input_cols = None
+        self.yield_fast_model = None
+
+    def disease_model(self, backend):
+        if backend not in self.disease_models:
+            self.disease_models[backend] = self.inference.load_disease_model(backend=backend)
+        return self.disease_models[backend]
+
+    def load_yield(self):
+        if self.yield_model is None:
+            self.yield_model, self.input_cols = self.inference.load_yield_model()
+            try:
+                import yield_fast_path
+                self.yield_fast_model = yield_fast_path.compile_yield_pipeline(self.yield_model, self.input_cols)
+            except Exception:
+                self.yield_fast_model = None
+        return self.yield_model, self.input_cols
+
+    def handle(self, kind, payload):
+        if kind == 'load_disease':
+            self.disease_model(payload)
+            return True
+        if kind == 'disease':
+            backend, batch = payload
+            return self.disease_model(backend).predict(batch, batch_size=len(batch), verbose=0)
+        if kind == 'load_yield':
+            return self.load_yield()[1]
+        if kind == 'yield':
+            model, _ = self.load_yield()
+            if self.yield_fast_model is not None and len(payload) <= FAST_PATH_MAX_ROWS:
+                return self.yield_fast_model.predict(payload)
+            return model.predict(payload)
+        if kind == 'ping':
+            return os.getpid()
+        raise ValueError(f"Type de requête inconnu : {kind}")
+
+
+def serve_worker(address, worker_id, cpus, authkey):
+    """Boucle d'un processus de travail : se connecte au pool et traite ses requêtes"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    state = _WorkerState()
+    with Client(address, authkey=authkey) as conn:
+        conn.send(worker_id)
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            request_id, kind, payload = message
+            try:
+                response = (request_id, True, state.handle(kind, payload))
+            except Exception as e:
+                response = (request_id, False, e)
+            try:
+                conn.send(response)
+            except Exception as e:
+                # Result or exception that cannot be pickled
+                conn.send((request_id, False, RuntimeError(str(e))))
+
+
+def plan_cpu_affinity(n_workers, available=None):
+    """
+    Répartit les cœurs disponibles en tranches contiguës, une par processus
+
+    Returns:
+        Liste de n_workers ensembles de cœurs (partagés si moins de cœurs que de processus)
+    """
+    if available is None:
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    if not available:
+        return [set() for _ in range(n_workers)]
+    if len(available) < n_workers:
+        return [{available[i % len(available)]} for i in range(n_workers)]
+    per_worker = len(available) // n_workers
+    return [set(available[i * per_worker:(i + 1) * per_worker]) for i in range(n_workers)]
+
+
+class WorkerPool:
+    """
+    Pool de processus de travail hébergeant les modèles
+
+    Les processus sont lancés comme scripts indépendants (`python worker_pool.py --serve`)
+    et se connectent à une socket locale authentifiée (`multiprocessing.connection`).
+    Contrairement à `multiprocessing.Process`, rien n'est réimporté depuis le module
+    principal : sous Streamlit, ce serait app.py lui-même.
+
+    Une requête est envoyée au processus qui a le moins de requêtes en cours ; un
+    thread de réception par processus résout les `Future`. Un processus arrêté fait
+    échouer ses requêtes en cours puis est relancé (au plus `MAX_RESTARTS` fois) ;
+    il recharge ses modèles à la première requête.
+    """
+
+    def __init__(self, n_workers=2, pin_cpus=True, startup_timeout=60):
+        self.n_workers = n_workers
+        self.startup_timeout = startup_timeout
+        self.cpu_sets = plan_cpu_affinity(n_workers) if pin_cpus else [set() for _ in range(n_workers)]
+        self._authkey = secrets.token_bytes(32)
+        family = 'AF_UNIX' if hasattr(socket, 'AF_UNIX') else 'AF_INET'
+        self._listener = Listener(family=family, authkey=self._authkey)
+
+        self._lock = threading.Lock()
+        self._send_locks = [threading.Lock() for _ in range(n_workers)]
+        self._ids = itertools.count()
+        self._pending = {}
+        self._in_flight = [0] * n_workers
+        self._completed = [0] * n_workers
+        self._restarts = [0] * n_workers
+        self._alive = [False] * n_workers
+        self._closed = False
+        # Connections accepted by the listener thread, by worker id, until claimed
+        self._arrived = threading.Condition()
+        self._arrivals = {}
+        threading.Thread(target=self._accept_loop, name='worker-pool-accept', daemon=True).start()
+
+        self._processes = [self._spawn(i) for i in range(n_workers)]
+        try:
+            conns = self._wait_for_workers(dict(enumerate(self._processes)), startup_timeout)
+        except RuntimeError:
+            self._stop_listener()
+            raise
+        self._conns = [conns[i] for i in range(n_workers)]
+        for i in range(n_workers):
+            self._alive[i] = True
+            self._start_receiver(i, self._conns[i])
+
+    def _spawn(self, worker_id):
+        cpus = self.cpu_sets[worker_id]
+        env = dict(os.environ, AGRI_SMART_WORKER_AUTHKEY=self._authkey.hex(), **_thread_env(cpus))
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', json.dumps(self._listener.address),
+             '--worker-id', str(worker_id), '--cpus', ','.join(map(str, sorted(cpus)))],
+            env=env
+        )
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+                worker_id = conn.recv()
+            except Exception:
+                # Failed handshake, or listener closed
+                if self._closed:
+                    return
+                continue
+            if worker_id is None:
+                # Wake-up sent by close()
+                conn.close()
+                return
+            with self._arrived:
+                self._arrivals[worker_id] = conn
+                self._arrived.notify_all()
+
+    def _wait_for_workers(self, processes, timeout):
+        """Attend la connexion des processus {worker_id: Popen} ; les tue en cas d'échec"""
+        deadline = time.monotonic() + timeout
+        with self._arrived:
+            while not all(i in self._arrivals for i in processes):
+                if (time.monotonic() > deadline or self._closed
+                        or any(p.poll() is not None for p in processes.values())):
+                    break
+                self._arrived.wait(0.1)
+            conns = {i: self._arrivals.pop(i) for i in processes if i in self._arrivals}
+        if len(conns) < len(processes):
+            for process in processes.values():
+                process.kill()
+                process.wait()
+            for conn in conns.values():
+                conn.close()
+            raise RuntimeError("Les processus d'inférence n'ont pas démarré (processus arrêté ou délai dépassé)")
+        return conns
+
+    def _start_receiver(self, worker_id, conn):
+        threading.Thread(target=self._receive, args=(worker_id, conn), name=f'worker-pool-recv-{worker_id}',
+                         daemon=True).start()
+
+    def _receive(self, worker_id, conn):
+        while True:
+            try:
+                request_id, ok, result = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._pending.pop(request_id, (None, None))[1]
+                if future is not None:
+                    self._in_flight[worker_id] -= 1
+                    self._completed[worker_id] += 1
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+        # Connection lost: the worker exited or crashed
+        self._worker_lost(worker_id, conn)
+        conn.close()
+
+    def _worker_lost(self, worker_id, conn):
+        """
+        Seul point où un processus est déclaré arrêté : échoue ses requêtes en cours,
+        remet son compteur à zéro et le relance en arrière-plan
+
+        Sans effet si `conn` n'est plus la connexion de ce processus (déjà traité).
+        """
+        with self._lock:
+            if self._conns[worker_id] is not conn or not self._alive[worker_id]:
+                return
+            self._alive[worker_id] = False
+            self._in_flight[worker_id] = 0
+            lost = [rid for rid, (wid, _) in self._pending.items() if wid == worker_id]
+            futures = [self._pending.pop(rid)[1] for rid in lost]
+            restart = not self._closed and self._restarts[worker_id] < MAX_RESTARTS
+            process = self._processes[worker_id]
+        for future in futures:
+            future.set_exception(RuntimeError("Processus d'inférence arrêté"))
+        # Unblocks the receiving thread if only the sending side broke
+        process.kill()
+        process.wait()
+        if restart:
+            threading.Thread(target=self._restart, args=(worker_id,), name=f'worker-pool-restart-{worker_id}',
+                             daemon=True).start()
+
+    def _restart(self, worker_id):
+        with self._lock:
+            self._restarts[worker_id] += 1
+        process = self._spawn(worker_id)
+        try:
+            conn = self._wait_for_workers({worker_id: process}, self.startup_timeout)[worker_id]
+        except RuntimeError:
+            # Stays dead: the remaining workers take its requests
+            return
+        with self._lock:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._processes[worker_id] = process
+                self._conns[worker_id] = conn
+                self._alive[worker_id] = True
+        if closed:
+            conn.close()
+            process.kill()
+            process.wait()
+            return
+        self._start_receiver(worker_id, conn)
+
+    def _send(self, worker_id, kind, payload):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Pool fermé")
+            if not self._alive[worker_id]:
+                raise RuntimeError(f"Processus d'inférence {worker_id} arrêté")
+            request_id = next(self._ids)
+            self._pending[request_id] = (worker_id, future)
+            self._in_flight[worker_id] += 1
+            conn = self._conns[worker_id]
+        try:
+            with self._send_locks[worker_id]:
+                conn.send((request_id, kind, payload))
+        except Exception as e:
+            # Never sent (broken pipe, unpicklable payload): undo the bookkeeping, or the
+            # future would never resolve and the worker would look busy to the scheduler
+            with self._lock:
+                entry = self._pending.pop(request_id, None)
+                if entry is not None:
+                    self._in_flight[worker_id] -= 1
+            if entry is not None:
+                future.set_exception(e)
+            if isinstance(e, OSError):
+                self._worker_lost(worker_id, conn)
+        return future
+
+    def submit(self, kind, payload=None):
+        """Envoie une requête au processus le moins chargé et renvoie un `Future`"""
+        with self._lock:
+            alive = [i for i in range(self.n_workers) if self._alive[i]]
+            if not alive:
+                raise RuntimeError("Aucun processus d'inférence actif")
+            worker_id = min(alive, key=lambda i: self._in_flight[i])
+        return self._send(worker_id, kind, payload)
+
+    def broadcast(self, kind, payload=None, timeout=None):
+        """Envoie la même requête à chaque processus et attend toutes les réponses"""
+        futures = [self._send(i, kind, payload) for i in range(self.n_workers)]
+        return [future.result(timeout) for future in futures]
+
+    def disease_model(self, backend='keras'):
+        """Charge le modèle de maladie dans chaque processus et renvoie son mandataire"""
+        self.broadcast('load_disease', backend)
+        return PooledDiseaseModel(self, backend)
+
+    def yield_model(self):
+        """Charge le modèle de rendement dans chaque processus et renvoie (mandataire, colonnes)"""
+        input_cols = self.broadcast('load_yield')[0]
+        return PooledYieldModel(self), input_cols
+
+    def stats(self):
+        """Requêtes en cours et traitées par processus"""
+        with self._lock:
+            return {
+                'workers': self.n_workers,
+                'alive': sum(self._alive),
+                'cpu_sets': [sorted(cpus) for cpus in self.cpu_sets],
+                'in_flight': list(self._in_flight),
+                'completed': list(self._completed),
+                'restarts': list(self._restarts),
+            }
+
+    def _stop_listener(self):
+        self._closed = True
+        try:
+            # The accepting thread is blocked in accept(): wake it with a last connection
+            with Client(self._listener.address, authkey=self._authkey) as conn:
+                conn.send(None)
+        except OSError:
+            pass
+        self._listener.close()
+
+    def close(self, timeout=5):
+        """Arrête les processus de travail"""
+        with self._lock:
+            self._closed = True
+            conns, processes = list(self._conns), list(self._processes)
+        for worker_id, conn in enumerate(conns):
+            try:
+                with self._send_locks[worker_id]:
+                    conn.send(None)
+            except OSError:
+                pass
+        for process in processes:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for conn in conns:
+            conn.close()
+        self._stop_listener()
+
+
+class PooledDiseaseModel:
+    """Modèle de maladie exécuté dans le pool (même `predict` que Keras)"""
+
+    def __init__(self, pool, backend='keras'):
+        self.pool = pool
+        self.backend = backend
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        return self.pool.submit('disease', (self.backend, batch)).result()
+
+
+class PooledYieldModel:
+    """Modèle de rendement exécuté dans le pool (même `predict` que le Pipeline)"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def predict(self, X):
+        return self.pool.submit('yield', X).result()
+
+    def predict_one(self, row):
+        """Prédit une seule ligne donnée sous forme de dict {colonne: valeur}"""
+        import pandas as pd
+        return float(self.predict(pd.DataFrame([row]))[0])
+
+
+class _LocalModel:
+    """Référence sans pool : les modèles dans le processus courant"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.state = _WorkerState()
+
+    def predict(self, payload):
+        return self.state.handle(self.kind, payload if self.kind == 'yield' else ('keras', payload))
+
+
+def _client_payload(kind, input_cols, seed):
+    import numpy as np
+    if kind == 'yield':
+        from benchmark_suite import random_yield_frame
+        return random_yield_frame(1, input_cols, seed)
+    return np.random.default_rng(seed).random((1, 224, 224, 3), dtype=np.float32)
+
+
+def measure_throughput(n_workers, kind='yield', n_clients=8, n_requests=400, pin_cpus=True):
+    """
+    Débit (requêtes/s) de `n_clients` threads concurrents sur un pool de `n_workers`
+
+    Chaque requête est une prédiction unitaire, comme un clic dans une session.
+    `n_workers=0` mesure la référence sans pool : le modèle dans ce processus,
+    partagé par les threads clients (comportement de `@st.cache_resource`).
+    """
+    pool = WorkerPool(n_workers, pin_cpus) if n_workers else None
+    try:
+        if pool is None:
+            model = _LocalModel(kind)
+            input_cols = model.state.load_yield()[1] if kind == 'yield' else None
+        elif kind == 'yield':
+            model, input_cols = pool.yield_model()
+        else:
+            model, input_cols = pool.disease_model(), None
+        payloads = [_client_payload(kind, input_cols, i) for i in range(n_clients)]
+        if pool is None:
+            model.predict(payloads[0])
+        else:
+            # Warm-up: every worker has run one prediction
+            pool.broadcast(kind, payloads[0] if kind == 'yield' else ('keras', payloads[0]))
+
+        counter = itertools.count()
+
+        def client(payload):
+            while next(counter) < n_requests:
+                model.predict(payload)
+
+        threads = [threading.Thread(target=client, args=(p,)) for p in payloads]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return {
+            'workers': n_workers,
+            'requests_per_second': round(n_requests / elapsed, 1),
+            'seconds': round(elapsed, 3),
+            'completed_per_worker': pool.stats()['completed'] if pool else [],
+        }
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Débit du pool de processus d'inférence selon le nombre de processus")
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4],
+                        help="Nombres de processus à mesurer (0 = sans pool, référence)")
+    parser.add_argument('--kind', choices=['yield', 'disease'], default='yield')
+    parser.add_argument('--clients', type=int, default=8, help="Sessions concurrentes simulées (threads)")
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--no-pin', action='store_true', help="Ne pas épingler les processus sur des cœurs")
+    # Internal: worker process started by WorkerPool
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-id', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--cpus', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        address = json.loads(args.serve)
+        serve_worker(tuple(address) if isinstance(address, list) else address, args.worker_id,
+                     {int(c) for c in args.cpus.split(',') if c},
+                     bytes.fromhex(os.environ.pop('AGRI_SMART_WORKER_AUTHKEY')))
+        sys.exit(0)
+
+    print(f"🧵 {args.clients} clients concurrents, {args.requests} requêtes '{args.kind}', "
+          f"{len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()} cœurs disponibles")
+    print()
+    print(f"{'Processus':>9s} {'Requêtes/s':>11s} {'Accélération':>13s}  Répartition")
+    print("-" * 60)
+    baseline = None
+    for n_workers in args.workers:
+        r = measure_throughput(n_workers, args.kind, args.clients, args.requests, not args.no_pin)
+        baseline = baseline or r['requests_per_second']
+        label = str(r['workers']) if r['workers'] else 'sans pool'
+        print(f"{label:>9s} {r['requests_per_second']:11.1f} {r['requests_per_second'] / baseline:12.2f}x  "
+              f"{r['completed_per_worker']}")
@@ -0,0 +1,467 @@
+"""
+Chemin rapide compilé pour le pipeline de rendement (sans pandas ni sklearn à l'inférence)
+
+`compile_yield_pipeline` aplatit le pipeline entraîné par regenerate_model.py
+(ColumnTransformer StandardScaler + OneHotEncoder, puis RandomForestRegressor) en
+tableaux NumPy contigus :
+  - constantes du scaler (moyenne, écart-type) et table des catégories de l'encodeur
+  - tous les arbres concaténés : feature, threshold, enfants gauche/droit, valeur
+
+Les lignes sont évaluées par un parcours vectorisé de tous les arbres à la fois.
+Les résultats sont identiques à `model.predict` (à la précision flottante près).
+
+`contributions` décompose chaque prédiction le long des chemins parcourus (méthode de
+Saabas) : à chaque nœud, l'écart entre la valeur de l'enfant suivi et celle du nœud est
+attribué à la variable testée. Rendement = biais (moyenne des racines) + somme des
+contributions, exactement, sans échantillonnage (KernelSHAP coûterait des secondes) ; les
+colonnes one-hot sont regroupées sur leur colonne d'origine.
+
+`save_compiled` écrit ces tableaux en fichiers .npy non compressés : `load_compiled`
+les ouvre en mémoire mappée, si bien que plusieurs processus partagent une seule
+copie en cache de pages (les arbres sklearn, eux, recopient leurs nœuds au dépickling).
+
+Utilisation (benchmark) :
+    python yield_fast_path.py --batch-sizes 1 100 10000
+    python yield_fast_path.py --contributions   # coût des contributions vs predict
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+_TREE_LEAF = -1
+_ARRAY_NAMES = ('numeric_positions', 'numeric_mean', 'numeric_scale',
+                'feature', 'threshold', 'left', 'right', 'value', 'roots', 'is_leaf')
+_SPEC_FILE = 'compiled_model.json'
+
+
+class CompiledYieldModel:
+    """
+    Pipeline de rendement compilé en tableaux NumPy
+
+    Attributs principaux :
+        input_cols: Colonnes d'entrée d'origine
+        numeric_cols / numeric_positions / numeric_mean / numeric_scale: Constantes du StandardScaler
+        categorical_cols / categories / category_columns: Table de l'encodeur one-hot
+        feature, threshold, left, right, value: Nœuds de tous les arbres concaténés
+        roots: Indice du nœud racine de chaque arbre
+        max_depth: Profondeur maximale (nombre d'itérations du parcours)
+    """
+
+    def __init__(self, input_cols, numeric_cols, numeric_positions, numeric_mean, numeric_scale,
+                 categorical_cols, categories, category_columns, n_features,
+                 feature, threshold, left, right, value, roots, max_depth, is_leaf=None):
+        self.input_cols = list(input_cols)
+        self.numeric_cols = list(numeric_cols)
+        self.numeric_positions = numeric_positions
+        self.numeric_mean = numeric_mean
+        self.numeric_scale = numeric_scale
+        self.categorical_cols = list(categorical_cols)
+        # {column: {category: output feature index or None if dropped}}
+        self.categories = categories
+        self.category_columns = category_columns
+        self.n_features = n_features
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.is_leaf = left == np.arange(len(left)) if is_leaf is None else is_leaf
+        self._column_map = None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def column_map(self):
+        """Matrice (n_features, n_colonnes d'entrée) : colonne d'origine de chaque feature transformée"""
+        if self._column_map is None:
+            column_map = np.zeros((self.n_features, len(self.input_cols)))
+            for col, position in zip(self.numeric_cols, self.numeric_positions):
+                column_map[position, self.input_cols.index(col)] = 1.0
+            for col, mapping in self.categories.items():
+                for position in mapping.values():
+                    if position >= 0:
+                        column_map[position, self.input_cols.index(col)] = 1.0
+            self._column_map = column_map
+        return self._column_map
+
+    def transform(self, X):
+        """
+        Applique le préprocesseur compilé
+
+        Args:
+            X: pd.DataFrame, dict {colonne: valeur ou tableau}, ou liste de dicts
+
+        Returns:
+            np.ndarray (n, n_features) float32, comme l'entrée des arbres sklearn
+        """
+        if isinstance(X, list):
+            X = {col: [row.get(col, 0) for row in X] for col in self.input_cols}
+        elif isinstance(X, dict):
+            X = {col: np.atleast_1d(X.get(col, 0)) for col in self.input_cols}
+
+        n_rows = len(X[self.input_cols[0]])
+        out = np.zeros((n_rows, self.n_features), dtype=np.float64)
+
+        numeric = np.column_stack([np.asarray(X[col], dtype=np.float64) for col in self.numeric_cols])
+        out[:, self.numeric_positions] = (numeric - self.numeric_mean) / self.numeric_scale
+
+        rows = np.arange(n_rows)
+        for col in self.categorical_cols:
+            mapping = self.categories[col]
+            try:
+                indices = np.array([mapping[v] for v in np.asarray(X[col]).tolist()], dtype=np.int64)
+            except KeyError as e:
+                raise ValueError(f"Found unknown categories [{e.args[0]!r}] in column {col!r}") from None
+            kept = indices >= 0
+            out[rows[kept], indices[kept]] = 1.0
+
+        # Trees compare float32 features against float64 thresholds, like sklearn
+        return out.astype(np.float32)
+
+    def predict_transformed(self, Xt):
+        """Parcours vectorisé de tous les arbres pour une matrice déjà transformée"""
+        n_rows, n_features = Xt.shape
+        # One walker per (row, tree) pair, in flat arrays; finished walkers are dropped
+        node = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, self.n_trees)
+        flat_X = Xt.ravel()
+        active = np.arange(node.size)
+        for _ in range(self.max_depth):
+            current = node[active]
+            go_left = flat_X[row_offset[active] + self.feature[current]] <= self.threshold[current]
+            current = np.where(go_left, self.left[current], self.right[current])
+            node[active] = current
+            active = active[~self.is_leaf[current]]
+            if not active.size:
+                break
+        return self.value[node].reshape(n_rows, self.n_trees).mean(axis=1)
+
+    def contributions_transformed(self, Xt):
+        """
+        Même parcours que `predict_transformed`, en cumulant les écarts de valeur par feature
+
+        Returns:
+            (prédictions (n,), biais, contributions (n, n_features))
+        """
+        n_rows, n_features = Xt.shape
+        node = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, self.n_trees)
+        flat_X = Xt.ravel()
+        contributions = np.zeros(n_rows * n_features)
+        active = np.arange(node.size)
+        for _ in range(self.max_depth):
+            current = node[active]
+            cells = row_offset[active] + self.feature[current]
+            go_left = flat_X[cells] <= self.threshold[current]
+            child = np.where(go_left, self.left[current], self.right[current])
+            # Each step credits the tested feature with the change in node value
+            contributions += np.bincount(cells, weights=self.value[child] - self.value[current],
+                                         minlength=contributions.size)
+            node[active] = child
+            active = active[~self.is_leaf[child]]
+            if not active.size:
+                break
+        bias = float(self.value[self.roots].mean())
+        predictions = self.value[node].reshape(n_rows, self.n_trees).mean(axis=1)
+        return predictions, bias, contributions.reshape(n_rows, n_features) / self.n_trees
+
+    def contributions(self, X):
+        """
+        Contributions exactes de chaque colonne d'entrée à la prédiction
+
+        Args:
+            X: Mêmes formats que `transform`
+
+        Returns:
+            (prédictions (n,), biais, contributions (n, len(input_cols))) avec
+            prédiction = biais + somme des contributions de la ligne
+        """
+        predictions, bias, contributions = self.contributions_transformed(self.transform(X))
+        return predictions, bias, contributions @ self.column_map
+
+    def predict(self, X):
+        """Prédit le rendement (kg/ha), même interface que `Pipeline.predict`"""
+        return self.predict_transformed(self.transform(X))
+
+    def predict_one(self, row):
+        """Prédit une seule ligne donnée sous forme de dict {colonne: valeur}"""
+        return float(self.predict([row])[0])
+
+
+def _compile_preprocessor(preprocessor):
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    numeric_cols, numeric_positions, means, scales = [], [], [], []
+    categorical_cols, categories, category_columns = [], {}, []
+    for name, transformer, cols in preprocessor.transformers_:
+        if isinstance(transformer, str):
+            if transformer != 'drop':
+                raise ValueError(f"Transformeur '{name}' non pris en charge : {transformer}")
+            continue
+        cols = list(cols)
+        # Output columns of this transformer in the ColumnTransformer's result
+        position = preprocessor.output_indices_[name].start
+        if isinstance(transformer, StandardScaler):
+            numeric_cols.extend(cols)
+            numeric_positions.extend(range(position, position + len(cols)))
+            means.extend(transformer.mean_ if transformer.mean_ is not None else np.zeros(len(cols)))
+            scales.extend(transformer.scale_ if transformer.scale_ is not None else np.ones(len(cols)))
+        elif isinstance(transformer, OneHotEncoder):
+            if transformer.handle_unknown != 'error':
+                raise ValueError("Seul handle_unknown='error' est pris en charge")
+            for j, col in enumerate(cols):
+                drop_idx = None if transformer.drop_idx_ is None else transformer.drop_idx_[j]
+                mapping = {}
+                for k, value in enumerate(transformer.categories_[j]):
+                    if drop_idx is not None and k == drop_idx:
+                        mapping[value] = -1
+                    else:
+                        mapping[value] = position
+                        category_columns.append(f"{col}_{value}")
+                        position += 1
+                categorical_cols.append(col)
+                categories[col] = mapping
+        else:
+            raise ValueError(f"Transformeur non pris en charge : {type(transformer).__name__}")
+
+    n_features = max(s.stop for s in preprocessor.output_indices_.values())
+    return (numeric_cols, np.asarray(numeric_positions, dtype=np.int64),
+            np.asarray(means, dtype=np.float64), np.asarray(scales, dtype=np.float64),
+            categorical_cols, categories, category_columns, n_features)
+
+
+def _compile_forest(forest):
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        is_leaf = tree.children_left == _TREE_LEAF
+        own_index = np.arange(n_nodes) + offset
+
+        # Leaves point to themselves: a walker that reached one stays there
+        lefts.append(np.where(is_leaf, own_index, tree.children_left + offset))
+        rights.append(np.where(is_leaf, own_index, tree.children_right + offset))
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        values.append(tree.value[:, 0, 0])
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n_nodes
+
+    return (np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+            np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            np.ascontiguousarray(np.concatenate(lefts), dtype=np.int32),
+            np.ascontiguousarray(np.concatenate(rights), dtype=np.int32),
+            np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            np.asarray(roots, dtype=np.int32), max_depth)
+
+
+def compile_yield_pipeline(pipeline, input_cols):
+    """
+    Compile un Pipeline (ColumnTransformer + RandomForestRegressor) en CompiledYieldModel
+
+    Raises:
+        ValueError: si le pipeline contient des étapes non prises en charge
+    """
+    if isinstance(pipeline, CompiledYieldModel):
+        return pipeline
+    preprocessor = pipeline.named_steps.get('preprocessor')
+    regressor = pipeline.named_steps.get('regressor')
+    if preprocessor is None or regressor is None or not hasattr(regressor, 'estimators_'):
+        raise ValueError("Pipeline attendu : ('preprocessor', ColumnTransformer), ('regressor', forêt)")
+    return CompiledYieldModel(input_cols, *_compile_preprocessor(preprocessor), *_compile_forest(regressor))
+
+
+def _to_json(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def save_compiled(compiled, directory, source_digest=None):
+    """
+    Écrit un modèle compilé en tableaux .npy non compressés (ouvrables en mmap)
+
+    Le dossier est remplacé atomiquement : un lecteur concurrent voit l'ancien
+    ou le nouveau modèle, jamais un mélange.
+
+    Args:
+        source_digest: SHA-256 du pickle compilé, relu par `matches_source`
+    """
+    directory = os.path.abspath(directory)
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.compiled-')
+    for name in _ARRAY_NAMES:
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(getattr(compiled, name)))
+    spec = {
+        'input_cols': compiled.input_cols,
+        'numeric_cols': compiled.numeric_cols,
+        'categorical_cols': compiled.categorical_cols,
+        # Pairs rather than a dict so that non-string categories keep their type
+        'categories': {col: [[_to_json(v), int(i)] for v, i in mapping.items()]
+                       for col, mapping in compiled.categories.items()},
+        'category_columns': compiled.category_columns,
+        'n_features': int(compiled.n_features),
+        'max_depth': int(compiled.max_depth),
+        'source_sha256': source_digest,
+    }
+    with open(os.path.join(tmp_dir, _SPEC_FILE), 'w', encoding='utf-8') as f:
+        json.dump(spec, f, indent=2, ensure_ascii=False)
+
+    if os.path.exists(directory):
+        old_dir = tempfile.mkdtemp(dir=parent, prefix='.compiled-old-')
+        os.replace(directory, os.path.join(old_dir, 'model'))
+        os.replace(tmp_dir, directory)
+        shutil.rmtree(old_dir)
+    else:
+        os.replace(tmp_dir, directory)
+    return directory
+
+
+def matches_source(directory, model_path):
+    """
+    Vrai si l'artefact a été compilé depuis le pickle `model_path` tel qu'il est sur disque
+
+    Un artefact sans empreinte (écrit avant son enregistrement) est considéré comme périmé.
+    """
+    import artifact_manifest
+
+    try:
+        with open(os.path.join(directory, _SPEC_FILE), 'r', encoding='utf-8') as f:
+            source_digest = json.load(f).get('source_sha256')
+    except FileNotFoundError:
+        return False
+    models_dir = os.path.dirname(os.path.abspath(model_path))
+    return source_digest is not None and source_digest == artifact_manifest.artifact_digest(model_path, models_dir)
+
+
+def load_compiled(directory, mmap_mode='r'):
+    """
+    Charge un modèle écrit par `save_compiled`
+
+    Args:
+        directory: Dossier du modèle compilé
+        mmap_mode: 'r' pour partager les pages entre processus, None pour tout copier en mémoire
+    """
+    with open(os.path.join(directory, _SPEC_FILE), 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+              for name in _ARRAY_NAMES}
+    categories = {col: {value: index for value, index in pairs} for col, pairs in spec['categories'].items()}
+    return CompiledYieldModel(
+        spec['input_cols'], spec['numeric_cols'], arrays['numeric_positions'],
+        arrays['numeric_mean'], arrays['numeric_scale'], spec['categorical_cols'], categories,
+        spec['category_columns'], spec['n_features'], arrays['feature'], arrays['threshold'],
+        arrays['left'], arrays['right'], arrays['value'], arrays['roots'], spec['max_depth'],
+        is_leaf=arrays['is_leaf']
+    )
+
+
+def _time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def benchmark(pipeline, compiled, input_cols, batch_sizes=(1, 100, 10_000), repeat=20, seed=0):
+    """Compare la latence sklearn et compilée, et vérifie l'égalité des prédictions"""
+    from benchmark_suite import random_yield_frame
+
+    zones = tuple(compiled.categories.get('AEZONE', ('Forest/Transitional',)))
+    results = []
+    for n in batch_sizes:
+        data = random_yield_frame(n, input_cols, seed, zones)
+        expected = pipeline.predict(data)
+        max_abs_diff = float(np.max(np.abs(compiled.predict(data) - expected)))
+        runs = repeat if n <= 1000 else max(3, repeat // 5)
+
+        sklearn_s = _time_call(lambda: pipeline.predict(data), runs)
+        compiled_s = _time_call(lambda: compiled.predict(data), runs)
+        if n == 1:
+            record = data.iloc[0].to_dict()
+            compiled_s = min(compiled_s, _time_call(lambda: compiled.predict_one(record), runs))
+
+        results.append({
+            'batch_size': n,
+            'sklearn_ms': sklearn_s * 1000,
+            'compiled_ms': compiled_s * 1000,
+            'speedup': sklearn_s / compiled_s,
+            'max_abs_diff': max_abs_diff,
+        })
+    return results
+
+
+def benchmark_contributions(pipeline, compiled, input_cols, batch_sizes=(1, 100, 10_000), repeat=20, seed=0):
+    """
+    Coût des contributions par rapport à `predict` (compilé et sklearn)
+
+    Vérifie aussi que biais + somme des contributions redonne la prédiction sklearn.
+    """
+    from benchmark_suite import random_yield_frame
+
+    zones = tuple(compiled.categories.get('AEZONE', ('Forest/Transitional',)))
+    results = []
+    for n in batch_sizes:
+        data = random_yield_frame(n, input_cols, seed, zones)
+        _, bias, contributions = compiled.contributions(data)
+        max_abs_diff = float(np.max(np.abs(bias + contributions.sum(axis=1) - pipeline.predict(data))))
+        runs = repeat if n <= 1000 else max(3, repeat // 5)
+
+        sklearn_s = _time_call(lambda: pipeline.predict(data), runs)
+        compiled_s = _time_call(lambda: compiled.predict(data), runs)
+        contributions_s = _time_call(lambda: compiled.contributions(data), runs)
+        results.append({
+            'batch_size': n,
+            'sklearn_predict_ms': sklearn_s * 1000,
+            'compiled_predict_ms': compiled_s * 1000,
+            'contributions_ms': contributions_s * 1000,
+            'vs_compiled': contributions_s / compiled_s,
+            'vs_sklearn': contributions_s / sklearn_s,
+            'max_abs_diff': max_abs_diff,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    import inference
+
+    parser = argparse.ArgumentParser(description="Benchmark du chemin rapide compilé du modèle de rendement")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 10_000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--contributions', action='store_true',
+                        help="Mesurer les contributions par variable au lieu de la prédiction")
+    args = parser.parse_args()
+
+    pipeline, input_cols = inference.load_yield_model()
+    start = time.perf_counter()
+    compiled = compile_yield_pipeline(pipeline, input_cols)
+    print(f"✅ Pipeline compilé en {(time.perf_counter() - start) * 1000:.1f} ms "
+          f"({compiled.n_trees} arbres, {len(compiled.value):,} nœuds, profondeur max {compiled.max_depth})")
+    print()
+    if args.contributions:
+        print(f"{'Lignes':>8s} {'sklearn (ms)':>13s} {'compilé (ms)':>13s} {'contrib. (ms)':>14s} "
+              f"{'/ compilé':>10s} {'/ sklearn':>10s} {'Écart max':>11s}")
+        print("-" * 85)
+        for r in benchmark_contributions(pipeline, compiled, input_cols, args.batch_sizes, args.repeat):
+            print(f"{r['batch_size']:8d} {r['sklearn_predict_ms']:13.3f} {r['compiled_predict_ms']:13.3f} "
+                  f"{r['contributions_ms']:14.3f} {r['vs_compiled']:9.1f}x {r['vs_sklearn']:9.2f}x "
+                  f"{r['max_abs_diff']:11.2e}")
+    else:
+        print(f"{'Lignes':>8s} {'sklearn (ms)':>13s} {'compilé (ms)':>13s} {'Accélération':>13s} {'Écart max':>11s}")
+        print("-" * 62)
+        for r in benchmark(pipeline, compiled, input_cols, args.batch_sizes, args.repeat):
+            print(f"{r['batch_size']:8d} {r['sklearn_ms']:13.3f} {r['compiled_ms']:13.3f} "
+                  f"{r['speedup']:12.1f}x {r['max_abs_diff']:11.2e}")
@@ -0,0 +1,198 @@
+"""
+Régresseurs de rendement alternatifs et sélection automatique
+
+À côté de la grande forêt issue de la recherche d'hyperparamètres, le chemin
+d'entraînement ajuste des familles plus rapides :
+  - `hist_gradient_boosting` : HistGradientBoostingRegressor (arrêt anticipé)
+  - `shallow_forest` : forêt à profondeur limitée et feuilles minimales
+  - `distilled_forest` : petite forêt entraînée sur les prédictions hors échantillon de la
+    grande forêt (out-of-bag, ou validation croisée à défaut)
+
+Chaque candidat est évalué sur un jeu de validation mis de côté : R², RMSE, taille du
+pickle, temps de chargement et latence p50/p99 d'une prédiction unitaire par le chemin
+réellement servi (forêt compilée `yield_fast_path` si possible, sinon `predict` sklearn).
+
+Règle de choix : parmi les candidats dont le R² est à moins de `R2_TOLERANCE` du
+meilleur, le plus faible p99 l'emporte (puis la plus petite taille). Le rapport est
+écrit dans `models/yield_selection_report.json`.
+"""
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+
+import inference
+
+CANDIDATES = ['forest', 'hist_gradient_boosting', 'shallow_forest', 'distilled_forest']
+R2_TOLERANCE = 0.01
+LATENCY_RUNS = 300
+LOAD_RUNS = 3
+REPORT_PATH = 'models/yield_selection_report.json'
+CANDIDATE_REGRESSORS = {
+    'hist_gradient_boosting': lambda n_jobs: HistGradientBoostingRegressor(
+        max_iter=300, learning_rate=0.1, max_leaf_nodes=31, early_stopping=True, random_state=42),
+    'shallow_forest': lambda n_jobs: RandomForestRegressor(
+        n_estimators=50, max_depth=10, min_samples_leaf=20, max_samples=0.5, n_jobs=n_jobs, random_state=42),
+    'distilled_forest': lambda n_jobs: RandomForestRegressor(
+        n_estimators=20, max_depth=12, min_samples_leaf=5, n_jobs=n_jobs, random_state=42),
+}
+
+
+def teacher_targets(forest, X_train, y_train, cv=5, n_jobs=-1):
+    """
+    Cibles du candidat distillé : prédictions de la grande forêt sur des lignes qu'elle n'a pas vues
+
+    Sur ses propres lignes d'entraînement, une forêt d'arbres complets reproduit presque les
+    étiquettes : l'élève n'apprendrait rien de plus lisse. On prend les prédictions out-of-bag
+    si la forêt a été entraînée avec `oob_score=True`, sinon une validation croisée.
+    """
+    from sklearn.base import clone
+    from sklearn.model_selection import cross_val_predict
+
+    oob = getattr(forest.named_steps['regressor'], 'oob_prediction_', None)
+    if oob is not None:
+        oob = np.asarray(oob).reshape(len(X_train), -1)[:, 0]
+        # Rows drawn in every bootstrap sample have no out-of-bag prediction (NaN)
+        if np.all(np.isfinite(oob)):
+            return oob
+    return cross_val_predict(clone(forest), X_train, y_train, cv=cv, n_jobs=n_jobs)
+
+
+def fit_candidates(forest, X_train, y_train, names=CANDIDATES, n_jobs=-1):
+    """
+    Ajuste les candidats alternatifs sur le même préprocesseur que la grande forêt
+
+    Args:
+        forest: Pipeline de la grande forêt, déjà entraîné (candidat 'forest')
+        names: Candidats à ajuster
+
+    Returns:
+        dict {nom: (pipeline entraîné, secondes d'entraînement)}
+    """
+    from sklearn.base import clone
+
+    fitted = {}
+    if 'forest' in names:
+        fitted['forest'] = (forest, None)
+    distill_targets = None
+    for name in names:
+        if name == 'forest':
+            continue
+        if name not in CANDIDATE_REGRESSORS:
+            raise ValueError(f"Candidat inconnu : {name} (attendu : {', '.join(CANDIDATES)})")
+        pipeline = clone(forest).set_params(regressor=CANDIDATE_REGRESSORS[name](n_jobs))
+        targets = y_train
+        if name == 'distilled_forest':
+            # The student learns the big forest's out-of-sample function, not the noisy labels
+            if distill_targets is None:
+                distill_targets = teacher_targets(forest, X_train, y_train, n_jobs=n_jobs)
+            targets = distill_targets
+        start = time.perf_counter()
+        pipeline.fit(X_train, targets)
+        if isinstance(pipeline.named_steps['regressor'], RandomForestRegressor):
+            pipeline.set_params(regressor__n_jobs=None)
+        fitted[name] = (pipeline, time.perf_counter() - start)
+    return fitted
+
+
+def serving_predictor(model, input_cols):
+    """
+    Fonction de prédiction unitaire telle que l'application la servira
+
+    Returns:
+        (fonction dict → float, 'fast_path' ou 'sklearn')
+    """
+    from yield_fast_path import compile_yield_pipeline
+
+    try:
+        compiled = compile_yield_pipeline(model, input_cols)
+        return compiled.predict_one, 'fast_path'
+    except ValueError:
+        return lambda row: float(inference.predict_yield(model, input_cols, row)[0]), 'sklearn'
+
+
+def evaluate_candidate(model, input_cols, X_test, y_test, runs=LATENCY_RUNS):
+    """
+    Précision, taille, chargement et latence unitaire d'un candidat
+
+    Returns:
+        dict des mesures
+    """
+    predictions = model.predict(X_test)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.pkl')
+        joblib.dump(model, path, compress=0)
+        size = os.path.getsize(path)
+        load_times = []
+        for _ in range(LOAD_RUNS):
+            start = time.perf_counter()
+            joblib.load(path)
+            load_times.append(time.perf_counter() - start)
+
+    predict_one, serving = serving_predictor(model, input_cols)
+    rows = X_test.head(min(runs, len(X_test))).to_dict('records')
+    predict_one(rows[0])
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        predict_one(rows[i % len(rows)])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'r2': round(float(r2_score(y_test, predictions)), 4),
+        'rmse': round(float(np.sqrt(mean_squared_error(y_test, predictions))), 2),
+        'artifact_mb': round(size / 1e6, 2),
+        'load_ms': round(1000 * float(np.median(load_times)), 1),
+        'serving': serving,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def choose_candidate(results, tolerance=R2_TOLERANCE):
+    """Le plus faible p99 parmi les candidats à moins de `tolerance` du meilleur R²"""
+    best_r2 = max(r['r2'] for r in results.values())
+    eligible = [name for name, r in results.items() if r['r2'] >= best_r2 - tolerance]
+    return min(eligible, key=lambda name: (results[name]['p99_ms'], results[name]['artifact_mb']))
+
+
+def select_yield_model(forest, input_cols, X_train, y_train, X_test, y_test, names=CANDIDATES, n_jobs=-1,
+                       tolerance=R2_TOLERANCE, report_path=REPORT_PATH):
+    """
+    Ajuste, évalue et choisit le régresseur de rendement, puis écrit le rapport
+
+    Returns:
+        (pipeline retenu, rapport de sélection)
+    """
+    fitted = fit_candidates(forest, X_train, y_train, names, n_jobs)
+    results = {}
+    for name, (model, fit_seconds) in fitted.items():
+        results[name] = evaluate_candidate(model, input_cols, X_test, y_test)
+        results[name]['fit_seconds'] = round(fit_seconds, 2) if fit_seconds is not None else None
+    selected = choose_candidate(results, tolerance)
+
+    report = {
+        'selected': selected,
+        'rule': f"p99 minimal parmi les R² >= meilleur R² - {tolerance}",
+        'holdout_rows': len(X_test),
+        'candidates': results,
+    }
+    print(f"\n{'Candidat':24s} {'R²':>7s} {'RMSE':>8s} {'Taille (Mo)':>12s} {'Charg. (ms)':>12s} "
+          f"{'p50 (ms)':>9s} {'p99 (ms)':>9s}")
+    print("-" * 87)
+    for name, r in results.items():
+        marker = ' ✅' if name == selected else ''
+        print(f"{name:24s} {r['r2']:7.3f} {r['rmse']:8.1f} {r['artifact_mb']:12.2f} {r['load_ms']:12.1f} "
+              f"{r['p50_ms']:9.3f} {r['p99_ms']:9.3f}{marker}")
+
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Rapport de sélection : {report_path} (retenu : {selected})")
+    return fitted[selected][0], report
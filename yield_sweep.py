@@ -0,0 +1,67 @@
+"""
+Balayage vectorisé de scénarios de rendement
+
+Construit la grille cartésienne des valeurs à explorer (ex. PL_HT × DY_SK × RUST ×
+BLIGHT × AEZONE) et la prédit en appels `predict` vectorisés, par blocs pour borner
+la mémoire, au lieu d'un envoi de formulaire par scénario.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def grid_size(ranges):
+    """Nombre de scénarios de la grille cartésienne"""
+    return int(np.prod([len(values) for values in ranges.values()], dtype=np.int64))
+
+
+def iter_scenario_chunks(input_cols, ranges, base_values=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Génère la grille cartésienne par blocs de `chunk_size` lignes
+
+    Args:
+        input_cols: Colonnes d'entrée du modèle
+        ranges: {colonne: liste de valeurs à balayer}
+        base_values: {colonne: valeur fixe} pour les colonnes non balayées (0 sinon)
+        chunk_size: Nombre maximum de lignes par bloc
+
+    Yields:
+        pd.DataFrame avec exactement `input_cols`
+    """
+    base_values = base_values or {}
+    swept = list(ranges)
+    values = [np.asarray(ranges[col]) for col in swept]
+    shape = tuple(len(v) for v in values)
+    total = grid_size(ranges)
+
+    for start in range(0, total, chunk_size):
+        flat_index = np.arange(start, min(start + chunk_size, total))
+        # Row i of the grid is the multi-index unravel_index(i, shape)
+        indices = np.unravel_index(flat_index, shape)
+        columns = {}
+        for col in input_cols:
+            if col in ranges:
+                axis = swept.index(col)
+                columns[col] = values[axis][indices[axis]]
+            else:
+                columns[col] = np.full(len(flat_index), base_values.get(col, 0))
+        yield pd.DataFrame(columns, columns=input_cols)
+
+
+def sweep_predict(model, input_cols, ranges, base_values=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Prédit le rendement de tous les scénarios de la grille
+
+    Returns:
+        (pd.DataFrame des colonnes balayées + 'Rendement', durée en secondes)
+    """
+    start = time.perf_counter()
+    results = []
+    for chunk in iter_scenario_chunks(input_cols, ranges, base_values, chunk_size):
+        predictions = model.predict(chunk)
+        results.append(chunk[list(ranges)].assign(Rendement=predictions))
+    elapsed = time.perf_counter() - start
+    return pd.concat(results, ignore_index=True), elapsed